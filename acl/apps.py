@@ -1,10 +1,19 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 from django.db.utils import OperationalError, ProgrammingError
 
 
 class AclConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'acl'
+
+    def ready(self):
+        import acl.signals  # Register signals
+        from .privilege import check_shared_cache
+        check_shared_cache()
+        from .auth import sync_privileges_after_migrate
+        post_migrate.connect(sync_privileges_after_migrate, sender=self,
+                             dispatch_uid="acl_sync_privileges_after_migrate")
     #
     # def ready(self):
     #     self.create_permissions()  # Separate method for permissions
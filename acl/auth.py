@@ -1,31 +1,85 @@
-from django.db import OperationalError, ProgrammingError
-from .models import MasterPrivilege
+import hashlib
+import logging
+
+from django.db import DEFAULT_DB_ALIAS, OperationalError, ProgrammingError, transaction
+from django.utils.module_loading import autodiscover_modules
+from case_management.pagination import bump_table_version
+from .classes import PermissionNamespace
+from .models import MasterPrivilege, PrivilegeRegistry
+from .privilege import invalidate_privilege_cache
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
+logger = logging.getLogger(name="CMS")
+
+REGISTRY_NAME = "master_privilege"
+UPSERT_FIELDS = ["namespace", "privilege_desc", "module_id", "is_active", "updated_on"]
+
+
+def registered_permissions():
+    """
+    Every Permission declared in the permissions module of an installed app, the last declaration of a name wins
+    """
+    autodiscover_modules("permissions")
+    permissions = {}
+    for namespace in PermissionNamespace.get_all_namespaces():
+        for permission in namespace.permissions:
+            permissions[permission.privilege_name] = permission
+    return list(permissions.values())
+
+
+def registry_digest(permission_list):
+    digest = hashlib.sha256()
+    for permission in sorted(permission_list, key=lambda item: item.privilege_name):
+        digest.update("\x1f".join((permission.namespace.name, permission.privilege_name,
+                                   str(permission.privilege_desc), str(permission.module_id))).encode("utf-8"))
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+def create_permission(permission_list, using=DEFAULT_DB_ALIAS):
+    """
+    Insert or update the given permissions in MasterPrivilege with one upsert statement per batch
+    """
+    MasterPrivilege.objects.using(using).bulk_create(
+        [MasterPrivilege(namespace=permission.namespace.name, privilege_desc=permission.privilege_desc,
+                         privilege_name=permission.privilege_name, module_id=permission.module_id, is_active=True)
+         for permission in permission_list],
+        batch_size=500, update_conflicts=True, unique_fields=["privilege_name"], update_fields=UPSERT_FIELDS)
+
+
+def sync_privilege_registry(force=False, using=DEFAULT_DB_ALIAS):
+    """
+    Make MasterPrivilege match the registered permission namespaces.
+    Nothing is written when the namespaces hash to the stored digest, otherwise every permission is upserted
+    and privileges no longer declared in code are deactivated.
+    Returns True when the table was written.
+    """
+    permission_list = registered_permissions()
+    digest = registry_digest(permission_list)
+    try:
+        if not force and PrivilegeRegistry.objects.using(using).filter(name=REGISTRY_NAME, digest=digest).exists():
+            return False
+        with transaction.atomic(using=using):
+            create_permission(permission_list, using)
+            deactivated = MasterPrivilege.objects.using(using).filter(is_active=True).exclude(
+                privilege_name__in=[permission.privilege_name for permission in permission_list]
+            ).update(is_active=False)
+            PrivilegeRegistry.objects.using(using).update_or_create(
+                name=REGISTRY_NAME, defaults={"digest": digest, "privilege_count": len(permission_list)})
+    except (OperationalError, ProgrammingError):
+        """
+        This error is expected when trying to initialize the
+        stored permissions during the initial creation of the
+        database. Can be safely ignore under that situation.
+        """
+        return False
+    invalidate_privilege_cache()
+    # the upsert and the deactivation send no signals
+    bump_table_version(MasterPrivilege)
+    logger.info("Privilege registry synced: %s privileges, %s deactivated", len(permission_list), deactivated)
+    return True
 
 
-def create_permission(permission_list):
-    for permission in permission_list:
-        try:
-            data = MasterPrivilege.objects.filter(
-                privilege_name=permission.privilege_name,
-
-            )
-            if data.exists():
-                data.update(namespace=permission.namespace.name, privilege_desc=permission.privilege_desc,module_id=permission.module_id)
-
-            else:
-                MasterPrivilege.objects.create(
-                    namespace=permission.namespace.name,
-                    privilege_desc=permission.privilege_desc,
-                    privilege_name=permission.privilege_name,
-                    module_id=permission.module_id
-                )
-        except (OperationalError, ProgrammingError):
-            """
-            This error is expected when trying to initialize the
-            stored permissions during the initial creation of the
-            database. Can be safely ignore under that situation.
-            """
-            break
+def sync_privileges_after_migrate(sender, using=DEFAULT_DB_ALIAS, plan=None, **kwargs):
+    sync_privilege_registry(using=using)
@@ -1,14 +1,21 @@
 import io
+import tempfile
 from datetime import datetime
 import xlsxwriter
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse
+from django.http import HttpResponse, FileResponse
 import logging
 
+from user_management.directory import user_directory
+
 User = get_user_model()
 
 logger = logging.getLogger(name="CMS")
 
+# rows serialized and written per batch by the streaming export
+EXPORT_CHUNK_SIZE = getattr(settings, "EXPORT_CHUNK_SIZE", 2000)
+
 MODULES = {"ROLE_MANAGEMENT": {"Role Name": {"value": "role_name"},
                                "Role Description": {"value": "role_description"},
                                "Created On(UTC)": {"value": "created_on"},
@@ -23,57 +30,177 @@ MODULES = {"ROLE_MANAGEMENT": {"Role Name": {"value": "role_name"},
                                 "Created By": {"value": "created_by"}, "Modified On(UTC)": {"value": "modified_on"},
                                 "Modified By": {"value": "modified_by"}},
 
+           "USER_MANAGEMENT": {"Email": {"value": "email"}, "First Name": {"value": "first_name"},
+                               "Last Name": {"value": "last_name"}, "Phone Number": {"value": "phone_number"},
+                               "Organisation Name": {"value": "organisation_name"}, "Country": {"value": "country"},
+                               "Timezone": {"value": "timezone"}, "Active": {"value": "is_active"},
+                               "Last Login": {"value": "last_login"},
+                               "Created On(UTC)": {"value": "created_on"},
+                               "Created By": {"value": "created_by"}, "Modified On(UTC)": {"value": "modified_on"},
+                               "Modified By": {"value": "modified_by"}},
+
+           "FILE_TYPE": {"File Type": {"value": "file_type"}, "File Extension": {"value": "file_extension"},
+                         "Max File Size": {"value": "max_file_size"},
+                         "File Description": {"value": "file_description"}, "Status": {"value": "status"},
+                         "Created On(UTC)": {"value": "created_on"},
+                         "Created By": {"value": "created_by"}, "Modified On(UTC)": {"value": "modified_on"},
+                         "Modified By": {"value": "modified_by"}},
+
+           "CLIENT": {"Code": {"value": "code"}, "Name": {"value": "name"}, "Contact Name": {"value": "contact_name"},
+                      "Contact Email": {"value": "contact_email"}, "Contact Number": {"value": "contact_number"},
+                      "Status": {"value": "status"}, "Created On(UTC)": {"value": "created_on"},
+                      "Created By": {"value": "created_by"}, "Modified On(UTC)": {"value": "modified_on"},
+                      "Modified By": {"value": "modified_by"}},
+
+           "CUSTOMER": {"Client": {"value": "client_id"}, "Code": {"value": "code"}, "Name": {"value": "name"},
+                        "Contact Name": {"value": "contact_name"}, "Contact Email": {"value": "contact_email"},
+                        "Contact Number": {"value": "contact_number"}, "Status": {"value": "status"},
+                        "Retention Period": {"value": "retention_period"},
+                        "Disposal Action": {"value": "disposal_action"},
+                        "Disposal Notification Period": {"value": "disposal_notification_period"},
+                        "Created On(UTC)": {"value": "created_on"},
+                        "Created By": {"value": "created_by"}, "Modified On(UTC)": {"value": "modified_on"},
+                        "Modified By": {"value": "modified_by"}},
+
+           "BUSINESS_UNIT": {"Client": {"value": "client_id"}, "Code": {"value": "code"}, "Name": {"value": "name"},
+                             "Contact Name": {"value": "contact_name"}, "Contact Email": {"value": "contact_email"},
+                             "Contact Number": {"value": "contact_number"}, "Status": {"value": "status"},
+                             "Created On(UTC)": {"value": "created_on"},
+                             "Created By": {"value": "created_by"}, "Modified On(UTC)": {"value": "modified_on"},
+                             "Modified By": {"value": "modified_by"}},
+
+           "VENDOR": {"Customer": {"value": "customer_id"}, "Code": {"value": "code"}, "Name": {"value": "name"},
+                      "Contact Name": {"value": "contact_name"}, "Contact Email": {"value": "contact_email"},
+                      "Contact Number": {"value": "contact_number"}, "Status": {"value": "status"},
+                      "Retention Period": {"value": "retention_period"},
+                      "Disposal Action": {"value": "disposal_action"},
+                      "Disposal Notification Period": {"value": "disposal_notification_period"},
+                      "Created On(UTC)": {"value": "created_on"},
+                      "Created By": {"value": "created_by"}, "Modified On(UTC)": {"value": "modified_on"},
+                      "Modified By": {"value": "modified_by"}},
+
            }
 
 
-def return_user_info():
-    queryset = User.objects.values('id', 'first_name', 'last_name')
-    user_dict = {user['id']: f"{user['first_name']} {user['last_name']}".strip() for user in queryset}
-    return user_dict
+def return_user_info(user_ids=None):
+    """
+    Map user ids to display names from the in-process user directory, every user when user_ids is None
+    """
+    return user_directory.names_for(user_ids)
 
 
-def export_query_to_excel(data, module_name):
-    now_str = datetime.now().strftime('%Y%m%d%H%M%S')
-    file_name = f"EXPORT_{module_name}_{now_str}.xlsx"
-    headers = MODULES.get(module_name)
-    output = io.BytesIO()
-    workbook = xlsxwriter.Workbook(output)
-    worksheet = workbook.add_worksheet("Export_Report")
+def _format_value(field, value, user_info_dict):
+    if field in ["modified_on", "created_on"] and value:
+        try:
+            # Attempt to parse the datetime string as the first format
+            try:
+                parsed_datetime = datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%fZ')
+            except:
+                parsed_datetime = datetime.strptime(value, '%Y-%m-%dT%H:%M:%SZ')
+            value = parsed_datetime.strftime('%Y-%m-%d %H:%M:%S')
+        except:
+            value = str(value)
+    elif field in ["modified_by", "created_by"] and isinstance(value, int):
+        value = user_info_dict.get(value, value)
+    return value
+
 
+def _write_header(workbook, worksheet, headers):
     # Write header row with field names
     header_format = workbook.add_format({'bold': True})
     for col, field in enumerate(headers.keys()):
         worksheet.write(0, col, field, header_format)
-    user_info_dict = return_user_info()
-    # Write data rows
-    for row, item in enumerate(data, start=1):
-        for col, header in enumerate(headers.keys()):
-            header_value = headers.get(header)
-            field = header_value.get("value")
-            value = item.get(field)
-
-            if field in ["modified_on", "created_on"] and value:
-                try:
-                    # Attempt to parse the datetime string as the first format
-                    try:
-                        parsed_datetime = datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%fZ')
-                    except:
-                        parsed_datetime = datetime.strptime(value, '%Y-%m-%dT%H:%M:%SZ')
-                    value = parsed_datetime.strftime('%Y-%m-%d %H:%M:%S')
-                except:
-                    value = str(value)
-            elif field in ["modified_by", "created_by"] and isinstance(value, int):
-                value = user_info_dict.get(value, value)
-
-            worksheet.write(row, col, value)
+
+
+def _write_rows(worksheet, headers, data, start_row):
+    # resolve only the users referenced by the exported rows, in one query
+    user_info_dict = return_user_info({item.get(field) for item in data for field in ("created_by", "modified_by")})
+    fields = [header_value.get("value") for header_value in headers.values()]
+    for row, item in enumerate(data, start=start_row):
+        for col, field in enumerate(fields):
+            worksheet.write(row, col, _format_value(field, item.get(field), user_info_dict))
+    return start_row + len(data)
+
+
+def _excel_response(response, file_name):
+    response['Content-Disposition'] = f'attachment; filename="{file_name}"'
+    response['Access-Control-Allow-Origin'] = '*'
+    response["Access-Control-Expose-Headers"] = "*"
+    return response
+
+
+def export_file_name(module_name):
+    now_str = datetime.now().strftime('%Y%m%d%H%M%S')
+    return f"EXPORT_{module_name}_{now_str}.xlsx"
+
+
+def export_query_to_excel(data, module_name):
+    file_name = export_file_name(module_name)
+    headers = MODULES.get(module_name)
+    output = io.BytesIO()
+    workbook = xlsxwriter.Workbook(output)
+    worksheet = workbook.add_worksheet("Export_Report")
+    _write_header(workbook, worksheet, headers)
+    _write_rows(worksheet, headers, data, start_row=1)
     # Close workbook and get output as bytes
     workbook.close()
     excel_data = output.getvalue()
 
     # Create a response with Excel content type and attachment
-    response = HttpResponse(excel_data, content_type='application/vnd.ms-excel')
-    response['Content-Disposition'] = f'attachment; filename="{file_name}"'
-    response['Access-Control-Allow-Origin'] = '*'
-    response["Access-Control-Expose-Headers"] = "*"
+    return _excel_response(HttpResponse(excel_data, content_type='application/vnd.ms-excel'), file_name)
 
-    return response
+
+def iterate_in_chunks(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield lists of at most chunk_size objects, rows are streamed from a server side cursor
+    so only one chunk is held in memory at a time
+    """
+    chunk = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def write_queryset_to_excel(output, queryset, serializer_class, module_name, serializer_kwargs=None,
+                            chunk_size=EXPORT_CHUNK_SIZE, progress=None):
+    """
+    Serialize the queryset chunk by chunk into output (a path or a binary file object).
+    The workbook is written in xlsxwriter constant_memory mode, every row is flushed to disk once written,
+    so peak memory is bounded by chunk_size and not by the number of exported rows.
+    progress, when given, is called with the number of rows written so far after every chunk.
+    Returns the number of exported rows.
+    """
+    headers = MODULES.get(module_name)
+    serializer_kwargs = serializer_kwargs or {}
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+    worksheet = workbook.add_worksheet("Export_Report")
+    _write_header(workbook, worksheet, headers)
+    next_row = 1
+    for chunk in iterate_in_chunks(queryset, chunk_size):
+        data = serializer_class(chunk, many=True, **serializer_kwargs).data
+        next_row = _write_rows(worksheet, headers, data, start_row=next_row)
+        if progress:
+            progress(next_row - 1)
+    workbook.close()
+    return next_row - 1
+
+
+def stream_queryset_to_excel(queryset, serializer_class, module_name, serializer_kwargs=None,
+                             chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Bounded memory replacement for export_query_to_excel, the workbook is built in an anonymous temp file
+    which is streamed back in blocks and removed once the response is closed
+    """
+    file_name = export_file_name(module_name)
+    output = tempfile.TemporaryFile(suffix=".xlsx")
+    try:
+        write_queryset_to_excel(output, queryset, serializer_class, module_name, serializer_kwargs, chunk_size)
+        output.seek(0)
+    except Exception:
+        output.close()
+        raise
+    return _excel_response(FileResponse(output, content_type='application/vnd.ms-excel'), file_name)
@@ -0,0 +1,146 @@
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.http import FileResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .export_excel import export_file_name, stream_queryset_to_excel, write_queryset_to_excel
+from .models import ExportJob
+
+logger = logging.getLogger(name="CMS")
+
+# worker threads rendering export jobs, 0 renders the job inline in the request (handy for tests and debugging)
+EXPORT_JOB_WORKERS = getattr(settings, "EXPORT_JOB_WORKERS", 2)
+# directory holding the finished artifacts
+EXPORT_JOB_DIR = getattr(settings, "EXPORT_JOB_DIR", os.path.join(tempfile.gettempdir(), "case_management_exports"))
+# hours a finished artifact stays downloadable
+EXPORT_JOB_RETENTION_HOURS = getattr(settings, "EXPORT_JOB_RETENTION_HOURS", 24)
+# hours after which a job still PENDING or RUNNING is taken as lost with a restarted worker and purged
+EXPORT_JOB_STALE_HOURS = getattr(settings, "EXPORT_JOB_STALE_HOURS", 24)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=EXPORT_JOB_WORKERS, thread_name_prefix="export-job")
+        return _executor
+
+
+def job_file_path(job_id):
+    return os.path.join(EXPORT_JOB_DIR, f"{job_id}.xlsx")
+
+
+def remove_file(file_path):
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+
+def run_export_job(job_id, queryset, serializer_class, serializer_kwargs=None):
+    """
+    Render the export of job_id into EXPORT_JOB_DIR, progress is saved after every chunk
+    """
+    file_path = job_file_path(job_id)
+    try:
+        ExportJob.objects.filter(id=job_id).update(status=ExportJob.RUNNING, total_rows=queryset.count())
+        job = ExportJob.objects.get(id=job_id)
+        os.makedirs(EXPORT_JOB_DIR, exist_ok=True)
+
+        def progress(rows):
+            ExportJob.objects.filter(id=job_id).update(processed_rows=rows)
+
+        rows = write_queryset_to_excel(file_path, queryset, serializer_class, job.module_name, serializer_kwargs,
+                                       progress=progress)
+        now = timezone.now()
+        ExportJob.objects.filter(id=job_id).update(status=ExportJob.COMPLETED, processed_rows=rows,
+                                                   file_path=file_path, completed_on=now,
+                                                   expires_on=now + timedelta(hours=EXPORT_JOB_RETENTION_HOURS))
+    except Exception as ee:
+        logger.exception("Export job %s failed", job_id)
+        remove_file(file_path)
+        now = timezone.now()
+        ExportJob.objects.filter(id=job_id).update(status=ExportJob.FAILED, error=str(ee), completed_on=now,
+                                                   expires_on=now + timedelta(hours=EXPORT_JOB_RETENTION_HOURS))
+
+
+def _run_in_worker(*args):
+    close_old_connections()
+    try:
+        run_export_job(*args)
+    finally:
+        # pool threads outlive the job, don't leave their connection open
+        connection.close()
+
+
+def enqueue_export(queryset, serializer_class, module_name, user=None, serializer_kwargs=None):
+    """
+    Create an export job and hand it to the worker pool, returns the job without waiting for the file
+    """
+    purge_expired_exports()
+    job = ExportJob.objects.create(module_name=module_name, file_name=export_file_name(module_name),
+                                   created_by=getattr(user, "id", None))
+    if EXPORT_JOB_WORKERS:
+        args = (job.id, queryset, serializer_class, serializer_kwargs)
+        transaction.on_commit(lambda: get_executor().submit(_run_in_worker, *args))
+    else:
+        run_export_job(job.id, queryset, serializer_class, serializer_kwargs)
+        job.refresh_from_db()
+    return job
+
+
+def purge_expired_exports(now=None):
+    """
+    Apply the retention policy: delete the artifacts and rows of jobs past expires_on, and of jobs left
+    PENDING or RUNNING for EXPORT_JOB_STALE_HOURS, whose partial file has no file_path yet
+    """
+    now = now or timezone.now()
+    stale = Q(status__in=[ExportJob.PENDING, ExportJob.RUNNING],
+              created_on__lte=now - timedelta(hours=EXPORT_JOB_STALE_HOURS))
+    expired = ExportJob.objects.filter(Q(expires_on__lte=now) | stale)
+    for job_id, file_path in expired.values_list("id", "file_path"):
+        remove_file(file_path or job_file_path(job_id))
+    return expired.delete()[0]
+
+
+def get_user_export_job(user, job_id):
+    """
+    Return the export job if the user started it, superusers can see every job
+    """
+    queryset = ExportJob.objects.filter(id=job_id)
+    if not user.is_superuser:
+        queryset = queryset.filter(created_by=user.id)
+    return queryset.first()
+
+
+def export_file_response(job):
+    response = FileResponse(open(job.file_path, "rb"), content_type='application/vnd.ms-excel')
+    response['Content-Disposition'] = f'attachment; filename="{job.file_name}"'
+    response['Access-Control-Allow-Origin'] = '*'
+    response["Access-Control-Expose-Headers"] = "*"
+    return response
+
+
+def export_response(request, queryset, serializer_class, module_name, serializer_kwargs=None):
+    """
+    Response of an export=True filter request.
+    With async_export the file is rendered by the worker pool and the job id is returned,
+    otherwise the workbook is streamed back directly.
+    """
+    if request.data.get("async_export"):
+        job = enqueue_export(queryset, serializer_class, module_name, request.user, serializer_kwargs)
+        return Response({"job_id": job.id, "status": job.status}, status=status.HTTP_202_ACCEPTED)
+    return stream_queryset_to_excel(queryset, serializer_class, module_name, serializer_kwargs)
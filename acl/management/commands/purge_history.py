@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from acl.retention import RETENTION_BATCH_SIZE, RETENTION_THROTTLE, purge_expired_history
+
+
+class Command(BaseCommand):
+    help = "Archive and delete email and activity history past the AppConfiguration retention days, " \
+           "and soft-deleted rows past SOFT_DELETE_RETENTION_DAYS"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=RETENTION_BATCH_SIZE,
+                            help="Rows archived and deleted per statement")
+        parser.add_argument("--throttle", type=float, default=RETENTION_THROTTLE,
+                            help="Pause after every batch as a multiple of the batch time")
+        parser.add_argument("--no-archive", action="store_true", help="Delete without writing an archive")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        counts = purge_expired_history(batch_size=options["batch_size"], throttle=options["throttle"],
+                                       archive=not options["no_archive"])
+        for name, purged in counts.items():
+            self.stdout.write(f"{name}: purged {purged} rows")
+        self.stdout.write(f"Retention run took {time.monotonic() - started:.2f}s")
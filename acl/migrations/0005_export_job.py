@@ -0,0 +1,35 @@
+# Generated by Django 4.1.8 on 2026-10-18 17:33
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acl', '0004_alter_appconfiguration_created_by'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('module_name', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('total_rows', models.PositiveIntegerField(null=True)),
+                ('processed_rows', models.PositiveIntegerField(default=0)),
+                ('file_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('file_path', models.CharField(blank=True, max_length=1000, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_by', models.PositiveIntegerField(null=True)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('completed_on', models.DateTimeField(null=True)),
+                ('expires_on', models.DateTimeField(db_index=True, null=True)),
+            ],
+            options={
+                'db_table': 'EXPORT_JOB',
+                'ordering': ['-created_on'],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.1.8 on 2026-10-18 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acl', '0005_export_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrivilegeRegistry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('digest', models.CharField(max_length=64)),
+                ('privilege_count', models.PositiveIntegerField(default=0)),
+                ('synced_on', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'PRIVILEGE_REGISTRY',
+            },
+        ),
+    ]
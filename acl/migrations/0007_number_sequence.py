@@ -0,0 +1,27 @@
+# Generated by Django 4.1.8 on 2026-10-18 18:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acl', '0006_privilege_registry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('prefix', models.CharField(blank=True, default='', max_length=50)),
+                ('width', models.PositiveSmallIntegerField(default=7)),
+                ('next_value', models.BigIntegerField(default=1)),
+                ('modified_on', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'NUMBER_SEQUENCE',
+            },
+        ),
+    ]
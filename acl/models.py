@@ -124,3 +124,68 @@ class AppConfiguration(models.Model):
 
     class Meta:
         db_table = 'APP_CONFIGURATION'
+
+
+class ExportJob(models.Model):
+    """
+    Excel export rendered in the background, the artifact is kept until expires_on
+    """
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    COMPLETED = "COMPLETED"
+    FAILED = "FAILED"
+    STATUS_CHOICES = ((PENDING, "Pending"), (RUNNING, "Running"), (COMPLETED, "Completed"), (FAILED, "Failed"))
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    module_name = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    total_rows = models.PositiveIntegerField(null=True)
+    processed_rows = models.PositiveIntegerField(default=0)
+    file_name = models.CharField(max_length=255, null=True, blank=True)
+    file_path = models.CharField(max_length=1000, null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    created_by = models.PositiveIntegerField(null=True)
+    created_on = models.DateTimeField(auto_now_add=True)
+    completed_on = models.DateTimeField(null=True)
+    expires_on = models.DateTimeField(null=True, db_index=True)
+
+    objects = models.Manager()
+
+    class Meta:
+        ordering = ['-created_on']
+        db_table = "EXPORT_JOB"
+
+
+class PrivilegeRegistry(models.Model):
+    """
+    Fingerprint of the permission namespaces last written to MasterPrivilege, lets the startup sync skip
+    when the code didn't change
+    """
+    name = models.CharField(max_length=100, unique=True)
+    digest = models.CharField(max_length=64)
+    privilege_count = models.PositiveIntegerField(default=0)
+    synced_on = models.DateTimeField(auto_now=True)
+
+    objects = models.Manager()
+
+    class Meta:
+        db_table = "PRIVILEGE_REGISTRY"
+
+
+class NumberSequence(models.Model):
+    """
+    Counter of a document number series, next_value is the first number not handed out yet
+    """
+    name = models.CharField(max_length=100, unique=True)
+    prefix = models.CharField(max_length=50, blank=True, default="")
+    width = models.PositiveSmallIntegerField(default=7)
+    next_value = models.BigIntegerField(default=1)
+    modified_on = models.DateTimeField(auto_now=True)
+
+    objects = models.Manager()
+
+    class Meta:
+        db_table = "NUMBER_SEQUENCE"
+
+    def format(self, value):
+        return f"{self.prefix}{value:0{self.width}d}"
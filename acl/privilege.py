@@ -1,9 +1,26 @@
+import threading
+
 from rest_framework.permissions import BasePermission
-from django.core.exceptions import PermissionDenied
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, PermissionDenied
+from django.db import connection, transaction
 from django.utils.translation import gettext_lazy as _
 from rest_framework.exceptions import APIException
 from rest_framework.status import HTTP_401_UNAUTHORIZED
-from .models import UserRole, RolePermission
+from .models import RolePermission
+
+PRIVILEGE_VERSION_KEY = "acl_privilege_version"
+PRIVILEGE_CACHE_TIMEOUT = 60 * 60 * 24
+# cache backends holding their entries in the memory of one process
+PROCESS_LOCAL_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+_local_privileges = {}
+_local_version = None
+_local_lock = threading.Lock()
 
 
 class Unauthorized(APIException):
@@ -12,10 +29,84 @@ class Unauthorized(APIException):
     default_code = 'Unauthorized'
 
 
+def get_privilege_version():
+    version = cache.get(PRIVILEGE_VERSION_KEY)
+    if version is None:
+        cache.add(PRIVILEGE_VERSION_KEY, 1, None)
+        version = cache.get(PRIVILEGE_VERSION_KEY, 1)
+    return version
+
+
+def invalidate_privilege_cache():
+    """
+    Drop every compiled privilege set. Called from the UserRole, RolePermission and Role signals and after
+    bulk writes which don't send signals.
+    """
+    global _local_version
+    try:
+        cache.incr(PRIVILEGE_VERSION_KEY)
+    except ValueError:
+        cache.add(PRIVILEGE_VERSION_KEY, 2, None)
+    with _local_lock:
+        _local_privileges.clear()
+        _local_version = None
+
+
+def invalidate_privilege_cache_on_commit():
+    """
+    Invalidate now, so the writing transaction sees its own change, and again once it commits.
+    A request running meanwhile can cache the set read before the commit under the new version,
+    the second bump drops it.
+    """
+    invalidate_privilege_cache()
+    if connection.in_atomic_block:
+        transaction.on_commit(invalidate_privilege_cache)
+
+
+def check_shared_cache():
+    """
+    Refuse to start on a per-process cache. A version kept there only reaches the process that bumped it:
+    every other worker would keep granting revoked privileges, accepting the token claims of changed users and
+    showing stale user directory names, and every worker would count failed logins on its own.
+    """
+    backend = settings.CACHES["default"]["BACKEND"]
+    if backend in PROCESS_LOCAL_CACHES and not getattr(settings, "ALLOW_LOCAL_CACHE", False):
+        raise ImproperlyConfigured(f"The default cache ({backend}) is not shared between processes. "
+                                   f"Set CACHE_URL, or ALLOW_LOCAL_CACHE for a single-process server.")
+
+
+def get_user_privileges(user_id):
+    """
+    Return the frozenset of privilege names granted to a user through its roles.
+    Resolved with one query, then served from process memory backed by the django cache until a role changes.
+    """
+    global _local_version
+    version = get_privilege_version()
+    with _local_lock:
+        if _local_version != version:
+            _local_privileges.clear()
+            _local_version = version
+        privileges = _local_privileges.get(user_id)
+    if privileges is not None:
+        return privileges
+
+    cache_key = f"acl_privileges_{version}_{user_id}"
+    privileges = cache.get(cache_key)
+    if privileges is None:
+        privileges = frozenset(RolePermission.objects.filter(role__user_role_role__user_id=user_id,
+                                                                 privilege__is_active=True).values_list(
+            "privilege__privilege_name", flat=True))
+        cache.set(cache_key, privileges, PRIVILEGE_CACHE_TIMEOUT)
+    with _local_lock:
+        if _local_version == version:
+            _local_privileges[user_id] = privileges
+    return privileges
+
+
 def check_user_permissions(permissions, user):
+    privileges = get_user_privileges(user.id)
     for permission in permissions:
-        roles = UserRole.objects.filter(user=user).values_list("role", flat=True)
-        if RolePermission.objects.filter(role__in=roles, privilege__privilege_name=permission.privilege_name).exists():
+        if permission.privilege_name in privileges:
             return True
     raise PermissionDenied(_('Insufficient permissions.'))
 
@@ -27,8 +118,7 @@ class CozentusPermission(BasePermission):
         required_permissions = getattr(
             view, 'case_management_object_permissions', {}
         ).get(request.method, None)
-        # TODO modify for role privilege
-        if required_permissions and 0:
+        if required_permissions and not request.user.is_superuser:
             try:
                 check_user_permissions(
                     permissions=required_permissions, user=request.user
@@ -47,9 +137,7 @@ class CozentusPermission(BasePermission):
         required_permissions = getattr(
             view, 'case_management_object_permissions', {}
         ).get(request.method, None)
-        # TODO modify for role privilege
-        # TODO make sure permissions should be checked when live
-        if required_permissions and 0:
+        if required_permissions and not request.user.is_superuser:
             try:
                 check_user_permissions(
                     permissions=required_permissions, user=request.user
@@ -0,0 +1,157 @@
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router, transaction
+from django.db.models import Q
+from django.db.models.deletion import Collector
+from django.utils import timezone
+
+from .models import AppConfiguration
+
+logger = logging.getLogger(name="CMS")
+
+# rows archived and deleted per statement
+RETENTION_BATCH_SIZE = getattr(settings, "RETENTION_BATCH_SIZE", 1000)
+# pause after every batch as a multiple of the time the batch took, gives replicas time to catch up
+RETENTION_THROTTLE = getattr(settings, "RETENTION_THROTTLE", 1.0)
+# directory of the compressed JSONL archives, None deletes without archiving
+RETENTION_ARCHIVE_DIR = getattr(settings, "RETENTION_ARCHIVE_DIR", os.path.join(settings.BASE_DIR, "archive"))
+# days a soft-deleted row is kept after deleted_at, None keeps them forever
+SOFT_DELETE_RETENTION_DAYS = getattr(settings, "SOFT_DELETE_RETENTION_DAYS", None)
+# models whose soft-deleted rows are purged, deleting a row also deletes the rows cascading from it
+RETENTION_SOFT_DELETED_MODELS = getattr(settings, "RETENTION_SOFT_DELETED_MODELS", (
+    "ticket_management.Ticket",
+    "ticket_management.TicketRevision",
+    "ticket_management.TicketFollower",
+    "ticket_management.TicketBehalf",
+))
+# AppConfiguration.application_name holding the history days, None takes the first configuration
+RETENTION_APPLICATION = getattr(settings, "RETENTION_APPLICATION", None)
+
+
+class RetentionPolicy:
+    """
+    Rows of model matching condition whose date_field is older than days are expired
+    """
+
+    def __init__(self, name, model, date_field, days, condition=None):
+        self.name = name
+        self.model = model
+        self.date_field = date_field
+        self.days = days
+        self.condition = condition or Q()
+
+    def expired(self, now):
+        cutoff = now - timedelta(days=self.days)
+        return self.model.objects.filter(self.condition, **{f"{self.date_field}__lt": cutoff})
+
+
+def get_retention_policies():
+    """
+    Policies of the configured history days, a policy without days is left out
+    """
+    queryset = AppConfiguration.objects.order_by("id")
+    if RETENTION_APPLICATION:
+        queryset = queryset.filter(application_name=RETENTION_APPLICATION)
+    email_days, activity_days = queryset.values_list("email_history_days", "activity_history_days").first() or \
+        (None, None)
+    policies = [
+        RetentionPolicy("email_history", apps.get_model("user_management", "EmailOutbox"), "created_on",
+                        email_days, Q(status__in=["SENT", "FAILED"])),
+        RetentionPolicy("activity_history", apps.get_model("ticket_management", "TicketRevision"), "created_at",
+                        activity_days),
+    ]
+    for label in RETENTION_SOFT_DELETED_MODELS:
+        model = apps.get_model(label)
+        condition = Q(deleted_at__isnull=False)
+        if any(field.name == "is_delete" for field in model._meta.fields):
+            condition &= Q(is_delete=True)
+        policies.append(RetentionPolicy(f"soft_deleted:{model._meta.label_lower}", model, "deleted_at",
+                                        SOFT_DELETE_RETENTION_DAYS, condition))
+    return [policy for policy in policies if policy.days]
+
+
+def archive_path(policy, now):
+    name = policy.name.replace(":", "-").replace(".", "-")
+    return os.path.join(RETENTION_ARCHIVE_DIR, f"{name}-{now:%Y%m%d%H%M%S}.jsonl.gz")
+
+
+def write_archive(path, records):
+    """
+    Append (model label, row) records as one gzip member of JSON lines, the file stays readable if a later batch
+    never comes
+    """
+    with gzip.open(path, "at", encoding="utf-8") as archive:
+        for label, row in records:
+            archive.write(json.dumps({"model": label, "fields": row}, cls=DjangoJSONEncoder))
+            archive.write("\n")
+
+
+def collected_records(collector):
+    """
+    (model label, row) of every row the collector is going to delete, the batch itself and what cascades from it
+    """
+    for model, instances in collector.data.items():
+        fields = [field.attname for field in model._meta.concrete_fields]
+        for instance in instances:
+            yield model._meta.label_lower, {name: getattr(instance, name) for name in fields}
+    for queryset in collector.fast_deletes:
+        for row in queryset.values():
+            yield queryset.model._meta.label_lower, row
+
+
+def purge_policy(policy, now=None, batch_size=RETENTION_BATCH_SIZE, throttle=RETENTION_THROTTLE, archive=True):
+    """
+    Archive and delete the expired rows of policy in primary key order, batch by batch, together with the rows
+    cascading from them. Every batch is a bounded pk range read and one short delete transaction, returns how many
+    rows of policy.model were purged.
+    """
+    now = now or timezone.now()
+    expired = policy.expired(now).order_by("pk")
+    path = None
+    if archive and RETENTION_ARCHIVE_DIR:
+        os.makedirs(RETENTION_ARCHIVE_DIR, exist_ok=True)
+        path = archive_path(policy, now)
+    pk_name = policy.model._meta.pk.attname
+    using = router.db_for_write(policy.model)
+    purged = 0
+    last_pk = None
+    while True:
+        started = time.monotonic()
+        batch = expired if last_pk is None else expired.filter(pk__gt=last_pk)
+        ids = list(batch.values_list(pk_name, flat=True)[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic(using=using):
+            # the rows cascading from the batch are archived along with it
+            collector = Collector(using=using)
+            collector.collect(policy.model.objects.using(using).filter(pk__in=ids))
+            if path:
+                # written before the delete, a rollback archives the batch twice rather than losing it
+                write_archive(path, collected_records(collector))
+            collector.delete()
+        purged += len(ids)
+        last_pk = ids[-1]
+        if len(ids) < batch_size:
+            break
+        if throttle:
+            time.sleep((time.monotonic() - started) * throttle)
+    if purged:
+        logger.info("Purged %s rows of %s%s", purged, policy.name, f" into {path}" if path else "")
+    return purged
+
+
+def purge_expired_history(now=None, batch_size=RETENTION_BATCH_SIZE, throttle=RETENTION_THROTTLE, archive=True):
+    """
+    Run every retention policy, returns the purged row count per policy name
+    """
+    now = now or timezone.now()
+    return {policy.name: purge_policy(policy, now, batch_size, throttle, archive)
+            for policy in get_retention_policies()}
@@ -0,0 +1,103 @@
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from case_management.pagination import bump_table_version
+from .models import Role, UserRole
+from .privilege import invalidate_privilege_cache_on_commit
+
+User = get_user_model()
+
+# rows per bulk_create / delete statement
+ROLE_ASSIGNMENT_BATCH_SIZE = getattr(settings, "ROLE_ASSIGNMENT_BATCH_SIZE", 1000)
+
+ADD = "add"
+REPLACE = "replace"
+REMOVE = "remove"
+ASSIGNMENT_MODES = (ADD, REPLACE, REMOVE)
+
+
+class InvalidAssignment(ValueError):
+    """
+    Raised when an assignment references a user or role that doesn't exist
+    """
+
+
+def _role_uuid(role_id):
+    try:
+        return role_id if isinstance(role_id, uuid.UUID) else uuid.UUID(str(role_id))
+    except ValueError:
+        raise InvalidAssignment("Please provide valid user data or role data")
+
+
+def _chunks(values, size):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def assign_roles(assignments, mode=ADD, created_by=None, batch_size=ROLE_ASSIGNMENT_BATCH_SIZE):
+    """
+    Apply (user_id, role_id) pairs grouped per role.
+    add: give every user its role, replace: the users listed for a role become its only users,
+    remove: take the role away from the listed users.
+    Users and roles are validated with one query each, current memberships are read with one query
+    and only the difference is written in chunked bulk_create/delete statements inside one transaction.
+    Returns (added, removed) counts.
+    """
+    if mode not in ASSIGNMENT_MODES:
+        raise InvalidAssignment(f"mode must be one of {', '.join(ASSIGNMENT_MODES)}")
+    wanted = defaultdict(set)
+    for user_id, role_id in assignments:
+        wanted[_role_uuid(role_id)].add(user_id)
+    if not wanted:
+        return 0, 0
+    return _apply(wanted, mode, created_by, batch_size)
+
+
+def set_role_users(role_id, user_ids, created_by=None, batch_size=ROLE_ASSIGNMENT_BATCH_SIZE):
+    """
+    Make user_ids the exact members of one role, an empty list removes every member
+    """
+    return _apply({_role_uuid(role_id): set(user_ids)}, REPLACE, created_by, batch_size)
+
+
+def _apply(wanted, mode, created_by, batch_size):
+    user_ids = set().union(*wanted.values())
+    if Role.objects.filter(id__in=wanted.keys()).count() != len(wanted):
+        raise InvalidAssignment("Please provide valid user data or role data")
+    if user_ids and User.objects.filter(id__in=user_ids).count() != len(user_ids):
+        raise InvalidAssignment("Please provide valid user data or role data")
+
+    current = defaultdict(dict)
+    memberships = UserRole.objects.filter(role_id__in=wanted.keys()).order_by()
+    if mode != REPLACE:
+        memberships = memberships.filter(user_id__in=user_ids)
+    for role_id, user_id, user_role_id in memberships.values_list("role_id", "user_id", "id"):
+        current[role_id][user_id] = user_role_id
+
+    to_create = []
+    to_delete = []
+    for role_id, users in wanted.items():
+        members = current[role_id]
+        if mode != REMOVE:
+            to_create.extend(UserRole(role_id=role_id, user_id=user_id, created_by=created_by or "")
+                             for user_id in users - members.keys())
+        if mode == REPLACE:
+            to_delete.extend(user_role_id for user_id, user_role_id in members.items() if user_id not in users)
+        elif mode == REMOVE:
+            to_delete.extend(members[user_id] for user_id in users & members.keys())
+
+    with transaction.atomic():
+        for chunk in _chunks(to_delete, batch_size):
+            UserRole.objects.filter(id__in=chunk).delete()
+        if to_create:
+            UserRole.objects.bulk_create(to_create, batch_size=batch_size)
+    if to_create or to_delete:
+        # bulk_create doesn't send post_save
+        invalidate_privilege_cache_on_commit()
+        bump_table_version(UserRole)
+    return len(to_create), len(to_delete)
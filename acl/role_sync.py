@@ -0,0 +1,86 @@
+from django.db import transaction
+
+from case_management.pagination import bump_table_version
+from .models import Role, MasterPrivilege, RolePermission
+from .privilege import invalidate_privilege_cache_on_commit
+
+BULK_BATCH_SIZE = 1000
+
+
+class InvalidPrivilege(ValueError):
+    """
+    Raised when privilege names don't exist in MasterPrivilege
+    """
+
+
+def resolve_privileges(privilege_names):
+    """
+    Map every privilege name to its MasterPrivilege id with one query
+    """
+    names = set(privilege_names)
+    privileges = dict(MasterPrivilege.objects.filter(privilege_name__in=names).values_list("privilege_name", "id"))
+    if len(privileges) != len(names):
+        raise InvalidPrivilege("please provide valid privilege")
+    return privileges
+
+
+def sync_role_privileges(role, privilege_names, created_by=None, privileges=None):
+    """
+    Make the RolePermission rows of role match privilege_names.
+    Only the difference is written: one bulk_create for the added privileges and one delete for the removed ones.
+    privileges, a name to id map from resolve_privileges, can be shared when many roles are synced.
+    Returns (added, removed) counts.
+    """
+    if privileges is None:
+        privileges = resolve_privileges(privilege_names)
+    wanted = {privileges[name] for name in set(privilege_names)}
+    current = dict(RolePermission.objects.filter(role=role).values_list("privilege_id", "id"))
+    added = wanted - current.keys()
+    removed = [current[privilege_id] for privilege_id in current.keys() - wanted]
+    if removed:
+        RolePermission.objects.filter(id__in=removed).delete()
+    if added:
+        RolePermission.objects.bulk_create(
+            [RolePermission(role=role, privilege_id=privilege_id, created_by=created_by) for privilege_id in added],
+            batch_size=BULK_BATCH_SIZE)
+        # bulk_create doesn't send post_save
+        invalidate_privilege_cache_on_commit()
+        bump_table_version(RolePermission)
+    return len(added), len(removed)
+
+
+def clone_role(source_role, role_name, role_description=None, client_id=None, created_by=None):
+    """
+    Create a new role holding the same privileges as source_role
+    """
+    with transaction.atomic():
+        role = Role.objects.create(role_name=role_name, role_description=role_description,
+                                   client_id=client_id or source_role.client_id, created_by=created_by)
+        privilege_ids = RolePermission.objects.filter(role=source_role).values_list("privilege_id", flat=True)
+        RolePermission.objects.bulk_create(
+            [RolePermission(role=role, privilege_id=privilege_id, created_by=created_by)
+             for privilege_id in privilege_ids], batch_size=BULK_BATCH_SIZE)
+    invalidate_privilege_cache_on_commit()
+    bump_table_version(RolePermission)
+    return role
+
+
+def import_roles(rows, created_by=None):
+    """
+    Create or update roles from dicts with role_name, role_description, client_id and privilege_names.
+    The privilege names of every row are resolved together in one query.
+    Returns the imported roles.
+    """
+    rows = list(rows)
+    privileges = resolve_privileges({name for row in rows for name in row.get("privilege_names", [])})
+    existing = Role.objects.in_bulk([row["role_name"] for row in rows], field_name="role_name")
+    roles = []
+    with transaction.atomic():
+        for row in rows:
+            role = existing.get(row["role_name"])
+            if role is None:
+                role = Role.objects.create(role_name=row["role_name"], role_description=row.get("role_description"),
+                                           client_id=row.get("client_id"), created_by=created_by)
+            sync_role_privileges(role, row.get("privilege_names", []), created_by, privileges)
+            roles.append(role)
+    return roles
@@ -0,0 +1,219 @@
+import os
+import re
+import threading
+
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+from .models import AppConfiguration, NumberSequence
+
+# numbers reserved per trip to the counter row in block mode
+SEQUENCE_BLOCK_SIZE = getattr(settings, "SEQUENCE_BLOCK_SIZE", 20)
+# AppConfiguration field holding the first number of every series, e.g. "TKT0001000"
+SEQUENCE_START_FIELDS = {
+    "ticket": "ticket_start_no",
+    "client": "client_start_no",
+    "project": "project_start_no",
+}
+# model and field storing the numbers of a series, the counter starts above the numbers already stored and
+# skips numbers a client supplied
+SEQUENCE_NUMBER_FIELDS = getattr(settings, "SEQUENCE_NUMBER_FIELDS", {
+    "ticket": ("ticket_management.Ticket", "ticket_no"),
+})
+# used when the configuration has no start number
+SEQUENCE_DEFAULT_PREFIXES = getattr(settings, "SEQUENCE_DEFAULT_PREFIXES", {
+    "ticket": "TKT",
+    "client": "CLT",
+    "project": "PRJ",
+})
+
+_blocks = {}
+_lock = threading.Lock()
+
+
+class NumberBlock:
+    """
+    Numbers [next, end) of a series reserved by this process
+    """
+
+    def __init__(self, sequence, start, end):
+        self.sequence = sequence
+        self.next = start
+        self.end = end
+        self.pid = os.getpid()
+
+    def available(self):
+        # a block inherited through a fork is shared with the parent
+        return self.next < self.end and self.pid == os.getpid()
+
+    def take(self):
+        if not self.available():
+            return None
+        value = self.next
+        self.next += 1
+        return self.sequence.format(value)
+
+
+def _number_field(name):
+    source = SEQUENCE_NUMBER_FIELDS.get(name)
+    if source is None:
+        return None, None
+    label, field = source
+    return apps.get_model(label), field
+
+
+def number_max_length(name):
+    """
+    max_length of the column storing the numbers of name, None when the series has no such column
+    """
+    model, field = _number_field(name)
+    return model._meta.get_field(field).max_length if model else None
+
+
+def taken_numbers(name, numbers):
+    """
+    The numbers already stored, e.g. supplied by a client instead of allocated, with one query
+    """
+    model, field = _number_field(name)
+    if model is None or not numbers:
+        return set()
+    return set(model._base_manager.filter(**{f"{field}__in": numbers}).values_list(field, flat=True))
+
+
+def highest_stored_value(name, prefix, width):
+    """
+    Value of the highest stored number of the series prefix + width digits, 0 when there is none
+    """
+    model, field = _number_field(name)
+    if model is None:
+        return 0
+    # equal width makes the text order the numeric order
+    highest = model._base_manager.filter(**{f"{field}__regex": rf"^{re.escape(prefix)}[0-9]{{{width}}}$"}) \
+        .order_by(f"-{field}").values_list(field, flat=True).first()
+    return int(highest[len(prefix):]) if highest else 0
+
+
+def parse_start_no(name, start_no):
+    """
+    Split a configured start number like "TKT0001000" into (prefix, width, first value).
+    Raises ValueError when the numbers don't fit the column storing them.
+    """
+    prefix, digits = re.match(r"^(.*?)(\d*)$", (start_no or "").strip()).groups()
+    if not prefix and not digits:
+        prefix = SEQUENCE_DEFAULT_PREFIXES.get(name, "")
+    width = len(digits) or 7
+    max_length = number_max_length(name)
+    if max_length and len(prefix) + width > max_length:
+        raise ValueError(f"{name} numbers of {prefix!r} and {width} digits are longer than {max_length} characters")
+    return prefix, width, int(digits or 1)
+
+
+def get_sequence(name):
+    """
+    Counter row of name, created from the AppConfiguration start number on first use.
+    The counter starts above the highest number already stored, e.g. from before the sequence existed.
+    """
+    sequence = NumberSequence.objects.filter(name=name).first()
+    if sequence is not None:
+        return sequence
+    field = SEQUENCE_START_FIELDS.get(name)
+    start_no = AppConfiguration.objects.order_by("id").values_list(field, flat=True).first() if field else None
+    prefix, width, next_value = parse_start_no(name, start_no)
+    next_value = max(next_value, highest_stored_value(name, prefix, width) + 1)
+    try:
+        with transaction.atomic():
+            return NumberSequence.objects.create(name=name, prefix=prefix, width=width, next_value=next_value)
+    except IntegrityError:
+        # another request created it first
+        return NumberSequence.objects.get(name=name)
+
+
+def reserve_numbers(name, count):
+    """
+    Move the counter of name by count in one short transaction, returns (sequence, first reserved value)
+    """
+    with transaction.atomic():
+        if not NumberSequence.objects.filter(name=name).update(next_value=F("next_value") + count):
+            get_sequence(name)
+            NumberSequence.objects.filter(name=name).update(next_value=F("next_value") + count)
+        sequence = NumberSequence.objects.get(name=name)
+    return sequence, sequence.next_value - count
+
+
+def _keep_block(name, block):
+    with _lock:
+        current = _blocks.get(name)
+        if current is None or not current.available():
+            _blocks[name] = block
+
+
+def reserve_free_numbers(name, count):
+    """
+    Reserve count numbers and drop the ones already stored, returns the free ones in order
+    """
+    sequence, start = reserve_numbers(name, count)
+    numbers = [sequence.format(value) for value in range(start, start + count)]
+    taken = taken_numbers(name, numbers)
+    return [number for number in numbers if number not in taken]
+
+
+def allocate_numbers(name, count):
+    """
+    count numbers of name with one counter update, e.g. for an import, plus one more per number found taken.
+    Inside a transaction the counter row stays locked until it ends and a rollback returns the numbers.
+    """
+    numbers = []
+    while len(numbers) < count:
+        numbers.extend(reserve_free_numbers(name, count - len(numbers)))
+    return numbers
+
+
+def next_number_gap_free(name):
+    """
+    Next number of name, the counter row stays locked until the caller's transaction ends.
+    A rolled back insert returns its number, so the series has no holes, at the price of serializing writers.
+    The UPDATE takes the row lock up front, the way SELECT ... FOR UPDATE would, and saves a round trip.
+    """
+    return allocate_numbers(name, 1)[0]
+
+
+def _take_from_block(name, block_size):
+    with _lock:
+        block = _blocks.get(name)
+        number = block.take() if block else None
+        if number is not None:
+            return number
+        sequence, start = reserve_numbers(name, block_size)
+        block = NumberBlock(sequence, start, start + block_size)
+        number = block.take()
+        if not connection.in_atomic_block:
+            _blocks[name] = block
+            return number
+    # the reservation commits with the caller's transaction, a rollback would hand the same block out again
+    transaction.on_commit(lambda: _keep_block(name, block))
+    return number
+
+
+def next_number(name, gap_free=False, block_size=SEQUENCE_BLOCK_SIZE):
+    """
+    Next number of the series name, e.g. next_number("ticket") -> "TKT0000042".
+    Block mode hands out numbers from a block reserved by this process and touches the counter row once per
+    block_size numbers; unused numbers of a block are lost when the process stops, leaving gaps.
+    A number a client stored meanwhile is skipped, checked with one indexed read per number.
+    """
+    if gap_free:
+        return next_number_gap_free(name)
+    while True:
+        number = _take_from_block(name, block_size)
+        if not taken_numbers(name, [number]):
+            return number
+
+
+def reset_number_blocks():
+    """
+    Forget the blocks of this process, the rest of every block becomes a gap
+    """
+    with _lock:
+        _blocks.clear()
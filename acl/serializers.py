@@ -4,7 +4,10 @@ from django.utils import timezone
 from django.db import transaction
 
 from master_data_management.models import Client
-from .models import (Role, RolePermission, UserRole, MasterPrivilege, ClientPrivilege, AppConfiguration, )
+from .models import (Role, RolePermission, UserRole, MasterPrivilege, ClientPrivilege, AppConfiguration, ExportJob, )
+from .role_assignment import ADD, ASSIGNMENT_MODES
+from .role_sync import InvalidPrivilege, resolve_privileges, sync_role_privileges
+from .sequences import SEQUENCE_START_FIELDS, parse_start_no
 
 User = get_user_model()
 
@@ -34,12 +37,13 @@ class RoleFilterSerializer(serializers.ModelSerializer):
     page = serializers.IntegerField(required=False, write_only=True, allow_null=True)
     page_size = serializers.IntegerField(required=False, write_only=True, allow_null=True)
     export = serializers.BooleanField(required=False, allow_null=True, default=False)
+    async_export = serializers.BooleanField(required=False, allow_null=True, default=False)
 
     class Meta:
         model = Role
         fields = (
             'role_name', 'role_description', 'client_id', 'include_privilege_data', 'order_by', "export",
-            'order_type', 'page', 'page_size')
+            "async_export", 'order_type', 'page', 'page_size')
 
 
 class RolePermissionFilterSerializer(serializers.ModelSerializer):
@@ -166,15 +170,10 @@ class RoleSerializer(serializers.ModelSerializer):
                                                role_description=validate_data.get("role_description"),
                                                client_id=validate_data.get("client_id"),
                                                created_by=validate_data.get("created_by"))
-                if MasterPrivilege.objects.filter(privilege_name__in=privilege_names).count() != len(
-                        set(privilege_names)):
-                    raise serializers.ValidationError("please provide valid privilege")
-                for privilege_name in privilege_names:
-                    privilege = MasterPrivilege.objects.filter(privilege_name=privilege_name).first()
-                    RolePermission.objects.create(privilege=privilege, role=instance,
-                                                  created_by=validate_data.get("created_by"))
-                instance.save()
+                sync_role_privileges(instance, privilege_names, validate_data.get("created_by"))
                 return instance
+        except InvalidPrivilege as ip:
+            raise serializers.ValidationError(str(ip))
         except serializers.ValidationError as ve:
             raise serializers.ValidationError(ve.detail)
         except Exception as ee:
@@ -189,19 +188,9 @@ class RoleSerializer(serializers.ModelSerializer):
         try:
             privilege_names = validate_data.get('privilege_names', [])
             record = instance
-            if MasterPrivilege.objects.filter(privilege_name__in=privilege_names).count() != len(set(privilege_names)):
-                raise serializers.ValidationError("please provide valid privilege")
-            role_data = RolePermission.objects.filter(role=record).values_list("privilege__privilege_name", flat=True)
+            privileges = resolve_privileges(privilege_names)
             with transaction.atomic():
-                role_data = list(role_data)
-                role_data.sort()
-                privilege_names.sort()
-                if not role_data == privilege_names:
-                    RolePermission.objects.filter(role=record).delete()
-                    for privilege_name in privilege_names:
-                        privilege = MasterPrivilege.objects.filter(privilege_name=privilege_name).first()
-                        RolePermission.objects.create(privilege=privilege, role=instance,
-                                                      created_by=validate_data.get("modified_by"))
+                sync_role_privileges(record, privilege_names, validate_data.get("modified_by"), privileges)
                 record.role_name = validate_data.get('role_name')
                 record.role_description = validate_data.get('role_description')
                 record.client_id = validate_data.get('client_id')
@@ -209,6 +198,8 @@ class RoleSerializer(serializers.ModelSerializer):
                 record.modified_on = timezone.now().astimezone(timezone.timezone.utc)
                 record.save()
                 return record
+        except InvalidPrivilege as ip:
+            raise serializers.ValidationError(str(ip))
         except serializers.ValidationError as ve:
             raise serializers.ValidationError(ve.detail)
         except Exception:
@@ -220,6 +211,20 @@ class RoleMultiUserCreateSerializer(serializers.Serializer):
     user_ids = serializers.ListField(child=serializers.IntegerField(), required=True)
 
 
+class RoleUserAssignmentSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField()
+    role_id = serializers.UUIDField()
+
+
+class RoleUserBulkAssignSerializer(serializers.Serializer):
+    """
+    add gives the roles to the users, replace makes the listed users the only members of each listed role
+    and remove takes the roles away
+    """
+    assignments = RoleUserAssignmentSerializer(many=True, allow_empty=False)
+    mode = serializers.ChoiceField(choices=ASSIGNMENT_MODES, default=ADD)
+
+
 class ClientPrivilegeSerializer(serializers.ModelSerializer):
     """
     This serializer is used for create and update the role
@@ -293,8 +298,28 @@ class AppConfigurationSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Application name must be unique.")
         return value
 
+    def validate(self, attrs):
+        for name, field in SEQUENCE_START_FIELDS.items():
+            if attrs.get(field):
+                try:
+                    parse_start_no(name, attrs[field])
+                except ValueError as ee:
+                    raise serializers.ValidationError({field: str(ee)})
+        return attrs
+
     def create(self, validated_data):
         return super().create(validated_data)
 
     def update(self, instance, validated_data):
         return super().update(instance, validated_data)
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    """
+    This serializer is used for responding the progress of an export job
+    """
+
+    class Meta:
+        model = ExportJob
+        fields = ("id", "module_name", "status", "total_rows", "processed_rows", "file_name", "error", "created_on",
+                  "completed_on", "expires_on")
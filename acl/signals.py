@@ -0,0 +1,23 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Role, UserRole, RolePermission
+from case_management.custom_authentication import bump_user_version
+from .privilege import invalidate_privilege_cache_on_commit
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+@receiver(post_save, sender=RolePermission)
+@receiver(post_delete, sender=RolePermission)
+def role_privilege_changed(sender, **kwargs):
+    invalidate_privilege_cache_on_commit()
+
+
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+def user_role_changed(sender, instance, **kwargs):
+    # the role-version stamp of the user's tokens
+    bump_user_version(instance.user_id)
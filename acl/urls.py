@@ -11,6 +11,8 @@ urlpatterns = [
 
     path('v1/role/user/create', views.RoleUserCreateAPI.as_view(), name='role_user_create'),
     # this is for to assign a role to a list of User.(unit test case written)
+    path('v1/role/user/bulk', views.RoleUserBulkAssignAPI.as_view(), name='role_user_bulk'),
+    # this is to add, replace or remove many (user, role) assignments at once
     path('v1/privilege/list', views.RolePermissionFilterApi.as_view(), name='privilege_list'),
     # this is to list out all the privileges(unit test case written)
 
@@ -29,4 +31,8 @@ urlpatterns = [
     path('v1/configurations/<int:pk>', views.AppConfigurationRetrieveUpdateDestroyAPIView.as_view(),
          name='appconfiguration_detail'),
 
+    # progress of an asynchronous export started with async_export=true on a filter api
+    path('v1/export/job/<uuid:pk>', views.ExportJobApi.as_view(), name='export_job'),
+    path('v1/export/job/<uuid:pk>/download', views.ExportJobDownloadApi.as_view(), name='export_job_download'),
+
 ]
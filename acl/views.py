@@ -1,25 +1,25 @@
 from django.contrib.auth import get_user_model
-from django.db import transaction
 from django.utils import timezone
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status, serializers
 from rest_framework.generics import CreateAPIView, RetrieveUpdateDestroyAPIView, DestroyAPIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .export_excel import export_query_to_excel
+from .export_jobs import export_response, get_user_export_job, export_file_response
 from .permissions import permission_role_list, permission_role_create, permission_role_view, permission_role_edit, \
     permission_role_delete, permission_permission_list, permission_role_user_create, \
     permission_client_permission_create, permission_client_permission_view, permission_client_permission_edit, \
     permission_client_permission_delete, permission_client_permission_list
-from .serializers import (RoleMultiUserCreateSerializer, RoleFilterSerializer, RoleReadSerializer,
-                          RoleReadWithoutPrivilegeSerializer, RoleSerializer, RolePermissionFilterSerializer,
+from .role_assignment import InvalidAssignment, assign_roles, set_role_users
+from .serializers import (RoleMultiUserCreateSerializer, RoleUserBulkAssignSerializer, RoleFilterSerializer,
+                          RoleReadSerializer, RoleReadWithoutPrivilegeSerializer, RoleSerializer,
+                          RolePermissionFilterSerializer,
                           PermissionSerializer, ClientPrivilegeSerializer, ClientPrivilegeReadSerializer,
-                          ClientPrivilegeFilterSerializer, AppConfigurationSerializer, )
-from django.core.paginator import Paginator
-from .models import Role, UserRole, MasterPrivilege, RolePermission, ClientPrivilege, AppConfiguration
+                          ClientPrivilegeFilterSerializer, AppConfigurationSerializer, ExportJobSerializer, )
+from .models import Role, UserRole, MasterPrivilege, RolePermission, ClientPrivilege, AppConfiguration, ExportJob
 from .privilege import CozentusPermission
-from .classes import PermissionNamespace
-from .auth import create_permission
+from case_management.pagination import CountCachingPaginator, approximate_requested
+from .auth import sync_privilege_registry
 import uuid
 from rest_framework import generics
 from drf_spectacular.utils import extend_schema
@@ -76,10 +76,10 @@ class RoleFilterApi(APIView):
             if query_filter:
                 roles = roles.order_by(query_filter)
             if data.get("export"):
-                results = RoleReadSerializer(roles, many=True)
-                return export_query_to_excel(data=results.data, module_name="ROLE_MANAGEMENT")
+                return export_response(request, roles, RoleReadSerializer, module_name="ROLE_MANAGEMENT")
             # Create Paginator object with page_size objects per page
-            paginator = Paginator(roles, page_size)
+            paginator = CountCachingPaginator(roles, page_size,
+                                              approximate=approximate_requested(request.data))
             number_pages = paginator.num_pages
             if page > number_pages and page > 1:
                 return Response({"message": "Page not found"}, status=status.HTTP_400_BAD_REQUEST)
@@ -89,7 +89,7 @@ class RoleFilterApi(APIView):
                 results = RoleReadSerializer(page_obj, many=True)
             else:
                 results = RoleReadWithoutPrivilegeSerializer(page_obj, many=True)
-            return Response({'count': roles.count(), 'results': results.data}, status=status.HTTP_200_OK)
+            return Response({'count': paginator.count, 'results': results.data}, status=status.HTTP_200_OK)
         except serializers.ValidationError as ve:
             raise serializers.ValidationError(ve.detail)
         except Exception as ee:
@@ -183,17 +183,17 @@ class RolePermissionFilterApi(APIView):
                     order_by = f"-{order_by}"
                 queryset.order_by(order_by)
             if request.data.get("export"):
-                results = PermissionSerializer(queryset, many=True)
-                return export_query_to_excel(data=results.data, module_name="ROLE_PERMISSION")
+                return export_response(request, queryset, PermissionSerializer, module_name="ROLE_PERMISSION")
             # Create Paginator object with page_size objects per page
-            paginator = Paginator(queryset, page_size)
+            paginator = CountCachingPaginator(queryset, page_size,
+                                              approximate=approximate_requested(request.data))
             number_pages = paginator.num_pages
             if page > number_pages:
                 return Response({"message": "Page not found"}, status=status.HTTP_400_BAD_REQUEST)
             # Get the page object for the requested page number
             page_obj = paginator.get_page(page)
             serializer = PermissionSerializer(page_obj, many=True)  # RolePermissionSerializer(privileges, many=True)
-            return Response({"count": len(queryset), "results": serializer.data})
+            return Response({"count": paginator.count, "results": serializer.data})
         except serializers.ValidationError as ve:
             raise serializers.ValidationError(ve.detail)
         except Exception as ee:
@@ -221,22 +221,7 @@ class RoleUserCreateAPI(CreateAPIView):
             data = serializer.data
             user_ids = data.get("user_ids", [])
             role_id = data.get("role_id", "")
-            updated_data = []
-            role_object = Role.objects.filter(id=role_id).first()
-            role_user_list = UserRole.objects.filter(role=role_object).values_list("user", flat=True)
-
-            first_set = set(role_user_list)
-            second_set = set(user_ids)
-            remove_user = first_set - second_set
-            add_user = second_set - first_set
-            with transaction.atomic():
-                if remove_user:
-                    UserRole.objects.filter(user__id__in=list(remove_user)).delete()
-                for user_id in list(add_user):
-                    updated_data.append(UserRole(role=role_object,
-                                                 user=User.objects.filter(id=user_id).first()))
-                if updated_data:
-                    UserRole.objects.bulk_create(updated_data)
+            set_role_users(role_id, user_ids, request.user.id)
 
             return Response({"results": data}, status=status.HTTP_201_CREATED)
         except serializers.ValidationError as ve:
@@ -246,6 +231,33 @@ class RoleUserCreateAPI(CreateAPIView):
                             status=status.HTTP_400_BAD_REQUEST)
 
 
+class RoleUserBulkAssignAPI(APIView):
+    """
+    This view class is used to assign many users to many roles in one request
+    """
+    case_management_object_permissions = {
+        'POST': (permission_role_user_create,)
+    }
+    permission_classes = (CozentusPermission,)
+
+    @swagger_auto_schema(request_body=RoleUserBulkAssignSerializer)
+    def post(self, request):
+        """
+        This method applies the (user, role) pairs and returns how many assignments were added and removed
+        """
+        try:
+            serializer = RoleUserBulkAssignSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            data = serializer.validated_data
+            added, removed = assign_roles(((row["user_id"], row["role_id"]) for row in data["assignments"]),
+                                          data["mode"], request.user.id)
+            return Response({"added": added, "removed": removed}, status=status.HTTP_200_OK)
+        except serializers.ValidationError as ve:
+            return Response({"message": ve.detail}, status=status.HTTP_400_BAD_REQUEST)
+        except InvalidAssignment as ia:
+            return Response({"message": str(ia)}, status=status.HTTP_400_BAD_REQUEST)
+
+
 class ClientPrivilegeApi(CreateAPIView):
     """
     Client Privilege Create api view
@@ -333,7 +345,8 @@ class ClientPrivilegeFilterApi(APIView):
             # if data.get("export"):
             #     results = self.serializer_class(queryset, many=True)
             #     return export_query_to_excel(data=results.data, module_name="CLIENT_PRIVILEGE")
-            paginator = Paginator(queryset, page_size)
+            paginator = CountCachingPaginator(queryset, page_size,
+                                              approximate=approximate_requested(request.data))
             number_pages = paginator.num_pages
             if page > number_pages:
                 return Response({"message": "Page not found"}, status=status.HTTP_400_BAD_REQUEST)
@@ -341,7 +354,7 @@ class ClientPrivilegeFilterApi(APIView):
             page_obj = paginator.get_page(page)
             serializer = self.serializer_class(page_obj, many=True)
             data = serializer.data
-            return Response({"count": queryset.count(), "results": data})
+            return Response({"count": paginator.count, "results": data})
         except Exception as ee:
             return Response({"message": "Something went wrong", "error": str(ee)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -350,14 +363,8 @@ class PopulatePermissionsView(APIView):
     permission_classes = [CozentusPermission]
 
     def post(self, request):
-        permission_list = []
-        for namespace in PermissionNamespace.get_all_namespaces():
-            permission_list.extend(namespace.permissions)
-
-        # print(permission_list)
-
         try:
-            create_permission(permission_list)
+            sync_privilege_registry(force=True)
             return Response({"message": "Permissions populated successfully."}, status=status.HTTP_201_CREATED)
         except Exception as e:
             return Response({"message": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -408,3 +415,36 @@ class AppConfigurationRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestro
             modified_by=self.request.user.id,
             modified_on=timezone.now()
         )
+
+
+class ExportJobApi(APIView):
+    """
+    This view class is used to return the progress of an export job
+    """
+    permission_classes = (CozentusPermission,)
+    serializer_class = ExportJobSerializer
+
+    def get(self, request, pk):
+        job = get_user_export_job(request.user, pk)
+        if not job:
+            return Response({"message": "Record not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(self.serializer_class(job).data, status=status.HTTP_200_OK)
+
+
+class ExportJobDownloadApi(APIView):
+    """
+    This view class is used to download the file of a completed export job
+    """
+    permission_classes = (CozentusPermission,)
+
+    def get(self, request, pk):
+        job = get_user_export_job(request.user, pk)
+        if not job or (job.expires_on and job.expires_on <= timezone.now()):
+            return Response({"message": "Record not found."}, status=status.HTTP_404_NOT_FOUND)
+        if job.status != ExportJob.COMPLETED:
+            return Response({"message": f"Export is {job.status.lower()}", "status": job.status},
+                            status=status.HTTP_409_CONFLICT)
+        try:
+            return export_file_response(job)
+        except FileNotFoundError:
+            return Response({"message": "Record not found."}, status=status.HTTP_404_NOT_FOUND)
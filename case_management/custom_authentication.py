@@ -1,14 +1,80 @@
 # dms_project/custom_authentication.py
+import time
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
 
+# token claim holding the user fields request.user is built from
+USER_CLAIM = "user"
+# token claim holding the auth version of the user when the token was issued
+USER_VERSION_CLAIM = "user_version"
+# CustomUser fields copied into the token, saving any of them makes the tokens of the user stale
+USER_CLAIM_FIELDS = ("id", "email", "is_active", "is_superuser", "client_id")
 
-class CustomJWTAuthentication(JWTAuthentication):
-    def authenticate(self, request):
-        x_api_key = request.headers.get('X-API-KEY')
 
-        if x_api_key:
-            print(f"X-API-KEY: {x_api_key}")
-            # You can add additional logic here if needed
-            return None
+def _user_version_key(user_id):
+    return f"auth_user_version_{user_id}"
+
+
+def get_user_version(user_id):
+    version = cache.get(_user_version_key(user_id))
+    if version is None:
+        # seeded from the clock so a lost key never brings back a version that was used before
+        cache.add(_user_version_key(user_id), time.time_ns(), None)
+        version = cache.get(_user_version_key(user_id))
+    return version
+
+
+def _incr_user_version(user_id):
+    try:
+        cache.incr(_user_version_key(user_id))
+    except ValueError:
+        # no token carries a version the cache still knows
+        pass
+
 
-        return super().authenticate(request)
+def bump_user_version(user_id):
+    """
+    Make the tokens issued to user_id so far stale, their requests load the user from the database again.
+    Called from the CustomUser and UserRole signals. Inside a transaction the version moves again once it
+    commits, a request loading the user meanwhile would otherwise rebuild it from the old row under the new
+    version. Every process reads the version from the django cache, so it has to be shared between them.
+    """
+    _incr_user_version(user_id)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _incr_user_version(user_id))
+
+
+class UserClaimsRefreshToken(RefreshToken):
+    """
+    RefreshToken carrying the USER_CLAIM_FIELDS of the user and its auth version, access tokens derived
+    from it copy both
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token[USER_CLAIM] = {field: getattr(user, field) for field in USER_CLAIM_FIELDS}
+        token[USER_VERSION_CLAIM] = get_user_version(user.pk)
+        return token
+
+
+class CustomJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        """
+        Build request.user from the token claims while the user's auth version is the one the token was issued
+        at, costs a cache read instead of a query. Older tokens fall back to loading the user.
+        """
+        claims = validated_token.get(USER_CLAIM)
+        version = validated_token.get(USER_VERSION_CLAIM)
+        if not claims or version is None or cache.get(_user_version_key(claims.get("id"))) != version:
+            return super().get_user(validated_token)
+        if not claims.get("is_active"):
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        # the fields not in the token are deferred, reading one loads it from the database
+        field_names = [field.attname for field in self.user_model._meta.concrete_fields if field.attname in claims]
+        return self.user_model.from_db(DEFAULT_DB_ALIAS, field_names, [claims[name] for name in field_names])
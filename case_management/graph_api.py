@@ -1,102 +1,201 @@
 import base64
+import threading
+import time
+
 from django.contrib.auth import get_user_model
 import msal
 import requests
 from decouple import config
+from requests.adapters import HTTPAdapter
 from rest_framework.utils import json
 
 User = get_user_model()
-# Enter the details of your AAD app registration
-client_id = config("CLIENT_ID")
-client_secret = config("CLIENT_SECRET")
-tenant_id = config("TENANT_ID")
 
-authority = f'https://login.microsoftonline.com/{tenant_id}'
+GRAPH_URL = "https://graph.microsoft.com/v1.0"
 scope = ['https://graph.microsoft.com/.default']
-user_id = config("SEND_EMAIL_USER_ID")
+# Graph accepts at most 20 requests in one $batch call
+GRAPH_BATCH_LIMIT = 20
+# refresh the token this many seconds before Graph would reject it
+TOKEN_EXPIRY_MARGIN = 300
 
-app = msal.ConfidentialClientApplication(
-    client_id=client_id,
-    client_credential=client_secret,
-    authority=authority)
+_app = None
+_app_lock = threading.Lock()
 
 
-def get_graph_api_token():
-    scopes = ["https://graph.microsoft.com/.default"]
-    result = app.acquire_token_silent(scopes, account=None)
+def get_msal_app():
+    # Enter the details of your AAD app registration, built on first use as msal resolves the authority over http
+    global _app
+    with _app_lock:
+        if _app is None:
+            _app = msal.ConfidentialClientApplication(
+                client_id=config("CLIENT_ID"),
+                client_credential=config("CLIENT_SECRET"),
+                authority=f'https://login.microsoftonline.com/{config("TENANT_ID")}')
+        return _app
 
+
+def acquire_graph_api_token():
+    """
+    Return (access token, seconds until it expires) for the app registration
+    """
+    app = get_msal_app()
+    result = app.acquire_token_silent(scope, account=None)
     if not result:
-        result = app.acquire_token_for_client(scopes=scopes)
-    token = result.get('access_token', "")
-    return token
+        result = app.acquire_token_for_client(scopes=scope)
+    return result.get('access_token', ""), int(result.get('expires_in', 0) or 0)
 
 
-def send_email_attachment(to, message_body="", message_subject="", file_data=None, cc=None,
-                          reply_to=None):
-    if reply_to is None:
-        reply_to = []
-    if cc is None:
-        cc = []
-    cc = [user_email for user_email in cc if user_email]
-    if file_data is None:
-        file_data = []
-    headers = {'Authorization': 'Bearer ' + get_graph_api_token(),
-               'Content-Type': 'application/json',
-               }
+def build_message(to, message_body="", message_subject="", file_data=None, cc=None, reply_to=None,
+                  content_type="HTML"):
+    """
+    Build the Graph message resource, to/cc/reply_to are lists of email addresses
+    """
     attachment = []
-    url = f"https://graph.microsoft.com/v1.0/users/{user_id}/sendMail"
-    email_to = [{"emailAddress": {"address": user}} for user in to if user]
-    cc_email = [{"emailAddress": {"address": user}} for user in cc if user]
-    reply_to = [{"emailAddress": {"address": user}} for user in reply_to if user]
-
-    for data in file_data:
+    for data in file_data or []:
         attachment.append({
             "@odata.type": "#microsoft.graph.fileAttachment",
             "name": data.get("file_name", ""),
             "contentType": data.get("content_type", ""),
             "contentBytes": base64.b64encode(data.get("file_bytes", "")).decode('utf-8')
         })
-    body = {
-        "message": {
-            "subject": message_subject,
-            "body": {
-                "contentType": "HTML",
-                "content": message_body
-            },
-            "toRecipients": email_to,
-            "ccRecipients": cc_email,
-            "attachments": attachment,
-            "replyTo": reply_to
-        }
+    return {
+        "subject": message_subject,
+        "body": {
+            "contentType": content_type,
+            "content": message_body
+        },
+        "toRecipients": [{"emailAddress": {"address": user}} for user in to if user],
+        "ccRecipients": [{"emailAddress": {"address": user}} for user in cc or [] if user],
+        "attachments": attachment,
+        "replyTo": [{"emailAddress": {"address": user}} for user in reply_to or [] if user]
     }
-    response = requests.post(url, json=body, headers=headers)
-    status_code = response.status_code
-    return status_code, response.text
 
 
-def send_email_graph_api(subject, body, to):
-    # Graph API endpoint to send email
-    send_mail_url = f'https://graph.microsoft.com/v1.0/users/{user_id}/sendMail'
+class GraphMailClient:
+    """
+    Microsoft Graph sendMail client.
+    Connections are pooled on one requests.Session, the access token is reused until shortly before it expires
+    and send_many packs up to 20 messages into each $batch call.
+    """
 
-    # Headers with authorization and content type
-    headers = {
-        "Authorization": f"Bearer {get_graph_api_token()}",
-        "Content-Type": "application/json"
-    }
-    email_to = [{"emailAddress": {"address": user}} for user in to.split(",") if user]
-    # Email payload
-    email_data = {
-        'message': {
-            'subject': subject,
-            'body': {
-                'contentType': 'html',
-                'content': body
-            },
-            'toRecipients': email_to,
-            'ccRecipients': [],
-        }
-    }
+    def __init__(self, sender=None, token_provider=acquire_graph_api_token, base_url=GRAPH_URL, pool_size=10,
+                 timeout=30, max_retries=3):
+        self.sender = sender or config("SEND_EMAIL_USER_ID")
+        self.token_provider = token_provider
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._token = None
+        self._token_expires_at = 0
+        self._token_lock = threading.Lock()
+
+    def get_token(self):
+        with self._token_lock:
+            if not self._token or time.monotonic() >= self._token_expires_at:
+                token, expires_in = self.token_provider()
+                self._token = token
+                self._token_expires_at = time.monotonic() + max(expires_in - TOKEN_EXPIRY_MARGIN, 0)
+            return self._token
+
+    def invalidate_token(self):
+        with self._token_lock:
+            self._token = None
+
+    def _post(self, path, body):
+        data = json.dumps(body)
+        for retry in (True, False):
+            response = self.session.post(f"{self.base_url}{path}", data=data, timeout=self.timeout,
+                                         headers={"Authorization": f"Bearer {self.get_token()}",
+                                                  "Content-Type": "application/json"})
+            if response.status_code != 401 or not retry:
+                return response
+            # token revoked before its expiry, fetch a new one once
+            self.invalidate_token()
+
+    def send(self, message):
+        """
+        Send one message resource, returns (status code, response text)
+        """
+        response = self._post(f"/users/{self.sender}/sendMail", {"message": message})
+        return response.status_code, response.text
+
+    def send_many(self, messages):
+        """
+        Send every message through $batch, 20 per round trip.
+        Throttled sub requests (429/503) are retried after their Retry-After delay.
+        Returns the status code of every message in input order.
+        """
+        results = [None] * len(messages)
+        pending = list(range(len(messages)))
+        attempt = 0
+        while pending:
+            throttled = []
+            retry_after = 0
+            for start in range(0, len(pending), GRAPH_BATCH_LIMIT):
+                chunk = pending[start:start + GRAPH_BATCH_LIMIT]
+                batch = {"requests": [{
+                    "id": str(index),
+                    "method": "POST",
+                    "url": f"/users/{self.sender}/sendMail",
+                    "headers": {"Content-Type": "application/json"},
+                    "body": {"message": messages[index]}
+                } for index in chunk]}
+                response = self._post("/$batch", batch)
+                if response.status_code != 200:
+                    for index in chunk:
+                        results[index] = response.status_code
+                    continue
+                for item in response.json().get("responses", []):
+                    index = int(item["id"])
+                    results[index] = item.get("status")
+                    if item.get("status") in (429, 503):
+                        throttled.append(index)
+                        headers = item.get("headers") or {}
+                        retry_after = max(retry_after, int(headers.get("Retry-After", 1)))
+            attempt += 1
+            if not throttled or attempt > self.max_retries:
+                break
+            time.sleep(retry_after)
+            pending = sorted(throttled)
+        return results
 
-    # Send the email
-    response = requests.post(send_mail_url, headers=headers, data=json.dumps(email_data))
-    return response.status_code
+    def send_to_each(self, recipients, message_subject, message_body):
+        """
+        Send the same message separately to every recipient, e.g. ticket follower notifications
+        """
+        return self.send_many([build_message([recipient], message_body, message_subject)
+                               for recipient in recipients if recipient])
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_graph_mail_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GraphMailClient()
+        return _client
+
+
+def get_graph_api_token():
+    return get_graph_mail_client().get_token()
+
+
+def send_email_attachment(to, message_body="", message_subject="", file_data=None, cc=None,
+                          reply_to=None):
+    message = build_message(to, message_body, message_subject, file_data, cc, reply_to)
+    return get_graph_mail_client().send(message)
+
+
+def send_email_graph_api(subject, body, to):
+    message = build_message(to.split(","), body, subject, content_type="html")
+    message.pop("attachments")
+    message.pop("replyTo")
+    status_code, _ = get_graph_mail_client().send(message)
+    return status_code
@@ -1,34 +1,72 @@
+import base64
 import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+import uuid
+from email.header import Header
 from decouple import config
 
-
-def send_mail(SUBJECT, BODY, TO):
-    """With this function we send out our html email"""
-
-    # Create message container - the correct MIME type is multipart/alternative here!
-    FROM=config("EMAIL_HOST_USER")
-    MESSAGE = MIMEMultipart('alternative')
-    MESSAGE['subject'] = SUBJECT
-    recipient=TO if isinstance(TO, list) else [TO]
-    MESSAGE['To'] = TO
-    MESSAGE['From'] = FROM
-    MESSAGE.preamble = """
+PREAMBLE = """
 Your mail reader does not support the report format.
 Please visit us <a href="http://things.epsumlabs.com">online</a>!"""
 
-    # Record the MIME type text/html.
-    HTML_BODY = MIMEText(BODY, 'html')
 
-    # Attach parts into message container.
-    # According to RFC 2046, the last part of a multipart message, in this case
-    # the HTML message, is best and preferred.
-    MESSAGE.attach(HTML_BODY)
+class MimeTemplate:
+    """
+    multipart/alternative skeleton encoded once, only Subject, To and the html part are encoded per message
+    """
+
+    def __init__(self, from_email, preamble=PREAMBLE):
+        # base64 never produces "-" so the html part can't contain the boundary
+        boundary = f"case-management-{uuid.uuid4().hex}"
+        self.head = ("MIME-Version: 1.0\r\n"
+                     f'Content-Type: multipart/alternative; boundary="{boundary}"\r\n'
+                     f"From: {from_email}\r\n").encode("ascii")
+        self.body_prefix = ("\r\n" + preamble.strip("\n").replace("\n", "\r\n") + "\r\n"
+                            f"--{boundary}\r\n"
+                            'Content-Type: text/html; charset="utf-8"\r\n'
+                            "MIME-Version: 1.0\r\n"
+                            "Content-Transfer-Encoding: base64\r\n\r\n").encode("ascii")
+        self.body_suffix = f"--{boundary}--\r\n".encode("ascii")
+
+    @staticmethod
+    def encode_header(value):
+        try:
+            value.encode("ascii")
+            return value
+        except UnicodeEncodeError:
+            return Header(value, "utf-8").encode()
+
+    def build(self, subject, body, to):
+        """
+        Return the raw message bytes ready for smtplib
+        """
+        recipients = to if isinstance(to, list) else [to]
+        headers = (f"Subject: {self.encode_header(subject)}\r\n"
+                   f"To: {', '.join(recipients)}\r\n").encode("utf-8")
+        html = base64.encodebytes(body.encode("utf-8")).replace(b"\n", b"\r\n")
+        return b"".join((self.head, headers, self.body_prefix, html, self.body_suffix))
+
+
+_mime_templates = {}
 
-    # The actual sending of the e-mail
-    server = smtplib.SMTP(host=config("EMAIL_HOST"),port=int(config("EMAIL_PORT")))
 
+def get_mime_template(from_email):
+    if from_email not in _mime_templates:
+        _mime_templates[from_email] = MimeTemplate(from_email)
+    return _mime_templates[from_email]
+
+
+def send_mail(SUBJECT, BODY, TO):
+    """With this function we send out our html email"""
+    send_mail_batch([(SUBJECT, BODY, TO)])
+
+
+def send_mail_batch(messages):
+    """
+    Send (subject, html body, to) tuples over a single SMTP session
+    """
+    FROM = config("EMAIL_HOST_USER")
+    template = get_mime_template(FROM)
+    server = smtplib.SMTP(host=config("EMAIL_HOST"), port=int(config("EMAIL_PORT")))
 
     # Print debugging output when testing
     if __name__ == "__main__":
@@ -39,7 +77,8 @@ Please visit us <a href="http://things.epsumlabs.com">online</a>!"""
 
     server.starttls()
     server.login(FROM, password)
-    server.sendmail(FROM, TO, MESSAGE.as_string())
-    server.quit()
-
-
+    try:
+        for subject, body, to in messages:
+            server.sendmail(FROM, to, template.build(subject, body, to))
+    finally:
+        server.quit()
@@ -0,0 +1,266 @@
+import base64
+import hashlib
+import json
+import time
+from functools import lru_cache
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import F, Q
+from django.db.models.signals import post_delete, post_save
+from django.db.models.sql import Query
+from django.utils.functional import cached_property
+from rest_framework import serializers
+
+
+class InvalidCursor(ValueError):
+    """
+    Raised when a client sends a cursor that was not issued for the current ordering
+    """
+
+
+def _cursor_value(value):
+    # full precision isoformat, DjangoJSONEncoder would cut datetimes to milliseconds and break the seek
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_cursor(order_field, descending, value, pk):
+    """
+    Build the opaque cursor token handed back to the client.
+    The token carries the ordering it was issued for so it can't be replayed against another sort.
+    """
+    payload = json.dumps({"o": order_field, "d": int(descending), "v": value, "id": pk}, default=_cursor_value,
+                         separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+        return payload["o"], bool(payload["d"]), payload["v"], payload["id"]
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
+
+
+class KeysetPaginator:
+    """
+    Seek based pagination over (order_field, id).
+    Every page is a single indexed range query, so page 10,000 costs the same as page 1 and no COUNT is run.
+    """
+
+    def __init__(self, queryset, order_field="id", descending=False, page_size=50):
+        self.queryset = queryset
+        self.order_field = order_field
+        self.descending = descending
+        self.page_size = page_size
+        self.field = queryset.model._meta.get_field(order_field)
+
+    def _ordering(self):
+        if self.order_field == "id":
+            return ("-id",) if self.descending else ("id",)
+        # NULLs are pinned to the start of an ascending walk and the end of a descending one on every backend
+        if self.descending:
+            return F(self.order_field).desc(nulls_last=True), "-id"
+        return F(self.order_field).asc(nulls_first=True), "id"
+
+    def _seek(self, value, pk):
+        if self.order_field == "id":
+            return Q(id__lt=pk) if self.descending else Q(id__gt=pk)
+        column = self.order_field
+        if self.descending:
+            if value is None:
+                return Q(**{f"{column}__isnull": True, "id__lt": pk})
+            return (Q(**{f"{column}__lt": value}) | Q(**{column: value, "id__lt": pk}) |
+                    Q(**{f"{column}__isnull": True}))
+        if value is None:
+            return Q(**{f"{column}__isnull": True, "id__gt": pk}) | Q(**{f"{column}__isnull": False})
+        return Q(**{f"{column}__gt": value}) | Q(**{column: value, "id__gt": pk})
+
+    def get_page(self, cursor=None):
+        """
+        Return the rows of the page that follows `cursor` and the cursor of the next page (None on the last page)
+        """
+        queryset = self.queryset.order_by(*self._ordering())
+        if cursor:
+            order_field, descending, value, pk = decode_cursor(cursor)
+            if order_field != self.order_field or descending != self.descending:
+                raise InvalidCursor("Cursor does not match the requested ordering")
+            if value is not None:
+                value = self.field.to_python(value)
+            queryset = queryset.filter(self._seek(value, pk))
+        rows = list(queryset[:self.page_size + 1])
+        next_cursor = None
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            last = rows[-1]
+            next_cursor = encode_cursor(self.order_field, self.descending, getattr(last, self.field.attname),
+                                        last.pk)
+        return rows, next_cursor
+
+
+# seconds a filter count is reused, writes through the ORM invalidate it before that
+COUNT_CACHE_TTL = getattr(settings, "COUNT_CACHE_TTL", 30)
+# models read by the paginated filter APIs, only their writes bump a table version and a count reading any
+# other table is never cached
+COUNT_CACHE_MODELS = getattr(settings, "COUNT_CACHE_MODELS", (
+    "acl.Role", "acl.UserRole", "acl.MasterPrivilege", "acl.RolePermission", "acl.ClientPrivilege",
+    "master_data_management.FileType", "master_data_management.Client", "master_data_management.Customer",
+    "master_data_management.BusinessUnit", "master_data_management.Vendor", "master_data_management.D365FOSetup",
+    "master_data_management.SupplierContactDetails",
+    "ticket_management.Status", "ticket_management.Category", "ticket_management.ProjectManagement",
+    "ticket_management.Department", "ticket_management.Ticket", "ticket_management.TicketFollower",
+    "ticket_management.TicketRevision", "ticket_management.TicketBehalf", "ticket_management.TicketType",
+    "ticket_management.SLA",
+    "user_management.CustomUser",
+))
+
+
+def _version_key(table):
+    return f"count_version_{table}"
+
+
+def get_table_version(table):
+    version = cache.get(_version_key(table))
+    if version is None:
+        # seeded from the clock so a lost key never brings back a version that was used before
+        cache.add(_version_key(table), time.time_ns(), None)
+        version = cache.get(_version_key(table))
+    return version
+
+
+def bump_table_version(sender, **kwargs):
+    """
+    Drop the cached counts reading the table of sender. Connected to the saves and deletes of COUNT_CACHE_MODELS,
+    call it after writes that send no signal: bulk_create, bulk_update, update() and raw SQL.
+    """
+    try:
+        cache.incr(_version_key(sender._meta.db_table))
+    except ValueError:
+        # no count cached for this table yet
+        pass
+
+
+def connect_count_cache():
+    """
+    Connect bump_table_version to COUNT_CACHE_MODELS only, the other models keep signal-free saves and fast deletes
+    """
+    for label in COUNT_CACHE_MODELS:
+        post_save.connect(bump_table_version, sender=label, dispatch_uid="count_cache_post_save")
+        post_delete.connect(bump_table_version, sender=label, dispatch_uid="count_cache_post_delete")
+
+
+@lru_cache(maxsize=None)
+def _cached_tables():
+    return frozenset(apps.get_model(label)._meta.db_table for label in COUNT_CACHE_MODELS)
+
+
+def _query_tables(query):
+    """
+    Tables read by the query, subqueries used as filter values included
+    """
+    tables = {join.table_name for join in query.alias_map.values()}
+    tables.add(query.model._meta.db_table)
+    nodes = [query.where]
+    while nodes:
+        node = nodes.pop()
+        for child in getattr(node, "children", ()):
+            if hasattr(child, "children"):
+                nodes.append(child)
+                continue
+            rhs = getattr(child, "rhs", None)
+            rhs_query = getattr(rhs, "query", rhs)
+            if isinstance(rhs_query, Query):
+                tables |= _query_tables(rhs_query)
+    return tables
+
+
+def count_cache_key(queryset):
+    """
+    Signature of the count: SQL and params with the ordering stripped, plus the data version of every table read
+    """
+    sql, params = queryset.order_by().query.sql_with_params()
+    versions = sorted((table, get_table_version(table)) for table in _query_tables(queryset.query))
+    signature = repr((queryset.db, sql, params, versions))
+    return "count_" + hashlib.sha1(signature.encode("utf-8")).hexdigest()
+
+
+def approximate_count(queryset):
+    """
+    Row estimate from the database statistics, only for unfiltered querysets.
+    Returns None when the table has no statistics so the caller can fall back to an exact count.
+    """
+    query = queryset.query
+    if query.where or query.distinct or len(query.alias_map) > 1 or query.low_mark or query.high_mark is not None:
+        return None
+    table = queryset.model._meta.db_table
+    connection = connections[queryset.db]
+    statements = {
+        "mysql": ("SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() "
+                  "AND TABLE_NAME = %s"),
+        "postgresql": "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+        # filled by ANALYZE, the first figure of an index row is the row count of the table
+        "sqlite": "SELECT stat FROM sqlite_stat1 WHERE tbl = %s",
+    }
+    statement = statements.get(connection.vendor)
+    if not statement:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(statement, [table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if not row or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None
+
+
+def cached_count(queryset, approximate=False, ttl=None):
+    """
+    Count the queryset once and reuse the figure for the same filter until the data changes or the TTL runs out
+    """
+    if approximate:
+        estimate = approximate_count(queryset)
+        if estimate is not None:
+            return estimate
+    if not _query_tables(queryset.query) <= _cached_tables():
+        # writes to the other tables bump no version, a cached figure could go stale
+        return queryset.count()
+    key = count_cache_key(queryset)
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, COUNT_CACHE_TTL if ttl is None else ttl)
+    return count
+
+
+def approximate_requested(data):
+    """
+    Read the approximate_count flag of a filter request as a boolean, "false" and "0" turn it off
+    """
+    return serializers.BooleanField().to_internal_value(data.get("approximate_count", False))
+
+
+class CountCachingPaginator(Paginator):
+    """
+    Paginator whose count is run once per request through cached_count,
+    read paginator.count in the response instead of counting the queryset again
+    """
+
+    def __init__(self, object_list, per_page, approximate=False, count_ttl=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.approximate = approximate
+        self.count_ttl = count_ttl
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, "query"):
+            return len(self.object_list)
+        return cached_count(self.object_list, approximate=self.approximate, ttl=self.count_ttl)
@@ -0,0 +1,28 @@
+import logging
+import threading
+
+from django.db import close_old_connections, connection
+
+logger = logging.getLogger(name="CMS")
+
+
+def _run_periodically(name, task, interval, stop):
+    while not stop.wait(interval):
+        close_old_connections()
+        try:
+            task()
+        except Exception:
+            logger.exception("Periodic task %s failed", name)
+        finally:
+            connection.close()
+
+
+def start_periodic_thread(name, task, interval):
+    """
+    Call task every interval seconds on a daemon thread of this process, returns the event that stops it.
+    Meant for state of the process itself, e.g. an in-memory queue; sweeps over shared tables run from their
+    management commands so that one process does them.
+    """
+    stop = threading.Event()
+    threading.Thread(target=_run_periodically, args=(name, task, interval, stop), daemon=True, name=name).start()
+    return stop
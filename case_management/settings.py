@@ -135,6 +135,31 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Privilege, SLA, auth and user directory versions, login failure counters and cached counts are kept in the
+# default cache and must be shared by every worker process. Set CACHE_URL (e.g. redis://localhost:6379/0)
+# whenever more than one process serves the API.
+CACHE_URL = config('CACHE_URL', default='')
+# accept the per-process memory cache, only safe for a single-process development server
+ALLOW_LOCAL_CACHE = config('ALLOW_LOCAL_CACHE', default=DEBUG, cast=bool)
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+
+# The first hasher hashes new passwords, the others only verify older hashes.
+# PBKDF2 rounds per password check, hashes of another cost are rewritten on the next successful login
+PASSWORD_PBKDF2_ITERATIONS = int(config('PASSWORD_PBKDF2_ITERATIONS', '390000'))
+PASSWORD_HASHERS = [
+    'user_management.hashers.ConfigurablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 
@@ -170,7 +195,7 @@ SWAGGER_SETTINGS = {
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         # 'appreciation_project.custom_authentication.AzureJWTAuthenticationBackend',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'case_management.custom_authentication.CustomJWTAuthentication',
     ],
     'EXCEPTION_HANDLER': 'case_management.custome_exception_handler.error_handler',
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
@@ -179,7 +204,8 @@ REST_FRAMEWORK = {
 
 SIMPLE_JWT = {
     'USER_ID_FIELD': 'email',
-    'UPDATE_LAST_LOGIN': True,
+    # last_login is written in batches by user_management.login.record_login
+    'UPDATE_LAST_LOGIN': False,
     'ACCESS_TOKEN_LIFETIME': datetime.timedelta(minutes=int(config('TOKEN_TTL', '60'))),
 }
 
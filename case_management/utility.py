@@ -1,4 +1,5 @@
 import random
+import re
 from rest_framework.pagination import PageNumberPagination
 from decouple import config
 from datetime import datetime, timedelta
@@ -110,19 +111,66 @@ def send_html_email(to_email, subject, html_content):
     :param subject: Subject of the email
     :param html_content: HTML content of the email
     """
+    # Send the email
+    build_html_email(to_email, subject, html_content).send()
+
+
+def build_html_email(to_email, subject, html_content, connection=None):
+    """
+    Build the EmailMultiAlternatives of an HTML email, pass connection to reuse an open SMTP connection
+    """
     from_email = settings.EMAIL_HOST_USER
     text_content = 'This is an important message.'  # Optional plain text content
 
     # Create the email message
-    msg = EmailMultiAlternatives(subject, text_content, from_email, [to_email])
+    msg = EmailMultiAlternatives(subject, text_content, from_email, [to_email], connection=connection)
     msg.attach_alternative(html_content, "text/html")
-
-    # Send the email
-    msg.send()
+    return msg
 
 
 def email_send(user_mail, subject, message):
-    email_content = """
+    send_html_email(user_mail, subject, render_email(subject, message))
+
+
+def render_email(subject, message):
+    return get_email_template("default").render(subject=subject, message=message)
+
+
+def render_emails(items):
+    """
+    Render the default layout for a batch of (subject, message) pairs
+    """
+    return get_email_template("default").render_many({"subject": subject, "message": message}
+                                                     for subject, message in items)
+
+
+class EmailTemplate:
+    """
+    Email layout parsed once into its static segments and {{ slot }} names,
+    rendering is a single join instead of re-building the whole HTML string
+    """
+    PLACEHOLDER = re.compile(r"{{\s*(\w+)\s*}}")
+
+    def __init__(self, layout):
+        parts = self.PLACEHOLDER.split(layout)
+        # even indexes hold the static html, odd indexes the slot names
+        self.segments = parts[0::2]
+        self.slots = parts[1::2]
+
+    def render(self, **context):
+        output = [self.segments[0]]
+        for slot, segment in zip(self.slots, self.segments[1:]):
+            output.append(str(context.get(slot, "")))
+            output.append(segment)
+        return "".join(output)
+
+    def render_many(self, contexts):
+        render = self.render
+        return [render(**context) for context in contexts]
+
+
+EMAIL_LAYOUTS = {
+    "default": """
         <!DOCTYPE><html><head><title>Cozentus</title><meta http-equiv="Content-Type" content="text/html; charset=utf-8"/>
         <meta name="viewport" content="width=device-width, initial-scale=1.0"/>
         <style type="text/css">a{outline:none;color:#40aceb;text-decoration:underline;}a:hover{text-decoration:none !important;}.nav a:hover{text-decoration:underline !important;}.title a:hover{text-decoration:underline !important;}.title-2 a:hover{text-decoration:underline !important;}.btn:hover{opacity:0.8;}.btn a:hover{text-decoration:none !important;}.btn{-webkit-transition:all 0.3s ease;-moz-transition:all 0.3s ease;-ms-transition:all 0.3s ease;transition:all 0.3s ease;}table td{border-collapse: collapse !important;}.ExternalClass, .ExternalClass a, .ExternalClass span, .ExternalClass b, .ExternalClass br, .ExternalClass p, .ExternalClass div{line-height:inherit;}@media only screen and (max-width:500px){table[class="flexible"]{width:100% !important;}table[class="center"]{float:none !important;margin:0 auto !important;}*[class="hide"]{display:none !important;width:0 !important;height:0 !important;padding:0 !important;font-size:0 !important;line-height:0 !important;}td[class="img-flex"] img{width:100% !important;height:auto !important;}td[class="aligncenter"]{text-align:center !important;}th[class="flex"]{display:block !important;width:100% !important;}td[class="wrapper"]{padding:0 !important;}td[class="holder"]{padding:30px 15px 20px !important;}td[class="nav"]{padding:20px 0 0 !important;text-align:center !important;}td[class="h-auto"]{height:auto !important;}td[class="description"]{padding:30px 20px !important;}td[class="i-120"] img{width:120px !important;height:auto !important;}td[class="footer"]{padding:5px 20px 20px !important;}td[class="footer"] td[class="aligncenter"]{line-height:25px !important;padding:20px 0 0 !important;}tr[class="table-holder"]{display:table !important;width:100% !important;}th[class="thead"]{display:table-header-group !important; width:100% !important;}th[class="tfoot"]{display:table-footer-group !important; width:100% !important;}}</style></head>
@@ -156,10 +204,16 @@ def email_send(user_mail, subject, message):
         </table><table data-module="module-2" data-thumb="thumbnails/02.png" width="100%" cellpadding="0" cellspacing="0">
         <tr><td data-bgcolor="bg-module" bgcolor="#eaeced"><table class="flexible" width="600" align="center" style="margin:0 auto;" cellpadding="0" cellspacing="0">
         <tr><td data-bgcolor="bg-block" class="holder" style="padding:58px 60px 52px;" bgcolor="#f9f9f9">
-        <table width="100%" cellpadding="0" cellspacing="0"><tr><td data-color="title" data-size="size title" data-min="25" data-max="45" data-link-color="link title color" data-link-style="text-decoration:none; color:#292c34;" class="title" align="center" style="font:35px/38px Arial, Helvetica, sans-serif; color:#292c34; padding:0 0 24px;">""" + subject + """</td></tr><tr><td data-color="text" data-size="size text" data-min="10" data-max="26" data-link-color="link text color" data-link-style="font-weight:bold; text-decoration:underline; color:#40aceb;" align="center" style="font:bold 16px/25px Arial, Helvetica, sans-serif; color:#888; padding:0 0 23px;">""" \
-                    + message \
-                    + """</td></tr></table></td></tr><tr><td height="28"></td></tr></table></td></tr>
+        <table width="100%" cellpadding="0" cellspacing="0"><tr><td data-color="title" data-size="size title" data-min="25" data-max="45" data-link-color="link title color" data-link-style="text-decoration:none; color:#292c34;" class="title" align="center" style="font:35px/38px Arial, Helvetica, sans-serif; color:#292c34; padding:0 0 24px;">{{ subject }}</td></tr><tr><td data-color="text" data-size="size text" data-min="10" data-max="26" data-link-color="link text color" data-link-style="font-weight:bold; text-decoration:underline; color:#40aceb;" align="center" style="font:bold 16px/25px Arial, Helvetica, sans-serif; color:#888; padding:0 0 23px;">{{ message }}</td></tr></table></td></tr><tr><td height="28"></td></tr></table></td></tr>
                     </table><table data-module="module-7" data-thumb="thumbnails/07.png" width="100%" cellpadding="0" cellspacing="0"><tr><td data-bgcolor="bg-module" bgcolor="#eaeced"><table class="flexible" width="600" align="center" style="margin:0 auto;" cellpadding="0" cellspacing="0"><tr><td class="footer" style="padding:0 0 10px;"><table width="100%" cellpadding="0" cellspacing="0"><tr class="table-holder"><th class="tfoot" width="400" align="left" style="vertical-align:top; padding:0;">
                     <table width="100%" cellpadding="0" cellspacing="0"><tr><td data-color="text" data-link-color="link text color" data-link-style="text-decoration:underline; color:#797c82;" class="aligncenter" style="font:12px/16px Arial, Helvetica, sans-serif; color:#797c82; padding:0 0 10px;">Cozentus Private Limited, 2022. &nbsp; All Rights Reserved. <a target="_blank" style="text-decoration:underline; color:#797c82;">Please Do Not Reply.</a></td></tr></table>
-                    </th></tr></table></td></tr></table></td></tr></table></td></tr><tr><td style="line-height:0;"><div style="display:none; white-space:nowrap; font:15px/1px courier;">&nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp;</div></td></tr></table></body></html>"""
-    send_html_email(user_mail, subject, email_content)
+                    </th></tr></table></td></tr></table></td></tr></table></td></tr><tr><td style="line-height:0;"><div style="display:none; white-space:nowrap; font:15px/1px courier;">&nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp; &nbsp;</div></td></tr></table></body></html>""",
+}
+
+
+# every layout is parsed once when the module is imported
+EMAIL_TEMPLATES = {name: EmailTemplate(layout) for name, layout in EMAIL_LAYOUTS.items()}
+
+
+def get_email_template(name):
+    return EMAIL_TEMPLATES[name]
@@ -1,6 +1,14 @@
 import os
+import pytest
 import django
 from django.conf import settings
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'case_management.settings')
 django.setup()
+
+
+@pytest.fixture(autouse=True)
+def reset_user_directory():
+    # the directory lives in process memory and would outlive the rollback of every test
+    from user_management.directory import user_directory
+    user_directory.reset()
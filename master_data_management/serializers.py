@@ -2,6 +2,8 @@ from django.contrib.auth import get_user_model
 from django.core.validators import RegexValidator
 from rest_framework import serializers
 
+from user_management.user_names import UserNameSerializerMixin, UserNameListSerializer
+
 from .models import FileType, Client, BusinessUnit, Vendor, Application, Customer, AccountType, SupplierContactDetails, \
     D365FOSetup, CompanyInfoForValidation, CPPSanctionAssessment, VendorDetails
 
@@ -36,29 +38,17 @@ class FileTypeSerializers(serializers.ModelSerializer):
             raise serializers.ValidationError(str(ee))
 
 
-class FileTypeReadSerializers(serializers.ModelSerializer):
+class FileTypeReadSerializers(UserNameSerializerMixin, serializers.ModelSerializer):
     created_by = serializers.SerializerMethodField(source='get_created_by', read_only=True)
     modified_by = serializers.SerializerMethodField(source='get_modified_by', read_only=True)
+    user_name_fields = ('created_by', 'modified_by')
 
     class Meta:
         model = FileType
         fields = (
             "id", "status", "file_type", "file_extension", "max_file_size", "file_description", "created_by",
             "modified_by", "created_on", "modified_on", "is_delete")
-
-    def get_modified_by(self, obj):
-        data = User.objects.filter(id=obj.modified_by).first()
-        if data:
-            return f"{data.first_name} {data.last_name}".strip()
-        else:
-            return None
-
-    def get_created_by(self, obj):
-        data = User.objects.filter(id=obj.created_by).first()
-        if data:
-            return f"{data.first_name} {data.last_name}".strip()
-        else:
-            return None
+        list_serializer_class = UserNameListSerializer
 
 
 class FileTypeFilterSerializers(serializers.Serializer):
@@ -74,6 +64,7 @@ class FileTypeFilterSerializers(serializers.Serializer):
     order_by = serializers.CharField(required=False, allow_blank=True, allow_null=True)
     order_type = serializers.CharField(required=False, allow_blank=True, allow_null=True)
     export = serializers.BooleanField(required=False, allow_null=True, default=False)
+    async_export = serializers.BooleanField(required=False, allow_null=True, default=False)
     page = serializers.IntegerField(required=False, allow_null=True)
     page_size = serializers.IntegerField(required=False, allow_null=True)
 
@@ -143,6 +134,7 @@ class ClientFilterSerializers(serializers.Serializer):
     order_by = serializers.CharField(required=False, allow_blank=True, allow_null=True)
     order_type = serializers.CharField(required=False, allow_blank=True, allow_null=True)
     export = serializers.BooleanField(required=False, allow_null=True, default=False)
+    async_export = serializers.BooleanField(required=False, allow_null=True, default=False)
     page = serializers.IntegerField(required=False, allow_null=True)
     page_size = serializers.IntegerField(required=False, allow_null=True)
 
@@ -201,6 +193,7 @@ class CustomerFilterSerializers(serializers.Serializer):
     order_by = serializers.CharField(required=False, allow_blank=True, allow_null=True)
     order_type = serializers.CharField(required=False, allow_blank=True, allow_null=True)
     export = serializers.BooleanField(required=False, allow_null=True, default=False)
+    async_export = serializers.BooleanField(required=False, allow_null=True, default=False)
     page = serializers.IntegerField(required=False, allow_null=True)
     page_size = serializers.IntegerField(required=False, allow_null=True)
 
@@ -237,20 +230,6 @@ class BusinessUnitReadSerializers(serializers.ModelSerializer):
             "id", "client_id", "code", "name", "contact_name", "contact_email", "contact_number",
             "created_by", "modified_by", "created_on", "modified_on", "is_delete", "status")
 
-    def get_modified_by(self, obj):
-        data = User.objects.filter(id=obj.modified_by).first()
-        if data:
-            return f"{data.first_name} {data.last_name}".strip()
-        else:
-            return None
-
-    def get_created_by(self, obj):
-        data = User.objects.filter(id=obj.created_by).first()
-        if data:
-            return f"{data.first_name} {data.last_name}".strip()
-        else:
-            return None
-
 
 class BusinessUnitFilterSerializers(serializers.Serializer):
     status = serializers.BooleanField(required=False, allow_null=True)
@@ -270,6 +249,7 @@ class BusinessUnitFilterSerializers(serializers.Serializer):
     page = serializers.IntegerField(required=False, allow_null=True)
     page_size = serializers.IntegerField(required=False, allow_null=True)
     export = serializers.BooleanField(required=False, allow_null=True, default=False)
+    async_export = serializers.BooleanField(required=False, allow_null=True, default=False)
 
 
 class VendorSerializers(serializers.ModelSerializer):
@@ -325,6 +305,7 @@ class VendorFilterSerializers(serializers.Serializer):
     order_by = serializers.CharField(required=False, allow_blank=True, allow_null=True)
     order_type = serializers.CharField(required=False, allow_blank=True, allow_null=True)
     export = serializers.BooleanField(required=False, allow_null=True, default=False)
+    async_export = serializers.BooleanField(required=False, allow_null=True, default=False)
     page = serializers.IntegerField(required=False, allow_null=True)
     page_size = serializers.IntegerField(required=False, allow_null=True)
 
@@ -1,5 +1,4 @@
 from django.core.exceptions import FieldError
-from django.core.paginator import Paginator
 from drf_spectacular.utils import extend_schema
 from rest_framework import generics, serializers
 from drf_yasg.utils import swagger_auto_schema
@@ -7,7 +6,8 @@ from rest_framework.generics import RetrieveUpdateDestroyAPIView, CreateAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from acl.privilege import CozentusPermission
-from acl.export_excel import export_query_to_excel
+from acl.export_jobs import export_response
+from case_management.pagination import CountCachingPaginator, approximate_requested
 from master_data_management.models import FileType, Client, BusinessUnit, Vendor, Application, Customer, AccountType, \
     SupplierContactDetails, D365FOSetup, CompanyInfoForValidation, CPPSanctionAssessment, VendorDetails
 from master_data_management.permissions import permission_file_type_create, permission_file_type_view, \
@@ -124,9 +124,9 @@ class FileTypeFilterApi(APIView):
                     query_filter = f"-{query_filter}"
                 queryset = queryset.order_by(query_filter)
             if data.get("export"):
-                results = self.serializer_class(queryset, many=True)
-                return export_query_to_excel(data=results.data, module_name="FILE_TYPE")
-            paginator = Paginator(queryset, page_size)
+                return export_response(request, queryset, self.serializer_class, module_name="FILE_TYPE")
+            paginator = CountCachingPaginator(queryset, page_size,
+                                              approximate=approximate_requested(request.data))
             number_pages = paginator.num_pages
             if page > number_pages:
                 return Response({"message": "Page not found"}, status=status.HTTP_400_BAD_REQUEST)
@@ -134,7 +134,7 @@ class FileTypeFilterApi(APIView):
             page_obj = paginator.get_page(page)
             serializer = self.serializer_class(page_obj, many=True)
             data = serializer.data
-            return Response({"count": queryset.count(), "results": data})
+            return Response({"count": paginator.count, "results": data})
 
         except ValueError as e:
             return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -228,9 +228,9 @@ class ClientFilterApi(APIView):
                     query_filter = f"-{query_filter}"
                 queryset = queryset.order_by(query_filter)
             if data.get("export"):
-                results = self.serializer_class(queryset, many=True)
-                return export_query_to_excel(data=results.data, module_name="CLIENT")
-            paginator = Paginator(queryset, page_size)
+                return export_response(request, queryset, self.serializer_class, module_name="CLIENT")
+            paginator = CountCachingPaginator(queryset, page_size,
+                                              approximate=approximate_requested(request.data))
             number_pages = paginator.num_pages
             if page > number_pages:
                 return Response({"message": "Page not found"}, status=status.HTTP_400_BAD_REQUEST)
@@ -238,7 +238,7 @@ class ClientFilterApi(APIView):
             page_obj = paginator.get_page(page)
             serializer = self.serializer_class(page_obj, many=True)
             data = serializer.data
-            return Response({"count": queryset.count(), "results": data})
+            return Response({"count": paginator.count, "results": data})
 
         except ValueError as e:
             return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -334,9 +334,9 @@ class CustomerFilterApi(APIView):
                     query_filter = f"-{query_filter}"
                 queryset = queryset.order_by(query_filter)
             if data.get("export"):
-                results = self.serializer_class(queryset, many=True)
-                return export_query_to_excel(data=results.data, module_name="CUSTOMER")
-            paginator = Paginator(queryset, page_size)
+                return export_response(request, queryset, self.serializer_class, module_name="CUSTOMER")
+            paginator = CountCachingPaginator(queryset, page_size,
+                                              approximate=approximate_requested(request.data))
             number_pages = paginator.num_pages
             if page > number_pages:
                 return Response({"message": "Page not found"}, status=status.HTTP_400_BAD_REQUEST)
@@ -344,7 +344,7 @@ class CustomerFilterApi(APIView):
             page_obj = paginator.get_page(page)
             serializer = self.serializer_class(page_obj, many=True)
             data = serializer.data
-            return Response({"count": queryset.count(), "results": data})
+            return Response({"count": paginator.count, "results": data})
 
         except ValueError as e:
             return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -439,9 +439,9 @@ class BusinessUnitFilterApi(APIView):
                     query_filter = f"-{query_filter}"
                 queryset = queryset.order_by(query_filter)
             if data.get("export"):
-                results = self.serializer_class(queryset, many=True)
-                return export_query_to_excel(data=results.data, module_name="BUSINESS_UNIT")
-            paginator = Paginator(queryset, page_size)
+                return export_response(request, queryset, self.serializer_class, module_name="BUSINESS_UNIT")
+            paginator = CountCachingPaginator(queryset, page_size,
+                                              approximate=approximate_requested(request.data))
             number_pages = paginator.num_pages
             if page > number_pages:
                 return Response({"message": "Page not found"}, status=status.HTTP_400_BAD_REQUEST)
@@ -449,7 +449,7 @@ class BusinessUnitFilterApi(APIView):
             page_obj = paginator.get_page(page)
             serializer = self.serializer_class(page_obj, many=True)
             data = serializer.data
-            return Response({"count": queryset.count(), "results": data})
+            return Response({"count": paginator.count, "results": data})
 
         except ValueError as e:
             return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -545,9 +545,9 @@ class VendorFilterApi(APIView):
                     query_filter = f"-{query_filter}"
                 queryset = queryset.order_by(query_filter)
             if data.get("export"):
-                results = self.serializer_class(queryset, many=True)
-                return export_query_to_excel(data=results.data, module_name="VENDOR")
-            paginator = Paginator(queryset, page_size)
+                return export_response(request, queryset, self.serializer_class, module_name="VENDOR")
+            paginator = CountCachingPaginator(queryset, page_size,
+                                              approximate=approximate_requested(request.data))
             number_pages = paginator.num_pages
             if page > number_pages:
                 return Response({"message": "Page not found"}, status=status.HTTP_400_BAD_REQUEST)
@@ -555,7 +555,7 @@ class VendorFilterApi(APIView):
             page_obj = paginator.get_page(page)
             serializer = self.serializer_class(page_obj, many=True)
             data = serializer.data
-            return Response({"count": queryset.count(), "results": data})
+            return Response({"count": paginator.count, "results": data})
 
         except ValueError as e:
             return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -884,7 +884,8 @@ class D365FOSetupFilterApi(APIView):
             if query_order_by:
                 d365fo_setups = d365fo_setups.order_by(query_order_by)
 
-            paginator = Paginator(d365fo_setups, page_size)
+            paginator = CountCachingPaginator(d365fo_setups, page_size,
+                                               approximate=approximate_requested(request.data))
             number_pages = paginator.num_pages
 
             if page > number_pages and page > 1:
@@ -893,7 +894,7 @@ class D365FOSetupFilterApi(APIView):
             page_obj = paginator.get_page(page)
             results = D365FOSetupReadSerializer(page_obj, many=True)
 
-            return Response({'count': d365fo_setups.count(), 'results': results.data}, status=status.HTTP_200_OK)
+            return Response({'count': paginator.count, 'results': results.data}, status=status.HTTP_200_OK)
 
         except FieldError as fe:
             return Response({"message": str(fe)}, status=status.HTTP_400_BAD_REQUEST)
@@ -962,7 +963,8 @@ class SupplierContactDetailsFilterApi(APIView):
             if query_order_by:
                 supplier_contacts = supplier_contacts.order_by(query_order_by)
 
-            paginator = Paginator(supplier_contacts, page_size)
+            paginator = CountCachingPaginator(supplier_contacts, page_size,
+                                               approximate=approximate_requested(request.data))
             number_pages = paginator.num_pages
 
             if page > number_pages and page > 1:
@@ -971,7 +973,7 @@ class SupplierContactDetailsFilterApi(APIView):
             page_obj = paginator.get_page(page)
             results = SupplierContactDetailsReadSerializer(page_obj, many=True)
 
-            return Response({'count': supplier_contacts.count(), 'results': results.data}, status=status.HTTP_200_OK)
+            return Response({'count': paginator.count, 'results': results.data}, status=status.HTTP_200_OK)
 
         except FieldError as fe:
             return Response({"message": str(fe)}, status=status.HTTP_400_BAD_REQUEST)
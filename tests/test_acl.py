@@ -3,7 +3,34 @@ from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 from django.contrib.auth import get_user_model
-from acl.models import UserRole, ClientPrivilege, MasterPrivilege
+from django.utils import timezone
+from acl.models import UserRole, ClientPrivilege, MasterPrivilege, Role, RolePermission, ExportJob, AppConfiguration, \
+    NumberSequence
+from acl.privilege import check_shared_cache, get_privilege_version, get_user_privileges
+from acl.export_jobs import purge_expired_exports
+from acl.auth import sync_privilege_registry
+from acl.classes import PermissionNamespace
+from acl.role_assignment import InvalidAssignment, assign_roles, set_role_users
+from acl.role_sync import InvalidPrivilege, clone_role, import_roles, sync_role_privileges
+from acl.retention import purge_expired_history
+from acl.sequences import allocate_numbers, next_number, parse_start_no, reset_number_blocks
+from django.db import transaction
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import override_settings
+from ticket_management.models import Department, Ticket, TicketRevision, TicketType
+from user_management.models import EmailOutbox
+from django.core.management import call_command
+from datetime import timedelta
+from unittest.mock import patch
+import glob
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
 
 User = get_user_model()
 
@@ -455,6 +482,71 @@ class RoleUserCreateAPITestCase(BaseTestCase):
         # self.assertEqual(response.json()["message"], "Please provide valid user data or role data")
 
 
+class RoleAssignmentTestCase(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(email=f"member{index}@example.com", password="member@123")
+                      for index in range(30)]
+        self.roles = [Role.objects.create(role_name=f"Role {index}", created_by="admin") for index in range(3)]
+
+    def members(self, role):
+        return set(UserRole.objects.filter(role=role).values_list("user_id", flat=True))
+
+    def test_add_is_set_based(self):
+        pairs = [(user.id, role.id) for user in self.users for role in self.roles]
+        # roles, users, current memberships, savepoint, two insert batches of 50, release
+        with self.assertNumQueries(7):
+            self.assertEqual(assign_roles(pairs, created_by="admin", batch_size=50), (90, 0))
+        self.assertEqual(UserRole.objects.count(), 90)
+        self.assertEqual(assign_roles(pairs), (0, 0))
+
+    def test_replace_only_touches_listed_roles(self):
+        assign_roles([(user.id, role.id) for user in self.users[:10] for role in self.roles[:2]])
+        added, removed = assign_roles([(user.id, self.roles[0].id) for user in self.users[5:15]], mode="replace")
+        self.assertEqual((added, removed), (5, 5))
+        self.assertEqual(self.members(self.roles[0]), {user.id for user in self.users[5:15]})
+        self.assertEqual(self.members(self.roles[1]), {user.id for user in self.users[:10]})
+
+    def test_remove(self):
+        assign_roles([(user.id, self.roles[0].id) for user in self.users[:10]])
+        self.assertEqual(assign_roles([(user.id, self.roles[0].id) for user in self.users[:4]], mode="remove"),
+                         (0, 4))
+        self.assertEqual(self.members(self.roles[0]), {user.id for user in self.users[4:10]})
+
+    def test_unknown_ids_are_rejected(self):
+        with self.assertRaises(InvalidAssignment):
+            assign_roles([(self.users[0].id, self.roles[0].id), (999999, self.roles[0].id)])
+        with self.assertRaises(InvalidAssignment):
+            assign_roles([(self.users[0].id, "fb12619f-f193-47fd-bdea-84991bd81625")])
+        self.assertFalse(UserRole.objects.exists())
+
+    def test_set_role_users_keeps_other_roles(self):
+        user = self.users[0]
+        assign_roles([(user.id, self.roles[0].id), (user.id, self.roles[1].id)])
+        set_role_users(self.roles[0].id, [])
+        self.assertEqual(set(UserRole.objects.filter(user=user).values_list("role_id", flat=True)),
+                         {self.roles[1].id})
+
+
+class RoleUserBulkAssignAPITestCase(BaseTestCase):
+    def test_bulk_assign(self):
+        role = Role.objects.create(role_name="Bulk Role", created_by="admin")
+        users = [User.objects.create_user(email=f"bulk{index}@example.com", password="bulk@123") for index in range(5)]
+        payload = {"assignments": [{"user_id": user.id, "role_id": str(role.id)} for user in users]}
+        response = self.client.post(reverse('role_user_bulk'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {"added": 5, "removed": 0})
+        payload = {"assignments": [{"user_id": users[0].id, "role_id": str(role.id)}], "mode": "replace"}
+        response = self.client.post(reverse('role_user_bulk'), payload, format='json')
+        self.assertEqual(response.json(), {"added": 0, "removed": 4})
+
+    def test_bulk_assign_invalid_user(self):
+        role = Role.objects.create(role_name="Bulk Role", created_by="admin")
+        payload = {"assignments": [{"user_id": 999999, "role_id": str(role.id)}]}
+        response = self.client.post(reverse('role_user_bulk'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()["message"], "Please provide valid user data or role data")
+
+
 class ClientPrivilegeApiTestCase(BaseTestCase):
     def test_create_client_privilege(self):
         url = reverse('client_privilege')
@@ -572,7 +664,6 @@ class ClientPrivilegeFilterApiTestCase(BaseTestCase):
     def setUp(self):
         super().setUp()
         self.privilege = MasterPrivilege.objects.create(
-            id=1,
             privilege_name="Test Privilege"
         )
         self.client_id = 1
@@ -665,3 +756,400 @@ class ClientPrivilegeFilterApiTestCase(BaseTestCase):
         data = response.json()
         self.assertEqual(data["count"], 0)
         self.assertEqual(len(data["results"]), 0)
+
+
+class PrivilegeCacheTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="viewer@example.com", password="viewer@123", is_active=True)
+        # registered by the post-migrate privilege sync
+        self.privilege = MasterPrivilege.objects.get(privilege_name="VIEW_ROLE_LIST")
+        self.role = Role.objects.create(role_name="Role Viewer", created_by=self.user.id)
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('role_list')
+
+    def grant(self):
+        RolePermission.objects.create(role=self.role, privilege=self.privilege, created_by=self.user.id)
+        UserRole.objects.create(user=self.user, role=self.role, created_by=self.user.id)
+
+    def test_user_without_privilege_is_denied(self):
+        response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_user_with_privilege_is_allowed(self):
+        self.grant()
+        response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_privileges_served_without_queries_after_warm_up(self):
+        self.grant()
+        self.assertEqual(get_user_privileges(self.user.id), frozenset({"VIEW_ROLE_LIST"}))
+        with self.assertNumQueries(0):
+            self.assertIn("VIEW_ROLE_LIST", get_user_privileges(self.user.id))
+
+    def test_cache_invalidated_on_role_permission_change(self):
+        self.grant()
+        self.assertIn("VIEW_ROLE_LIST", get_user_privileges(self.user.id))
+        RolePermission.objects.filter(role=self.role).delete()
+        self.assertEqual(get_user_privileges(self.user.id), frozenset())
+        response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_cache_invalidated_on_bulk_role_assignment(self):
+        RolePermission.objects.create(role=self.role, privilege=self.privilege, created_by=self.user.id)
+        self.assertEqual(get_user_privileges(self.user.id), frozenset())
+        admin = User.objects.create_superuser("admin@example.com", "admin@123")
+        self.client.force_authenticate(user=admin)
+        self.client.post(reverse('role_user_create'), {"role_id": str(self.role.id), "user_ids": [self.user.id]},
+                         format='json')
+        self.assertIn("VIEW_ROLE_LIST", get_user_privileges(self.user.id))
+
+    def test_cache_invalidated_again_on_commit(self):
+        self.grant()
+        with self.captureOnCommitCallbacks() as callbacks:
+            RolePermission.objects.filter(role=self.role).delete()
+            version = get_privilege_version()
+            # a concurrent request caching the set read before the commit
+            cache.set(f"acl_privileges_{version}_{self.user.id}", frozenset({"VIEW_ROLE_LIST"}))
+        for callback in callbacks:
+            callback()
+        self.assertGreater(get_privilege_version(), version)
+        self.assertEqual(get_user_privileges(self.user.id), frozenset())
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+                       ALLOW_LOCAL_CACHE=False)
+    def test_process_local_cache_refused(self):
+        with self.assertRaises(ImproperlyConfigured):
+            check_shared_cache()
+        with self.settings(ALLOW_LOCAL_CACHE=True):
+            check_shared_cache()
+
+
+class PrivilegeRegistrySyncTestCase(TestCase):
+    def add_namespace(self):
+        namespace = PermissionNamespace("Registry Test")
+        self.addCleanup(PermissionNamespace.get_all_namespaces().remove, namespace)
+        return namespace
+
+    def test_unchanged_registry_is_skipped_with_one_query(self):
+        sync_privilege_registry()
+        with self.assertNumQueries(1):
+            self.assertFalse(sync_privilege_registry())
+        self.assertTrue(MasterPrivilege.objects.filter(privilege_name="VIEW_ROLE_LIST", is_active=True).exists())
+
+    def test_changed_registry_is_upserted(self):
+        namespace = self.add_namespace()
+        permission = namespace.add_permission(privilege_name="REGISTRY_TEST", privilege_desc="first", module_id=1)
+        self.assertTrue(sync_privilege_registry())
+        self.assertEqual(MasterPrivilege.objects.get(privilege_name="REGISTRY_TEST").privilege_desc, "first")
+        permission.privilege_desc = "second"
+        self.assertTrue(sync_privilege_registry())
+        self.assertEqual(MasterPrivilege.objects.get(privilege_name="REGISTRY_TEST").privilege_desc, "second")
+
+    def test_removed_privilege_is_deactivated_and_no_longer_granted(self):
+        user = User.objects.create_user(email="registry@example.com", password="registry@123")
+        privilege = MasterPrivilege.objects.create(namespace="Old", privilege_name="REMOVED_PRIVILEGE",
+                                                   privilege_desc="", module_id=1)
+        role = Role.objects.create(role_name="Registry Role", created_by="admin")
+        RolePermission.objects.create(role=role, privilege=privilege, created_by="admin")
+        UserRole.objects.create(user=user, role=role, created_by="admin")
+        self.assertIn("REMOVED_PRIVILEGE", get_user_privileges(user.id))
+        sync_privilege_registry(force=True)
+        privilege.refresh_from_db()
+        self.assertFalse(privilege.is_active)
+        self.assertNotIn("REMOVED_PRIVILEGE", get_user_privileges(user.id))
+
+
+class RoleSyncTestCase(TestCase):
+    def setUp(self):
+        MasterPrivilege.objects.bulk_create([
+            MasterPrivilege(namespace="ACL Permissions", privilege_name=f"PRIVILEGE_{index}",
+                            privilege_desc="", module_id=10) for index in range(50)])
+        self.role = Role.objects.create(role_name="Synced Role")
+
+    def names(self, role):
+        return set(RolePermission.objects.filter(role=role).values_list("privilege__privilege_name", flat=True))
+
+    def test_sync_invalidates_again_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            sync_role_privileges(self.role, ["PRIVILEGE_1"], "creator")
+            version = get_privilege_version()
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertGreater(get_privilege_version(), version)
+
+    def test_sync_writes_only_the_difference(self):
+        sync_role_privileges(self.role, [f"PRIVILEGE_{index}" for index in range(40)], "creator")
+        kept = RolePermission.objects.get(role=self.role, privilege__privilege_name="PRIVILEGE_0")
+        wanted = [f"PRIVILEGE_{index}" for index in range(10, 50)]
+        # privilege lookup, current rows, delete (select + delete, post_delete receivers need the rows), bulk insert
+        with self.assertNumQueries(5):
+            self.assertEqual(sync_role_privileges(self.role, wanted, "editor"), (10, 10))
+        self.assertEqual(self.names(self.role), set(wanted))
+        self.assertFalse(RolePermission.objects.filter(id=kept.id).exists())
+        unchanged = RolePermission.objects.get(role=self.role, privilege__privilege_name="PRIVILEGE_10")
+        self.assertEqual(unchanged.created_by, "creator")
+        with self.assertNumQueries(2):
+            self.assertEqual(sync_role_privileges(self.role, wanted, "editor"), (0, 0))
+
+    def test_sync_rejects_unknown_privilege(self):
+        with self.assertRaises(InvalidPrivilege):
+            sync_role_privileges(self.role, ["PRIVILEGE_1", "UNKNOWN"], "admin")
+        self.assertEqual(self.names(self.role), set())
+
+    def test_clone_role_copies_privileges(self):
+        sync_role_privileges(self.role, ["PRIVILEGE_1", "PRIVILEGE_2"], "admin")
+        clone = clone_role(self.role, "Cloned Role", created_by="admin")
+        self.assertEqual(self.names(clone), {"PRIVILEGE_1", "PRIVILEGE_2"})
+        self.assertEqual(self.names(self.role), {"PRIVILEGE_1", "PRIVILEGE_2"})
+
+    def test_import_roles_creates_and_updates(self):
+        sync_role_privileges(self.role, ["PRIVILEGE_1"], "admin")
+        roles = import_roles([
+            {"role_name": "Synced Role", "privilege_names": ["PRIVILEGE_2", "PRIVILEGE_3"]},
+            {"role_name": "Imported Role", "role_description": "from file", "privilege_names": ["PRIVILEGE_4"]},
+        ], created_by="importer")
+        self.assertEqual(roles[0].id, self.role.id)
+        self.assertEqual(self.names(self.role), {"PRIVILEGE_2", "PRIVILEGE_3"})
+        self.assertEqual(self.names(roles[1]), {"PRIVILEGE_4"})
+        self.assertEqual(roles[1].role_description, "from file")
+
+
+class ExportJobApiTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        Role.objects.create(role_name="Exported Role", role_description="Role", created_by=self.user.id)
+        self.export_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.export_dir, ignore_errors=True)
+        # render the job inline, a pool thread would not see the test transaction
+        for name, value in (("EXPORT_JOB_WORKERS", 0), ("EXPORT_JOB_DIR", self.export_dir)):
+            patcher = patch(f"acl.export_jobs.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def start_export(self):
+        response = self.client.post(reverse('role_list'), {"export": True, "async_export": True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        return response.data["job_id"]
+
+    def test_async_export_completes_and_downloads(self):
+        job_id = self.start_export()
+        response = self.client.get(reverse('export_job', kwargs={'pk': job_id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], ExportJob.COMPLETED)
+        self.assertEqual(response.data["processed_rows"], response.data["total_rows"])
+
+        response = self.client.get(reverse('export_job_download', kwargs={'pk': job_id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('attachment; filename="EXPORT_ROLE_MANAGEMENT_', response['Content-Disposition'])
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as workbook:
+            self.assertIn("Exported Role", workbook.read("xl/worksheets/sheet1.xml").decode())
+
+    def test_download_pending_job(self):
+        job = ExportJob.objects.create(module_name="ROLE_MANAGEMENT", created_by=self.user.id)
+        response = self.client.get(reverse('export_job_download', kwargs={'pk': job.id}))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_job_of_other_user_not_visible(self):
+        other = User.objects.create_user("other@gmail.com", "test@123")
+        job = ExportJob.objects.create(module_name="ROLE_MANAGEMENT", created_by=self.user.id)
+        self.client.force_authenticate(user=other)
+        response = self.client.get(reverse('export_job', kwargs={'pk': job.id}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_expired_artifacts_are_purged(self):
+        job_id = self.start_export()
+        job = ExportJob.objects.get(id=job_id)
+        self.assertTrue(os.path.exists(job.file_path))
+        ExportJob.objects.filter(id=job_id).update(expires_on=timezone.now() - timedelta(minutes=1))
+        response = self.client.get(reverse('export_job_download', kwargs={'pk': job_id}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(purge_expired_exports(), 1)
+        self.assertFalse(os.path.exists(job.file_path))
+        self.assertFalse(ExportJob.objects.filter(id=job_id).exists())
+
+    def test_failed_export_removes_partial_file(self):
+        def fail(file_path, *args, **kwargs):
+            open(file_path, "wb").close()
+            raise ValueError("render failed")
+
+        with patch("acl.export_jobs.write_queryset_to_excel", side_effect=fail):
+            job = ExportJob.objects.get(id=self.start_export())
+        self.assertEqual(job.status, ExportJob.FAILED)
+        self.assertIsNotNone(job.expires_on)
+        self.assertEqual(os.listdir(self.export_dir), [])
+
+    def test_stale_jobs_are_purged(self):
+        stale = ExportJob.objects.create(module_name="ROLE_MANAGEMENT", status=ExportJob.RUNNING,
+                                         created_by=self.user.id)
+        ExportJob.objects.filter(id=stale.id).update(created_on=timezone.now() - timedelta(days=2))
+        partial_file = os.path.join(self.export_dir, f"{stale.id}.xlsx")
+        open(partial_file, "wb").close()
+        fresh = ExportJob.objects.create(module_name="ROLE_MANAGEMENT", created_by=self.user.id)
+        self.assertEqual(purge_expired_exports(), 1)
+        self.assertFalse(os.path.exists(partial_file))
+        self.assertEqual(list(ExportJob.objects.values_list("id", flat=True)), [fresh.id])
+
+
+class AppConfigurationStartNoTestCase(BaseTestCase):
+    def test_start_no_longer_than_the_number_column_is_rejected(self):
+        response = self.client.post(reverse('appconfiguration_list_create'), {"application_name": "CMS",
+                                                                   "ticket_start_no": "TICKET00001"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("ticket_start_no", response.data["error"])
+        self.assertFalse(AppConfiguration.objects.exists())
+
+
+class RetentionTestCase(TestCase):
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir, ignore_errors=True)
+        for name, value in (("RETENTION_ARCHIVE_DIR", self.archive_dir), ("SOFT_DELETE_RETENTION_DAYS", 30)):
+            patcher = patch(f"acl.retention.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        AppConfiguration.objects.create(application_name="CMS", email_history_days=10, activity_history_days=20)
+        self.now = timezone.now()
+        ticket_type = TicketType.objects.create(name="Issue")
+        department = Department.objects.create(department_name="IT")
+        self.ticket_fields = dict(ticket_status=1, ticket_header="Header", ticket_details="Details", on_behalf=1,
+                                  ticket_category=1, ticket_type=ticket_type, department_id=department,
+                                  project_id=1, ticket_priority=1)
+
+    def email(self, days, status="SENT"):
+        email = EmailOutbox.objects.create(to_email="user@example.com", subject="Subject", html_content="<p/>",
+                                           status=status)
+        EmailOutbox.objects.filter(pk=email.pk).update(created_on=self.now - timedelta(days=days))
+        return email
+
+    def revision(self, ticket, days):
+        revision = TicketRevision.objects.create(ticket_id=ticket, revision_status=1, pti=1, action_taken=self.now,
+                                                 before_revision="a", after_revision="b")
+        TicketRevision.objects.filter(pk=revision.pk).update(created_at=self.now - timedelta(days=days))
+        return revision
+
+    def read_archive(self, prefix):
+        paths = glob.glob(os.path.join(self.archive_dir, f"{prefix}-*.jsonl.gz"))
+        self.assertEqual(len(paths), 1)
+        with gzip.open(paths[0], "rt") as archive:
+            return [json.loads(line) for line in archive]
+
+    def test_purges_expired_rows_in_batches_and_archives_them(self):
+        expired = [self.email(15) for _ in range(5)]
+        kept = [self.email(5), self.email(15, status="PENDING")]
+        ticket = Ticket.objects.create(ticket_no="T1", **self.ticket_fields)
+        old_revision = self.revision(ticket, 25)
+        new_revision = self.revision(ticket, 1)
+
+        counts = purge_expired_history(now=self.now, batch_size=2, throttle=0)
+        self.assertEqual(counts["email_history"], 5)
+        self.assertEqual(counts["activity_history"], 1)
+        self.assertEqual(set(EmailOutbox.objects.values_list("pk", flat=True)), {email.pk for email in kept})
+        self.assertEqual(list(TicketRevision.objects.values_list("pk", flat=True)), [new_revision.pk])
+        self.assertEqual([record["fields"]["id"] for record in self.read_archive("email_history")],
+                         [email.pk for email in expired])
+        self.assertEqual([record["fields"]["id"] for record in self.read_archive("activity_history")],
+                         [old_revision.pk])
+
+    def test_purges_soft_deleted_rows(self):
+        deleted = Ticket.objects.create(ticket_no="T1", is_delete=True, deleted_at=self.now - timedelta(days=40),
+                                        **self.ticket_fields)
+        self.revision(deleted, 1)
+        recent = Ticket.objects.create(ticket_no="T2", is_delete=True, deleted_at=self.now - timedelta(days=5),
+                                       **self.ticket_fields)
+        restored = Ticket.objects.create(ticket_no="T3", is_delete=False, deleted_at=self.now - timedelta(days=40),
+                                         **self.ticket_fields)
+
+        counts = purge_expired_history(now=self.now, throttle=0, archive=False)
+        self.assertEqual(counts["soft_deleted:ticket_management.ticket"], 1)
+        self.assertEqual(set(Ticket.objects.values_list("pk", flat=True)), {recent.pk, restored.pk})
+        self.assertFalse(TicketRevision.objects.exists())
+        self.assertEqual(os.listdir(self.archive_dir), [])
+
+    def test_cascaded_rows_are_archived(self):
+        deleted = Ticket.objects.create(ticket_no="T1", is_delete=True, deleted_at=self.now - timedelta(days=40),
+                                        **self.ticket_fields)
+        revision = self.revision(deleted, 1)
+
+        purge_expired_history(now=self.now, throttle=0)
+        records = {(record["model"], record["fields"]["id"])
+                   for record in self.read_archive("soft_deleted-ticket_management-ticket")}
+        self.assertEqual(records, {("ticket_management.ticket", deleted.pk),
+                                   ("ticket_management.ticketrevision", revision.pk)})
+        self.assertFalse(TicketRevision.objects.exists())
+
+    def test_command(self):
+        self.email(15)
+        out = io.StringIO()
+        call_command("purge_history", "--throttle", "0", stdout=out)
+        self.assertIn("email_history: purged 1 rows", out.getvalue())
+
+
+class NumberSequenceTestCase(TestCase):
+    def setUp(self):
+        reset_number_blocks()
+        self.addCleanup(reset_number_blocks)
+        AppConfiguration.objects.create(application_name="CMS", ticket_start_no="TK000100")
+
+    def test_parse_start_no(self):
+        self.assertEqual(parse_start_no("ticket", "TK000100"), ("TK", 6, 100))
+        self.assertEqual(parse_start_no("ticket", None), ("TKT", 7, 1))
+        self.assertEqual(parse_start_no("client", "C-"), ("C-", 7, 1))
+        # ticket_no holds 10 characters
+        with self.assertRaises(ValueError):
+            parse_start_no("ticket", "TICKET00001")
+
+    def ticket(self, ticket_no):
+        return Ticket.objects.create(ticket_no=ticket_no, ticket_status=1, ticket_header="Header",
+                                     ticket_details="Details", on_behalf=1, ticket_category=1,
+                                     ticket_type=TicketType.objects.create(name="Issue"),
+                                     department_id=Department.objects.create(department_name="IT"), project_id=1,
+                                     ticket_priority=1)
+
+    def test_sequence_starts_above_stored_numbers(self):
+        for ticket_no in ("TK000150", "TK00900", "XTK000900", "TK000149"):
+            self.ticket(ticket_no)
+        self.assertEqual(next_number("ticket", gap_free=True), "TK000151")
+
+    def test_stored_numbers_are_skipped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(next_number("ticket", block_size=5), "TK000100")
+        # supplied by clients after the sequence reserved them
+        self.ticket("TK000101")
+        self.ticket("TK000106")
+        self.assertEqual(next_number("ticket", block_size=5), "TK000102")
+        self.assertEqual(allocate_numbers("ticket", 2), ["TK000105", "TK000107"])
+
+    def test_block_mode_touches_counter_once_per_block(self):
+        # the test transaction holds the block back until it commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(next_number("ticket", block_size=5), "TK000100")
+        self.assertEqual(NumberSequence.objects.get(name="ticket").next_value, 105)
+        # one ticket_no check per number, the counter row isn't touched
+        with self.assertNumQueries(4):
+            numbers = [next_number("ticket", block_size=5) for _ in range(4)]
+        self.assertEqual(numbers, ["TK000101", "TK000102", "TK000103", "TK000104"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(next_number("ticket", block_size=5), "TK000105")
+        self.assertEqual(NumberSequence.objects.get(name="ticket").next_value, 110)
+
+    def test_gap_free_mode_returns_numbers_of_rolled_back_inserts(self):
+        self.assertEqual(next_number("ticket", gap_free=True), "TK000100")
+        try:
+            with transaction.atomic():
+                next_number("ticket", gap_free=True)
+                raise ValueError("insert failed")
+        except ValueError:
+            pass
+        self.assertEqual(next_number("ticket", gap_free=True), "TK000101")
+        self.assertEqual(allocate_numbers("ticket", 3), ["TK000102", "TK000103", "TK000104"])
+        # block mode continues behind the gap-free numbers of the same series
+        self.assertEqual(next_number("ticket"), "TK000105")
+
+    def test_block_reserved_in_a_rolled_back_transaction_is_dropped(self):
+        try:
+            with transaction.atomic():
+                self.assertEqual(next_number("ticket", block_size=5), "TK000100")
+                raise ValueError("insert failed")
+        except ValueError:
+            pass
+        self.assertEqual(next_number("ticket", block_size=5), "TK000100")
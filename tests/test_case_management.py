@@ -0,0 +1,201 @@
+import email
+import email.header
+import json
+import threading
+from unittest.mock import patch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models.deletion import Collector
+from django.test import SimpleTestCase, TestCase
+from rest_framework.exceptions import ValidationError
+
+from acl.models import PrivilegeRegistry
+from case_management.graph_api import GraphMailClient, build_message
+from case_management.mailing import MimeTemplate, send_mail_batch
+from case_management.pagination import CountCachingPaginator, approximate_count, approximate_requested
+from case_management.scheduler import start_periodic_thread
+from case_management.utility import EmailTemplate, get_email_template, render_email, render_emails
+from ticket_management.models import Category
+
+
+class StubGraphHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.calls.append((self.path, self.headers["Authorization"], body))
+        if self.path.endswith("/$batch"):
+            responses = []
+            for item in body["requests"]:
+                address = item["body"]["message"]["toRecipients"][0]["emailAddress"]["address"]
+                if address in self.server.throttle:
+                    self.server.throttle.discard(address)
+                    responses.append({"id": item["id"], "status": 429, "headers": {"Retry-After": "0"}})
+                else:
+                    responses.append({"id": item["id"], "status": 202})
+            payload = json.dumps({"responses": responses}).encode()
+            self.send_response(200)
+        else:
+            payload = b""
+            self.send_response(202)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class GraphMailClientTest(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubGraphHandler)
+        self.server.calls = []
+        self.server.throttle = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.token_calls = 0
+
+        def token_provider():
+            self.token_calls += 1
+            return f"token-{self.token_calls}", 3600
+
+        self.client = GraphMailClient(sender="sender@example.com", token_provider=token_provider,
+                                      base_url=f"http://127.0.0.1:{self.server.server_port}/v1.0")
+        self.addCleanup(self.client.session.close)
+
+    def test_send_reuses_cached_token(self):
+        for _ in range(3):
+            status_code, _ = self.client.send(build_message(["a@example.com"], "body", "subject"))
+            self.assertEqual(status_code, 202)
+        self.assertEqual(self.token_calls, 1)
+        self.assertEqual([call[0] for call in self.server.calls], ["/v1.0/users/sender@example.com/sendMail"] * 3)
+        self.assertTrue(all(call[1] == "Bearer token-1" for call in self.server.calls))
+
+    def test_send_to_each_batches_twenty_messages_per_call(self):
+        recipients = [f"follower{index}@example.com" for index in range(45)]
+        results = self.client.send_to_each(recipients, "Ticket updated", "<p>updated</p>")
+        self.assertEqual(results, [202] * 45)
+        self.assertEqual([len(call[2]["requests"]) for call in self.server.calls], [20, 20, 5])
+
+    def test_throttled_messages_are_retried(self):
+        self.server.throttle = {"follower3@example.com"}
+        results = self.client.send_to_each([f"follower{index}@example.com" for index in range(5)], "s", "b")
+        self.assertEqual(results, [202] * 5)
+        self.assertEqual(len(self.server.calls), 2)
+        retried = self.server.calls[1][2]["requests"]
+        self.assertEqual(len(retried), 1)
+        self.assertEqual(retried[0]["body"]["message"]["toRecipients"][0]["emailAddress"]["address"],
+                         "follower3@example.com")
+
+    def test_expired_token_is_refreshed(self):
+        self.client.send(build_message(["a@example.com"]))
+        self.client._token_expires_at = 0
+        self.client.send(build_message(["a@example.com"]))
+        self.assertEqual(self.token_calls, 2)
+        self.assertEqual(self.server.calls[-1][1], "Bearer token-2")
+
+
+class EmailTemplateTest(SimpleTestCase):
+    def test_render_many_fills_slots(self):
+        template = EmailTemplate("<h1>{{ subject }}</h1><p>{{message}}</p>")
+        self.assertEqual(template.render_many([{"subject": "A", "message": "a"}, {"subject": "B", "message": "b"}]),
+                         ["<h1>A</h1><p>a</p>", "<h1>B</h1><p>b</p>"])
+
+    def test_default_layout_is_compiled_once(self):
+        self.assertIs(get_email_template("default"), get_email_template("default"))
+        html = render_email("Welcome", "Your account is ready")
+        self.assertIn(">Welcome</td>", html)
+        self.assertIn("Your account is ready", html)
+        self.assertEqual(render_emails([("Welcome", "Your account is ready")]), [html])
+
+
+class MimeTemplateTest(SimpleTestCase):
+    def test_build_produces_parsable_message(self):
+        template = MimeTemplate("noreply@example.com")
+        raw = template.build("Réinitialiser", "<p>Olá</p>", ["a@example.com", "b@example.com"])
+        message = email.message_from_bytes(raw)
+        self.assertEqual(str(email.header.make_header(email.header.decode_header(message["Subject"]))),
+                         "Réinitialiser")
+        self.assertEqual(message["To"], "a@example.com, b@example.com")
+        self.assertEqual(message["From"], "noreply@example.com")
+        parts = [part for part in message.walk() if part.get_content_type() == "text/html"]
+        self.assertEqual(parts[0].get_payload(decode=True).decode("utf-8"), "<p>Olá</p>")
+
+    @patch("case_management.mailing.config", side_effect=lambda key: {"EMAIL_PORT": "25"}.get(key, key))
+    @patch("case_management.mailing.smtplib.SMTP")
+    def test_batch_uses_one_session(self, smtp, config):
+        send_mail_batch([("Subject", "<p>body</p>", f"user{index}@example.com") for index in range(3)])
+        self.assertEqual(smtp.call_count, 1)
+        self.assertEqual(smtp.return_value.sendmail.call_count, 3)
+        smtp.return_value.quit.assert_called_once()
+
+
+class CountCachingPaginatorTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        for index in range(5):
+            Category.objects.create(name=f"Category {index}")
+
+    def test_count_runs_once_and_is_reused(self):
+        queryset = Category.objects.filter(name__startswith="Category")
+        paginator = CountCachingPaginator(queryset, 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(paginator.num_pages, 3)
+            self.assertEqual(paginator.count, 5)
+        # same filter in a later request, ordering doesn't change the signature
+        with self.assertNumQueries(0):
+            self.assertEqual(CountCachingPaginator(queryset.order_by("-name"), 2).count, 5)
+
+    def test_write_invalidates_cached_count(self):
+        queryset = Category.objects.filter(name__startswith="Category")
+        self.assertEqual(CountCachingPaginator(queryset, 2).count, 5)
+        Category.objects.create(name="Category 5")
+        self.assertEqual(CountCachingPaginator(queryset, 2).count, 6)
+        Category.objects.filter(name="Category 0").delete()
+        self.assertEqual(CountCachingPaginator(queryset, 2).count, 5)
+
+    def test_only_paginated_models_are_tracked(self):
+        self.assertFalse(Collector("default").can_fast_delete(Category.objects.all()))
+        self.assertTrue(Collector("default").can_fast_delete(PrivilegeRegistry.objects.all()))
+        # a count reading an untracked table isn't cached
+        PrivilegeRegistry.objects.create(name="registry", digest="0", privilege_count=0)
+        queryset = PrivilegeRegistry.objects.filter(name="registry").order_by("id")
+        with self.assertNumQueries(2):
+            self.assertEqual(CountCachingPaginator(queryset, 2).count, 1)
+            self.assertEqual(CountCachingPaginator(queryset, 2).count, 1)
+
+    def test_approximate_count_uses_table_statistics(self):
+        self.assertIsNone(approximate_count(Category.objects.filter(name="Category 1")))
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.assertEqual(approximate_count(Category.objects.all()), 5)
+        with self.assertNumQueries(1):
+            self.assertEqual(CountCachingPaginator(Category.objects.all(), 2, approximate=True).count, 5)
+
+    def test_approximate_flag_is_parsed_as_boolean(self):
+        for value in ("false", "False", "0", 0, False):
+            self.assertIs(approximate_requested({"approximate_count": value}), False)
+        for value in ("true", "1", 1, True):
+            self.assertIs(approximate_requested({"approximate_count": value}), True)
+        self.assertIs(approximate_requested({}), False)
+        with self.assertRaises(ValidationError):
+            approximate_requested({"approximate_count": "maybe"})
+
+
+class PeriodicThreadTest(SimpleTestCase):
+    def test_task_runs_until_stopped_and_survives_errors(self):
+        calls = []
+        done = threading.Event()
+
+        def task():
+            calls.append(1)
+            if len(calls) == 3:
+                done.set()
+            raise ValueError("task failed")
+
+        with self.assertLogs("CMS", level="ERROR"):
+            stop = start_periodic_thread("test-periodic", task, 0.01)
+            self.assertTrue(done.wait(5))
+            stop.set()
+        self.assertGreaterEqual(len(calls), 3)
@@ -4,10 +4,27 @@ from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 from django.contrib.auth import get_user_model
 from ticket_management.models import Category, TicketType, Department, Priority, SLA, ProjectManagement, UserDepartment, \
-    Status, Ticket, TicketBehalf, TicketRevision, TicketFollower
+    Status, Ticket, TicketBehalf, TicketRevision, TicketFollower, TicketAutoCloseSweep, SLABreachSweep
+from ticket_management.serializers import StatusReadSerializer, TicketUpdateSerializer
+from ticket_management.sla import get_sla_matrix
+from ticket_management.breach import overdue_tickets, sla_breached, sweep_breaches
+from ticket_management.auto_close import sweep_auto_close
+from acl.sequences import allocate_numbers, reset_number_blocks
+from case_management.pagination import get_table_version
+from ticket_management.sla_clock import BusinessCalendar, ticket_sla_remaining
+from user_management.models import EmailOutbox
+from acl.models import AppConfiguration
 import uuid
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import BytesIO, StringIO
+from django.core.files.uploadedfile import SimpleUploadedFile
+import xlsxwriter
+import zipfile
+from django.core.management import call_command
 from django.utils import timezone
+from django.db import DatabaseError
+from unittest.mock import patch
+import numpy as np
 
 User = get_user_model()
 
@@ -932,6 +949,32 @@ class StatusApiTests(BaseTestCase):
         self.assertEqual(len(response.data['results']), 1)
 
 
+class StatusReadSerializerUserNameTest(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_user = User.objects.create_user("names@gmail.com", "test@123", first_name="Jane",
+                                                   last_name="Doe")
+        for index in range(10):
+            Status.objects.create(name=f"Status {index}", status_code=index, color_code="#FFFFFF", highlight=1,
+                                  created_by=self.user, updated_by=self.other_user)
+
+    def test_list_resolves_user_names_in_one_query(self):
+        queryset = Status.objects.order_by('id')
+        # one query for the statuses and one for every referenced user
+        with self.assertNumQueries(2):
+            data = StatusReadSerializer(queryset, many=True).data
+        self.assertEqual(len(data), 10)
+        self.assertEqual(data[0]['updated_by'], "Jane Doe")
+        self.assertEqual(data[0]['created_by'], f"{self.user.first_name} {self.user.last_name or ''}".strip())
+
+    def test_single_object_without_users(self):
+        instance = Status.objects.create(name="Unassigned", status_code=99, color_code="#FFFFFF", highlight=1)
+        with self.assertNumQueries(0):
+            data = StatusReadSerializer(instance).data
+        self.assertIsNone(data['created_by'])
+        self.assertIsNone(data['updated_by'])
+
+
 class UserDepartmentApiTest(BaseTestCase):
 
     def setUp(self):
@@ -1071,6 +1114,17 @@ class TicketAPITest(BaseTestCase):
         self.assertEqual(Ticket.objects.count(), 1)
         self.assertEqual(Ticket.objects.get().ticket_no, 'T123')
 
+    def test_create_ticket_with_taken_number(self):
+        Ticket.objects.create(ticket_no='T123', ticket_status=1, ticket_header='Header', ticket_details='Details',
+                              on_behalf=1, ticket_category=1, ticket_type=self.ticket_type,
+                              department_id=self.department, project_id=1, ticket_priority=1)
+        data = {'ticket_no': 'T123', 'ticket_status': 1, 'ticket_header': 'Header', 'ticket_details': 'Details',
+                'on_behalf': 1, 'ticket_category': 1, 'ticket_type': self.ticket_type.id,
+                'department_id': self.department.id, 'project_id': 1, 'ticket_priority': 1}
+        response = self.client.post(reverse('ticket_create'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Ticket.objects.count(), 1)
+
     def test_filter_ticket_success(self):
         # First created a ticket
         url = reverse('ticket_create')
@@ -1368,6 +1422,491 @@ class TicketAPITest(BaseTestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
 
+class TicketImportTest(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        reset_number_blocks()
+        self.addCleanup(reset_number_blocks)
+        self.ticket_type = TicketType.objects.create(name='Issue')
+        self.department = Department.objects.create(department_name='IT')
+        self.priority = Priority.objects.create(name='High', level='1')
+        self.status = Status.objects.create(name='Open', color_code='#fff')
+        SLA.objects.create(department=self.department, ticket_type=None, priority=None,
+                           response_time=timedelta(hours=1), resolution_time=timedelta(hours=4))
+        self.header = ['Ticket_No', 'Status', 'Ticket_Header', 'Ticket_Details', 'On_Behalf', 'Ticket_Category',
+                       'Ticket_Type', 'Department', 'Project_ID', 'Priority']
+        self.rows = [
+            ['OLD-1', 'Open', 'Printer', 'Out of toner', '1', '2', 'Issue', 'IT', '5', 'High'],
+            ['', str(self.status.id), 'VPN', 'No access', '1', '2', str(self.ticket_type.id), str(self.department.id),
+             '5', str(self.priority.id)],
+            ['', 'Closed', 'Broken', 'Bad row', 'x', '2', 'Issue', 'Finance', '5', 'High'],
+            ['', '', '', '', '', '', '', '', '', ''],
+        ]
+
+    def upload_csv(self, rows, **data):
+        content = '\n'.join(','.join(row) for row in [self.header] + rows).encode()
+        data['file'] = SimpleUploadedFile('tickets.csv', content, content_type='text/csv')
+        return self.client.post(reverse('ticket_import'), data, format='multipart')
+
+    def test_csv_import_reports_rejected_rows(self):
+        response = self.upload_csv(self.rows)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_rows'], 3)
+        self.assertEqual(response.data['imported'], 2)
+        self.assertEqual(response.data['failed'], 1)
+        self.assertEqual(response.data['errors'][0]['row'], 4)
+        self.assertEqual(set(response.data['errors'][0]['errors']), {'ticket_status', 'on_behalf', 'department_id'})
+
+        old = Ticket.objects.get(ticket_no='OLD-1')
+        self.assertEqual((old.ticket_status, old.ticket_priority, old.department_id_id),
+                         (self.status.id, self.priority.id, self.department.id))
+        self.assertEqual(old.created_by, self.user)
+        self.assertEqual(old.resolution_within - old.response_within, timedelta(hours=3))
+        self.assertTrue(Ticket.objects.filter(ticket_no='TKT0000001', ticket_header='VPN').exists())
+
+    def test_dry_run_inserts_nothing(self):
+        response = self.upload_csv(self.rows, dry_run='true')
+        self.assertEqual(response.data['imported'], 2)
+        self.assertFalse(Ticket.objects.exists())
+
+    def test_xlsx_import(self):
+        content = BytesIO()
+        workbook = xlsxwriter.Workbook(content)
+        sheet = workbook.add_worksheet()
+        for index, row in enumerate([self.header] + self.rows[:1]):
+            sheet.write_row(index, 0, row)
+        sheet.write_number(2, 0, 1234)
+        sheet.write_row(2, 1, ['Open', 'Mail', 'Bounced'])
+        sheet.write_number(2, 4, 1)
+        sheet.write_number(2, 5, 3)
+        sheet.write_row(2, 6, ['Issue', 'IT'])
+        sheet.write_number(2, 8, 5)
+        sheet.write(2, 9, 'High')
+        workbook.close()
+        upload = SimpleUploadedFile('tickets.xlsx', content.getvalue())
+        response = self.client.post(reverse('ticket_import'), {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['imported'], response.data['failed']), (2, 0))
+        self.assertEqual(Ticket.objects.get(ticket_no='1234').ticket_category, 3)
+
+    def test_undecodable_file_is_reported(self):
+        content = '\n'.join(','.join(row) for row in [self.header] + self.rows[:2]).encode() + b'\n\xff\xfe,bad\n'
+        upload = SimpleUploadedFile('tickets.csv', content, content_type='text/csv')
+        response = self.client.post(reverse('ticket_import'), {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('could not be read', response.data['fatal']['error'])
+        self.assertEqual(response.data['imported'], Ticket.objects.count())
+
+    def test_corrupt_workbook(self):
+        content = BytesIO()
+        with zipfile.ZipFile(content, 'w') as archive:
+            archive.writestr('xl/worksheets/sheet1.xml', '<worksheet><sheetData><row')
+        upload = SimpleUploadedFile('tickets.xlsx', content.getvalue())
+        response = self.client.post(reverse('ticket_import'), {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('could not be read', response.data['fatal']['error'])
+
+    def test_import_drops_cached_counts(self):
+        version = get_table_version(Ticket._meta.db_table)
+        self.upload_csv(self.rows)
+        self.assertNotEqual(get_table_version(Ticket._meta.db_table), version)
+
+    def test_exhausted_number_series_stops_the_import(self):
+        AppConfiguration.objects.create(application_name='CMS', ticket_start_no='TKT9999999')
+        response = self.upload_csv([self.rows[1], self.rows[1]])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['imported'], 0)
+        self.assertIn('exhausted', response.data['fatal']['error'])
+        self.assertFalse(Ticket.objects.exists())
+        # the reservation was rolled back
+        self.assertEqual(allocate_numbers('ticket', 1), ['TKT9999999'])
+
+    def test_duplicate_ticket_numbers_are_rejected(self):
+        self.upload_csv(self.rows[:1])
+        taken = ['TKT0000001'] + self.rows[1][1:]
+        response = self.upload_csv([self.rows[0], taken, self.rows[1], taken])
+        self.assertEqual((response.data['imported'], response.data['failed']), (2, 2))
+        self.assertEqual([error['row'] for error in response.data['errors']], [2, 5])
+        self.assertEqual(response.data['errors'][0]['errors'], {'ticket_no': 'Ticket number already exists.'})
+        self.assertEqual(Ticket.objects.filter(ticket_no='OLD-1').count(), 1)
+        # the allocated number skips the one supplied by the same batch
+        self.assertEqual(set(Ticket.objects.values_list('ticket_no', flat=True)), {'OLD-1', 'TKT0000001', 'TKT0000002'})
+
+    def test_unsupported_file(self):
+        upload = SimpleUploadedFile('tickets.txt', b'hello')
+        response = self.client.post(reverse('ticket_import'), {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TicketCursorPaginationTest(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.ticket_type = TicketType.objects.create(name='Issue')
+        self.department = Department.objects.create(department_name='IT')
+        for index in range(5):
+            Ticket.objects.create(ticket_no=f'T{index}', ticket_status=1, ticket_header='Header',
+                                  ticket_details='Details', on_behalf=1, ticket_category=1,
+                                  ticket_type=self.ticket_type, department_id=self.department, project_id=1,
+                                  ticket_priority=index % 2)
+
+    def walk(self, payload):
+        url = reverse('ticket_filter')
+        seen = []
+        cursor = ""
+        while cursor is not None:
+            response = self.client.post(url, {**payload, 'cursor': cursor, 'per_page': 2}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            seen.extend(ticket['id'] for ticket in response.data['results'])
+            cursor = response.data['next_cursor']
+        return seen
+
+    def test_cursor_walks_every_ticket_once(self):
+        seen = self.walk({})
+        self.assertEqual(seen, list(Ticket.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_cursor_follows_order_by(self):
+        seen = self.walk({'order_by': 'ticket_priority', 'order_type': 'desc'})
+        expected = Ticket.objects.order_by('-ticket_priority', '-id').values_list('id', flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_cursor_on_datetime_column(self):
+        seen = self.walk({'order_by': 'created_at'})
+        expected = Ticket.objects.order_by('created_at', 'id').values_list('id', flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_cursor_rejected_for_other_ordering(self):
+        url = reverse('ticket_filter')
+        response = self.client.post(url, {'cursor': '', 'per_page': 2}, format='json')
+        next_cursor = response.data['next_cursor']
+        response = self.client.post(url, {'cursor': next_cursor, 'per_page': 2, 'order_by': 'created_at'},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_cursor(self):
+        url = reverse('ticket_filter')
+        response = self.client.post(url, {'cursor': 'not-a-cursor'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['message'], 'Invalid cursor')
+
+
+class TicketIndexTest(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.ticket_type = TicketType.objects.create(name='Issue')
+        self.department = Department.objects.create(department_name='IT')
+        for ticket_no in ('TKT001', 'TKT002', 'TKT010', 'XTKT01'):
+            Ticket.objects.create(ticket_no=ticket_no, ticket_status=1, ticket_header='Header',
+                                  ticket_details='Details', on_behalf=1, ticket_category=1,
+                                  ticket_type=self.ticket_type, department_id=self.department, project_id=1,
+                                  ticket_priority=1)
+
+    def test_ticket_no_prefix_match(self):
+        url = reverse('ticket_filter')
+        response = self.client.post(url, {'ticket_no': 'TKT00', 'ticket_no_match': 'prefix'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(ticket['ticket_no'] for ticket in response.data['results']), ['TKT001', 'TKT002'])
+        response = self.client.post(url, {'ticket_no': 'tkt00', 'ticket_no_match': 'prefix'}, format='json')
+        self.assertEqual(sorted(ticket['ticket_no'] for ticket in response.data['results']), ['TKT001', 'TKT002'])
+        # contains stays the default
+        response = self.client.post(url, {'ticket_no': 'TKT01'}, format='json')
+        self.assertEqual(sorted(ticket['ticket_no'] for ticket in response.data['results']), ['TKT010', 'XTKT01'])
+
+    def test_filter_queries_use_indexes(self):
+        out = StringIO()
+        call_command('benchmark_ticket_queries', rows=500, batch_size=250, runs=1, stdout=out)
+        self.assertNotIn('DOES NOT USE', out.getvalue())
+        self.assertIn('uses ticket_status_created_idx', out.getvalue())
+
+
+class SLAMatrixTest(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.ticket_type = TicketType.objects.create(name='Issue')
+        self.other_type = TicketType.objects.create(name='Request')
+        self.department = Department.objects.create(department_name='IT')
+        self.priority = Priority.objects.create(name='High', level='1')
+        SLA.objects.create(department=self.department, ticket_type=self.ticket_type, priority=self.priority,
+                           response_time=timedelta(hours=1), resolution_time=timedelta(hours=4))
+        SLA.objects.create(department=self.department, ticket_type=None, priority=None,
+                           response_time=timedelta(hours=8), resolution_time=timedelta(days=2))
+        SLA.objects.create(department=None, ticket_type=None, priority=None,
+                           response_time=timedelta(days=1), resolution_time=timedelta(days=5))
+
+    def ticket_data(self, ticket_type, priority):
+        return {'ticket_no': 'T123', 'ticket_status': 1, 'ticket_header': 'Header', 'ticket_details': 'Details',
+                'on_behalf': 1, 'ticket_category': 1, 'ticket_type': ticket_type.id,
+                'department_id': self.department.id, 'project_id': 1, 'ticket_priority': priority}
+
+    def test_resolve_falls_back_to_wildcards(self):
+        matrix = get_sla_matrix()
+        self.assertEqual(matrix.resolve(self.department.id, self.ticket_type.id, self.priority.id),
+                         (timedelta(hours=1), timedelta(hours=4)))
+        self.assertEqual(matrix.resolve(self.department.id, self.other_type.id, self.priority.id),
+                         (timedelta(hours=8), timedelta(days=2)))
+        self.assertEqual(matrix.resolve(0, self.other_type.id, self.priority.id),
+                         (timedelta(days=1), timedelta(days=5)))
+        with self.assertNumQueries(0):
+            get_sla_matrix()
+
+    def test_matrix_reloaded_after_sla_change(self):
+        get_sla_matrix()
+        SLA.objects.filter(department=None).delete()
+        self.assertIsNone(get_sla_matrix().resolve(0, self.other_type.id, self.priority.id))
+
+    def test_ticket_create_and_update_fill_deadlines(self):
+        get_sla_matrix()
+        response = self.client.post(reverse('ticket_create'), self.ticket_data(self.ticket_type, self.priority.id),
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        ticket = Ticket.objects.get()
+        self.assertAlmostEqual(ticket.response_within, ticket.created_at + timedelta(hours=1),
+                               delta=timedelta(seconds=5))
+        self.assertAlmostEqual(ticket.resolution_within, ticket.created_at + timedelta(hours=4),
+                               delta=timedelta(seconds=5))
+        response = self.client.patch(reverse('ticket_detail', args=[ticket.id]),
+                                     {'ticket_type': str(self.other_type.id)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.response_within, ticket.created_at + timedelta(hours=8))
+        self.assertEqual(ticket.resolution_within, ticket.created_at + timedelta(days=2))
+
+    def test_ticket_create_allocates_ticket_no(self):
+        reset_number_blocks()
+        self.addCleanup(reset_number_blocks)
+        data = self.ticket_data(self.ticket_type, self.priority.id)
+        del data['ticket_no']
+        numbers = []
+        for _ in range(2):
+            # the test transaction holds the number block back until it commits
+            with self.captureOnCommitCallbacks(execute=True):
+                numbers.append(self.client.post(reverse('ticket_create'), data, format='json').json()['ticket_no'])
+        self.assertEqual(numbers, ['TKT0000001', 'TKT0000002'])
+
+    def test_wildcard_sla_can_be_created(self):
+        response = self.client.post(reverse('sla_create'), {
+            'department': None, 'ticket_type': self.ticket_type.id, 'priority': None,
+            'response_time': '2:00:00', 'resolution_time': '6:00:00'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(get_sla_matrix().resolve(0, self.ticket_type.id, 0),
+                         (timedelta(hours=2), timedelta(hours=6)))
+
+
+class SLABreachSweepTest(TestCase):
+
+    def setUp(self):
+        self.assignee = User.objects.create_user(email='agent@example.com', password='password')
+        self.ticket_type = TicketType.objects.create(name='Issue')
+        self.department = Department.objects.create(department_name='IT')
+        self.now = timezone.now()
+
+    def ticket(self, ticket_no, **fields):
+        return Ticket.objects.create(ticket_no=ticket_no, ticket_status=1, ticket_header='Header',
+                                     ticket_details='Details', on_behalf=1, ticket_category=1,
+                                     ticket_type=self.ticket_type, department_id=self.department, project_id=1,
+                                     ticket_priority=1, assigned_to=self.assignee, **fields)
+
+    def test_sweep_marks_missed_deadlines_once(self):
+        late = self.ticket('T1', response_within=self.now - timedelta(hours=2),
+                           resolution_within=self.now - timedelta(hours=1))
+        answered = self.ticket('T2', response_within=self.now - timedelta(hours=2),
+                               response_at=self.now - timedelta(hours=3))
+        answered_late = self.ticket('T3', response_within=self.now - timedelta(hours=2),
+                                    response_at=self.now - timedelta(hours=1))
+        closed = self.ticket('T4', resolution_within=self.now - timedelta(hours=1),
+                             closed_at=self.now - timedelta(hours=2))
+        future = self.ticket('T5', response_within=self.now + timedelta(hours=1))
+
+        self.assertEqual(sweep_breaches(now=self.now, batch_size=1), {'response': 2, 'resolution': 1})
+        late.refresh_from_db()
+        self.assertEqual(late.response_breach, 'BREACHED')
+        self.assertEqual(late.response_breach_time, self.now - timedelta(hours=2))
+        self.assertEqual(late.resolution_breach, 'BREACHED')
+        for ticket in (answered, closed, future):
+            ticket.refresh_from_db()
+            self.assertIsNone(ticket.response_breach)
+            self.assertIsNone(ticket.resolution_breach)
+        answered_late.refresh_from_db()
+        self.assertEqual(answered_late.response_breach, 'BREACHED')
+        self.assertEqual(EmailOutbox.objects.filter(to_email='agent@example.com').count(), 3)
+
+        self.assertEqual(sweep_breaches(now=self.now + timedelta(minutes=1)), {'response': 0, 'resolution': 0})
+        self.assertEqual(EmailOutbox.objects.count(), 3)
+
+    def test_later_sweeps_only_scan_the_new_window(self):
+        sweep_breaches(now=self.now)
+        # a deadline from before the last window is not looked at again
+        self.ticket('T1', response_within=self.now - timedelta(days=1))
+        due = self.ticket('T2', response_within=self.now + timedelta(minutes=30))
+        self.assertEqual(sweep_breaches(now=self.now + timedelta(hours=1), notify=False),
+                         {'response': 1, 'resolution': 0})
+        due.refresh_from_db()
+        self.assertEqual(due.response_breach, 'BREACHED')
+        self.assertFalse(EmailOutbox.objects.exists())
+
+    def test_deadline_moved_behind_the_watermark_is_marked(self):
+        ticket = self.ticket('T1', resolution_within=self.now + timedelta(days=1))
+        sweep_breaches(now=self.now)
+        serializer = TicketUpdateSerializer(ticket, data={'resolution_within': self.now - timedelta(days=1)},
+                                            partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.assertEqual(sweep_breaches(now=self.now + timedelta(minutes=1), notify=False),
+                         {'response': 0, 'resolution': 1})
+
+    def test_failed_batch_keeps_the_committed_ones(self):
+        first = self.ticket('T1', response_within=self.now - timedelta(hours=2))
+        second = self.ticket('T2', response_within=self.now - timedelta(hours=1))
+        received = []
+        sla_breached.connect(lambda sender, ticket_ids, **kwargs: received.append(ticket_ids),
+                             dispatch_uid='test_breach_batches', weak=False)
+        self.addCleanup(sla_breached.disconnect, dispatch_uid='test_breach_batches')
+        with patch('ticket_management.breach.queue_emails', side_effect=[None, DatabaseError]):
+            with self.assertRaises(DatabaseError):
+                sweep_breaches(now=self.now, batch_size=1)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.response_breach, second.response_breach), ('BREACHED', None))
+        self.assertEqual(received, [[first.id]])
+        sweep = SLABreachSweep.objects.get()
+        self.assertEqual((sweep.swept_until, sweep.breaches), (None, 1))
+
+        self.assertEqual(sweep_breaches(now=self.now, batch_size=1), {'response': 1, 'resolution': 0})
+        self.assertEqual(received, [[first.id], [second.id]])
+        self.assertEqual(SLABreachSweep.objects.get().swept_until, self.now)
+
+    def test_overdue_query_uses_due_index(self):
+        plan = overdue_tickets('response', self.now - timedelta(hours=1), self.now).explain()
+        self.assertIn('ticket_response_due_idx', plan)
+
+    def test_command(self):
+        self.ticket('T1', response_within=self.now - timedelta(hours=2))
+        out = StringIO()
+        call_command('scan_sla_breaches', stdout=out)
+        self.assertIn('Marked 1 response and 0 resolution breaches', out.getvalue())
+
+
+class SLAClockTest(TestCase):
+
+    def setUp(self):
+        # 2026-10-19 is a Monday, the 21st a holiday
+        self.calendar = BusinessCalendar(workday_start='09:00', workday_end='18:00', holidays=['2026-10-21'],
+                                         tz='UTC')
+        self.ticket_type = TicketType.objects.create(name='Issue')
+        self.department = Department.objects.create(department_name='IT')
+        SLA.objects.create(department=self.department, ticket_type=None, priority=None,
+                           response_time=timedelta(hours=4), resolution_time=timedelta(hours=18))
+
+    def moment(self, day, hour):
+        return datetime(2026, 10, day, hour, tzinfo=dt_timezone.utc)
+
+    def test_elapsed_skips_nights_weekends_and_holidays(self):
+        starts = np.array(['2026-10-19T10:00', '2026-10-16T17:00', '2026-10-20T10:00', '2026-10-24T10:00'],
+                          dtype='datetime64[s]')
+        ends = np.array(['2026-10-20T10:00', '2026-10-19T10:00', '2026-10-22T10:00', '2026-10-25T10:00'],
+                        dtype='datetime64[s]')
+        self.assertEqual(list(self.calendar.elapsed(starts, ends) // 3600), [9, 2, 9, 0])
+
+    def test_elapsed_pauses_on_hold(self):
+        starts = np.array(['2026-10-19T10:00'] * 3, dtype='datetime64[s]')
+        ends = np.array(['2026-10-20T10:00'] * 3, dtype='datetime64[s]')
+        hold_from = np.array(['2026-10-19T12:00', 'NaT', '2026-10-19T17:00'], dtype='datetime64[s]')
+        hold_to = np.array(['2026-10-19T14:00', 'NaT', 'NaT'], dtype='datetime64[s]')
+        self.assertEqual(list(self.calendar.elapsed(starts, ends, hold_from, hold_to) // 3600), [7, 9, 7])
+
+    def test_local_time_follows_dst(self):
+        calendar = BusinessCalendar(tz='Europe/Berlin')
+        local = calendar.to_datetime64([datetime(2026, 10, 24, 23, tzinfo=dt_timezone.utc),
+                                        datetime(2026, 10, 25, 2, tzinfo=dt_timezone.utc), None])
+        self.assertEqual(str(local[0]), '2026-10-25T01:00:00')
+        self.assertEqual(str(local[1]), '2026-10-25T03:00:00')
+        self.assertTrue(np.isnat(local[2]))
+
+    def test_ticket_sla_remaining(self):
+        fields = dict(ticket_status=1, ticket_header='Header', ticket_details='Details', on_behalf=1,
+                      ticket_category=1, ticket_type=self.ticket_type, department_id=self.department,
+                      project_id=1, ticket_priority=1)
+        open_ticket = Ticket.objects.create(ticket_no='T1', hold_from=self.moment(19, 12),
+                                            hold_to=self.moment(19, 14), **fields)
+        answered = Ticket.objects.create(ticket_no='T2', response_at=self.moment(19, 11), **fields)
+        Ticket.objects.filter(pk__in=[open_ticket.pk, answered.pk]).update(created_at=self.moment(19, 10))
+
+        ids, remaining = ticket_sla_remaining(Ticket.objects.all(), 'response', now=self.moment(20, 10),
+                                              calendar=self.calendar)
+        remaining = dict(zip(ids.tolist(), (remaining // 3600).tolist()))
+        self.assertEqual(remaining, {open_ticket.pk: -3, answered.pk: 3})
+
+
+class TicketAutoCloseTest(TestCase):
+
+    def setUp(self):
+        self.creator = User.objects.create_user(email='requester@example.com', password='password')
+        self.ticket_type = TicketType.objects.create(name='Issue')
+        self.department = Department.objects.create(department_name='IT')
+        self.now = timezone.now()
+        AppConfiguration.objects.create(application_name='CMS', ticket_auto_close_days=7, auto_notification_hours=24)
+
+    def ticket(self, ticket_no, **fields):
+        return Ticket.objects.create(ticket_no=ticket_no, ticket_status=1, ticket_header='Header',
+                                     ticket_details='Details', on_behalf=1, ticket_category=1,
+                                     ticket_type=self.ticket_type, department_id=self.department, project_id=1,
+                                     ticket_priority=1, created_by=self.creator, **fields)
+
+    def test_sweep_closes_old_and_reminds_recent(self):
+        old = [self.ticket(f'T{i}', resolution_at=self.now - timedelta(days=8, hours=i)) for i in range(5)]
+        recent = self.ticket('T5', resolution_at=self.now - timedelta(days=2))
+        fresh = self.ticket('T6', resolution_at=self.now - timedelta(hours=2))
+        unresolved = self.ticket('T7')
+
+        self.assertEqual(sweep_auto_close(now=self.now, batch_size=2), {'closed': 5, 'reminded': 1})
+        self.assertEqual(Ticket.objects.filter(pk__in=[ticket.pk for ticket in old], closed_at=self.now).count(), 5)
+        for ticket in (recent, fresh, unresolved):
+            ticket.refresh_from_db()
+            self.assertIsNone(ticket.closed_at)
+        self.assertEqual(recent.auto_close_reminded_at, self.now)
+        self.assertIsNone(fresh.auto_close_reminded_at)
+        self.assertEqual(EmailOutbox.objects.filter(to_email='requester@example.com').count(), 1)
+        sweep = TicketAutoCloseSweep.objects.get()
+        # a finished sweep leaves no checkpoint behind
+        self.assertIsNone(sweep.resolved_until)
+        self.assertEqual((sweep.closed, sweep.reminded), (5, 1))
+
+        # the next reminder waits for auto_notification_hours
+        self.assertEqual(sweep_auto_close(now=self.now + timedelta(hours=1)), {'closed': 0, 'reminded': 0})
+        self.assertEqual(sweep_auto_close(now=self.now + timedelta(hours=25)), {'closed': 0, 'reminded': 2})
+
+    def test_sweep_resumes_from_checkpoint(self):
+        # left by a sweep that died after closing everything up to it
+        TicketAutoCloseSweep.objects.create(name='ticket_auto_close', resolved_until=self.now - timedelta(days=10))
+        reopened = self.ticket('T1', resolution_at=self.now - timedelta(days=30))
+        behind = self.ticket('T2', resolution_at=self.now - timedelta(days=9))
+        self.assertEqual(sweep_auto_close(now=self.now)['closed'], 1)
+        behind.refresh_from_db()
+        self.assertEqual(behind.closed_at, self.now)
+        self.assertIsNone(TicketAutoCloseSweep.objects.get().resolved_until)
+        # the next sweep starts from the beginning and finds the ticket behind the old checkpoint
+        self.assertEqual(sweep_auto_close(now=self.now + timedelta(minutes=1))['closed'], 1)
+        reopened.refresh_from_db()
+        self.assertEqual(reopened.closed_at, self.now + timedelta(minutes=1))
+
+    def test_reopened_ticket_is_closed_again(self):
+        ticket = self.ticket('T1', resolution_at=self.now - timedelta(days=30))
+        self.assertEqual(sweep_auto_close(now=self.now)['closed'], 1)
+        Ticket.objects.filter(pk=ticket.pk).update(closed_at=None)
+        self.ticket('T2', resolution_at=self.now - timedelta(days=8))
+        self.assertEqual(sweep_auto_close(now=self.now + timedelta(minutes=1))['closed'], 2)
+
+    def test_command(self):
+        self.ticket('T1', resolution_at=self.now - timedelta(days=8))
+        out = StringIO()
+        call_command('auto_close_tickets', stdout=out)
+        self.assertIn('Closed 1 and reminded 0 resolved tickets', out.getvalue())
+
+
 class TicketBehalfCreateAPITest(BaseTestCase):
 
     def setUp(self):
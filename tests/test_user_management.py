@@ -2,11 +2,28 @@ from django.test import TestCase
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+from case_management.custom_authentication import get_user_version
 from django.contrib.auth import get_user_model
-from user_management.models import CustomUser
-from acl.models import UserRole, Role
+from user_management.models import CustomUser, EmailOutbox
+from user_management.outbox import queue_email, drain_outbox, outbox_metrics, EMAIL_OUTBOX_MAX_ATTEMPTS
+from django.core import mail
+from django.core.mail import get_connection
+from django.utils import timezone
+from acl.models import UserRole, Role, RolePermission, MasterPrivilege
 from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test.utils import CaptureQueriesContext
 from unittest.mock import patch
+from acl.export_excel import write_queryset_to_excel
+from user_management.serializers import UserReadSerializer
+from user_management.directory import DIRECTORY_VERSION_KEY, UserDirectory
+from user_management.hashers import ConfigurablePBKDF2PasswordHasher
+from user_management.login import LOGIN_RATE_LIMIT_EMAIL, LOGIN_RATE_LIMIT_WINDOW, flush_last_logins
+import gzip
+import io
+import json
+import zipfile
 
 User = get_user_model()
 
@@ -165,6 +182,64 @@ class UserLoginTestCase(BaseTestCase):
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_login_rate_limited_before_hashing(self):
+        cache.clear()
+        url = reverse('user-login')
+        for _ in range(LOGIN_RATE_LIMIT_EMAIL):
+            response = self.client.post(url, {'email': "test@gmail.com", 'password': "wrong@123"}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with patch.object(CustomUser, "check_password") as check_password:
+            response = self.client.post(url, {'email': "test@gmail.com", 'password': "test@123"}, format='json')
+            check_password.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response["Retry-After"], str(LOGIN_RATE_LIMIT_WINDOW))
+        response = self.client.post(reverse('token_obtain_pair'), {'email': "test@gmail.com", 'password': "test@123"},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        # other accounts are still served
+        response = self.client.post(reverse('token_obtain_pair'), {'email': "other@gmail.com", 'password': "x"},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        cache.clear()
+
+    def test_login_rehashes_to_configured_cost(self):
+        url = reverse('user-login')
+        with patch.object(ConfigurablePBKDF2PasswordHasher, "iterations", 1000):
+            response = self.client.post(url, {'email': "test@gmail.com", 'password': "test@123"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$1000$"))
+        self.assertTrue(self.user.check_password("test@123"))
+
+    def test_last_login_written_in_batches(self):
+        flush_last_logins()
+        User.objects.filter(pk=self.user.pk).update(last_login=None)
+        other = User.objects.create_user(email="batch@gmail.com", password="test@123", is_active=True)
+        url = reverse('user-login')
+        for email in ("test@gmail.com", "batch@gmail.com"):
+            response = self.client.post(url, {'email': email, 'password': "test@123"}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(User.objects.filter(pk__in=[self.user.pk, other.pk], last_login__isnull=False).exists())
+        with self.assertNumQueries(1):
+            self.assertEqual(flush_last_logins(), 2)
+        self.assertEqual(User.objects.filter(pk__in=[self.user.pk, other.pk], last_login__isnull=False).count(), 2)
+
+    def test_failed_last_login_flush_keeps_the_login(self):
+        flush_last_logins()
+        User.objects.filter(pk=self.user.pk).update(last_login=None)
+        url = reverse('user-login')
+        with patch("user_management.login.LAST_LOGIN_FLUSH_SIZE", 1), \
+                patch("user_management.login.Case", side_effect=DatabaseError("database is locked")), \
+                self.assertLogs("CMS", level="ERROR"):
+            response = self.client.post(url, {'email': "test@gmail.com", 'password': "test@123"}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            response = self.client.post(reverse('token_obtain_pair'),
+                                        {'email': "test@gmail.com", 'password': "test@123"}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # requeued, the next flush writes it
+        self.assertEqual(flush_last_logins(), 1)
+        self.assertTrue(User.objects.filter(pk=self.user.pk, last_login__isnull=False).exists())
+
     def test_expired_token(self):
         # This test needs a real expired token for a realistic test.
         # You may need to generate one or mock the token expiry logic.
@@ -292,6 +367,66 @@ class UserJsonDataAPITest(BaseTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['count'], 3)
 
+    def test_user_json_data_since_version(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.data['full'])
+        self.assertEqual(response.data['results'][self.user1.id], "John Doe")
+        version = response.data['version']
+
+        self.user1.first_name = "Johnny"
+        self.user1.save()
+        response = self.client.get(self.url, {"since": version})
+        self.assertFalse(response.data['full'])
+        self.assertEqual(response.data['results'], {self.user1.id: "Johnny Doe"})
+        self.assertEqual(response.data['deleted'], [])
+
+        version = response.data['version']
+        user2_id = self.user2.id
+        self.user2.delete()
+        response = self.client.get(self.url, {"since": version})
+        self.assertEqual(response.data['results'], {})
+        self.assertEqual(response.data['deleted'], [user2_id])
+
+        # unknown versions get the whole directory
+        response = self.client.get(self.url, {"since": 1})
+        self.assertTrue(response.data['full'])
+        self.assertEqual(response.data['count'], 2)
+        response = self.client.get(self.url, {"since": "latest"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_version_survives_json_doubles(self):
+        cache.delete(DIRECTORY_VERSION_KEY)
+        version = json.loads(self.client.get(self.url).content)['version']
+        self.assertEqual(int(float(version)), version)
+        self.user1.first_name = "Johnny"
+        self.user1.save()
+        response = self.client.get(self.url, {"since": int(float(version))})
+        self.assertFalse(response.data['full'])
+        self.assertEqual(response.data['results'], {self.user1.id: "Johnny Doe"})
+
+    def test_user_json_data_gzip(self):
+        for index in range(20):
+            CustomUser.objects.create(email=f"gzip{index}@example.com", first_name="Gzip", last_name=str(index))
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(response.content))["count"], 23)
+
+    def test_directory_replays_changes_of_other_processes(self):
+        other = UserDirectory()
+        self.assertEqual(other.names_for([self.user1.id]), {self.user1.id: "John Doe"})
+        with self.assertNumQueries(0):
+            other.names_for([self.user1.id, self.user2.id])
+        # saves of fields not shown in the directory are not published
+        self.user2.last_login = timezone.now()
+        self.user2.save(update_fields=["last_login"])
+        self.user1.last_name = "Roe"
+        self.user1.save()
+        with self.assertNumQueries(1):
+            names = other.names_for()
+        self.assertEqual(names[self.user1.id], "John Roe")
+        self.assertEqual(len(names), 3)
+
 
 class UserFilterApiTest(BaseTestCase):
 
@@ -588,6 +723,11 @@ class UserFilterAPITestCase(BaseTestCase):
             organisation_name='TestOrg',
             phone_number='1234567890'
         )
+        # registered by the post-migrate privilege sync
+        privilege = MasterPrivilege.objects.get(privilege_name="VIEW_USER_LIST")
+        role = Role.objects.create(role_name="User Viewer", created_by=self.user.id)
+        RolePermission.objects.create(role=role, privilege=privilege, created_by=self.user.id)
+        UserRole.objects.create(user=self.user, role=role, created_by=self.user.id)
         self.url = reverse('user_list')  # Ensure the URL name matches
 
     def test_user_filter_success(self):
@@ -628,6 +768,129 @@ class UserFilterAPITestCase(BaseTestCase):
         self.assertEqual(response.data['count'], 0)
         self.assertEqual(len(response.data['results']), 0)
 
+    def test_user_filter_query_count_is_constant(self):
+        role = Role.objects.create(role_name="Agent", created_by=self.user.id)
+        self.client.force_authenticate(user=self.user)
+        payload = {"page_size": 50, "page": 1, "first_name": "Listed"}
+
+        def page_queries(users):
+            for index in range(users):
+                user = User.objects.create_user(email=f"listed{users}-{index}@example.com", password="password",
+                                                first_name="Listed")
+                UserRole.objects.create(user=user, role=role, created_by=self.user.id)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(self.url, payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            for row in response.data["results"]:
+                self.assertEqual([item["role_name"] for item in row["role_data"]], ["Agent"])
+            return len(queries)
+
+        self.assertEqual(page_queries(2), page_queries(10))
+
+    def test_user_filter_export_streams_workbook(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(self.url, {"export": True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="EXPORT_USER_MANAGEMENT_', response['Content-Disposition'])
+        content = b"".join(response.streaming_content)
+        with zipfile.ZipFile(io.BytesIO(content)) as workbook:
+            sheet = workbook.read("xl/worksheets/sheet1.xml").decode()
+        self.assertIn("testuser@example.com", sheet)
+
+    def test_export_writes_every_chunk(self):
+        for index in range(7):
+            User.objects.create_user(email=f"chunk{index}@example.com", password="password", first_name="Chunk")
+        output = io.BytesIO()
+        queryset = User.objects.filter(first_name="Chunk").order_by("id")
+        rows = write_queryset_to_excel(output, queryset, UserReadSerializer, "USER_MANAGEMENT", chunk_size=3)
+        self.assertEqual(rows, 7)
+        with zipfile.ZipFile(output) as workbook:
+            sheet = workbook.read("xl/worksheets/sheet1.xml").decode()
+        # header row plus one row per user
+        self.assertEqual(sheet.count("<row "), 8)
+
+
+class UserProfileApiTest(BaseTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='profile@example.com', password='password', first_name='Profile')
+        self.role = Role.objects.create(role_name="Profile Viewer", created_by=self.user.id)
+        privilege = MasterPrivilege.objects.get(privilege_name="GET_USER_PROFILE")
+        RolePermission.objects.create(role=self.role, privilege=privilege, created_by=self.user.id)
+        UserRole.objects.create(user=self.user, role=self.role, created_by=self.user.id)
+        self.url = reverse('user_profile', kwargs={'pk': self.user.pk})
+        self.client.force_authenticate(user=self.user)
+
+    def test_profile_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["privileges"], ["GET_USER_PROFILE"])
+        self.assertEqual([role["role_name"] for role in response.data["role_data"]], ["Profile Viewer"])
+        etag = response["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_profile_etag_follows_role_and_user_changes(self):
+        etag = self.client.get(self.url)["ETag"]
+        privilege = MasterPrivilege.objects.get(privilege_name="VIEW_USER_LIST")
+        RolePermission.objects.create(role=self.role, privilege=privilege, created_by=self.user.id)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["privileges"], ["GET_USER_PROFILE", "VIEW_USER_LIST"])
+        self.assertNotEqual(response["ETag"], etag)
+
+        etag = response["ETag"]
+        self.user.first_name = "Renamed"
+        self.user.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["first_name"], "Renamed")
+
+
+class TokenClaimsAuthenticationTest(BaseTestCase):
+
+    def test_request_user_built_from_token_claims(self):
+        url = reverse('user_profile', kwargs={'pk': self.user.pk})
+        etag = self.client.get(url)["ETag"]
+        # neither the user nor the profile is read
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_saved_user_makes_token_stale(self):
+        url = reverse('user_profile', kwargs={'pk': self.user.pk})
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_version_bumped_again_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.is_active = False
+            self.user.save()
+            version = get_user_version(self.user.pk)
+        for callback in callbacks:
+            callback()
+        self.assertGreater(get_user_version(self.user.pk), version)
+
+    def test_api_key_header_does_not_bypass_the_token(self):
+        url = reverse('user_profile', kwargs={'pk': self.user.pk})
+        with patch("builtins.print") as print_:
+            response = self.client.get(url, HTTP_X_API_KEY="secret-key")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        print_.assert_not_called()
+
+    def test_token_without_claims_loads_user(self):
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('user_details_json'), {"since": "latest"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 class UserStatusApiViewTest(BaseTestCase):
 
@@ -692,4 +955,71 @@ class UserStatusApiViewTest(BaseTestCase):
         url = reverse('user_status', kwargs={'pk': 999})
         response = self.client.patch(url, data={'is_active': False}, format='json')
 
-        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class EmailOutboxTestCase(BaseTestCase):
+
+    def test_register_queues_email(self):
+        data = {"first_name": "Queued", "last_name": "User", "phone_number": "9110161780",
+                "email": "queued@example.com", "organisation_name": "Cozentus", "timezone": "UTC", "country": "India"}
+        response = self.client.post(reverse('register'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        email = EmailOutbox.objects.get(to_email="queued@example.com")
+        self.assertEqual(email.status, "PENDING")
+        self.assertEqual(email.subject, "New Registration")
+
+    def test_drain_reuses_one_connection(self):
+        for index in range(3):
+            queue_email(f"user{index}@example.com", "Subject", "Message")
+        with patch("user_management.outbox.get_connection", wraps=get_connection) as connection_factory:
+            self.assertEqual(drain_outbox(), 3)
+        self.assertEqual(connection_factory.call_count, 1)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(EmailOutbox.objects.filter(status="SENT").count(), 3)
+        self.assertEqual(outbox_metrics()["queue_depth"], 0)
+
+    def test_sent_email_content_is_cleared(self):
+        email = queue_email("otp@example.com", "OTP", "Your OTP is 123456")
+        self.assertIn("123456", email.html_content)
+        self.assertEqual(drain_outbox(), 1)
+        self.assertIn("123456", mail.outbox[0].alternatives[0][0])
+        email.refresh_from_db()
+        self.assertEqual(email.status, "SENT")
+        self.assertEqual(email.html_content, "")
+
+    @patch("user_management.outbox.build_html_email", side_effect=ConnectionRefusedError("smtp down"))
+    def test_failed_email_is_retried_with_backoff(self, build_html_email):
+        email = queue_email("retry@example.com", "Subject", "Message")
+        self.assertEqual(drain_outbox(), 0)
+        email.refresh_from_db()
+        self.assertEqual(email.status, "PENDING")
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertEqual(email.last_error, "smtp down")
+        # not due yet, nothing is picked up again
+        self.assertEqual(drain_outbox(), 0)
+        self.assertEqual(build_html_email.call_count, 1)
+
+        EmailOutbox.objects.filter(id=email.id).update(attempts=EMAIL_OUTBOX_MAX_ATTEMPTS - 1,
+                                                       next_attempt_at=timezone.now())
+        drain_outbox()
+        email.refresh_from_db()
+        self.assertEqual(email.status, "FAILED")
+
+    @patch("user_management.outbox.get_connection")
+    def test_batch_is_rescheduled_when_the_connection_fails(self, connection_factory):
+        connection_factory.return_value.open.side_effect = ConnectionRefusedError("smtp down")
+        first = queue_email("first@example.com", "Subject", "Message")
+        last = queue_email("last@example.com", "Subject", "Message")
+        EmailOutbox.objects.filter(id=last.id).update(attempts=EMAIL_OUTBOX_MAX_ATTEMPTS - 1)
+        before = outbox_metrics()
+        self.assertEqual(drain_outbox(), 0)
+        first.refresh_from_db()
+        last.refresh_from_db()
+        self.assertEqual((first.status, first.attempts, first.last_error), ("PENDING", 1, "smtp down"))
+        self.assertGreater(first.next_attempt_at, timezone.now())
+        self.assertEqual(last.status, "FAILED")
+        after = outbox_metrics()
+        self.assertEqual((after["retried"] - before["retried"], after["failed"] - before["failed"]), (1, 1))
+        self.assertEqual(after["queue_depth"], 1)
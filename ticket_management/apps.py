@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class TicketManagementConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "ticket_management"
+
+    def ready(self):
+        import ticket_management.signals  # Register signals
+        from case_management.pagination import connect_count_cache
+        connect_count_cache()
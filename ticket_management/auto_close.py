@@ -0,0 +1,146 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.dispatch import Signal
+from django.utils import timezone
+
+from acl.models import AppConfiguration
+from case_management.pagination import bump_table_version
+from user_management.outbox import queue_emails
+from .models import Ticket, TicketAutoCloseSweep
+
+SWEEP_NAME = "ticket_auto_close"
+# tickets closed or reminded per update() statement, every batch is its own short transaction
+TICKET_AUTO_CLOSE_BATCH_SIZE = getattr(settings, "TICKET_AUTO_CLOSE_BATCH_SIZE", 500)
+# seconds of resolution time before the checkpoint read again when a sweep that died is resumed
+TICKET_AUTO_CLOSE_OVERLAP = getattr(settings, "TICKET_AUTO_CLOSE_OVERLAP", 3600)
+# ticket_status written on auto-closed tickets, None leaves the status alone
+TICKET_AUTO_CLOSE_STATUS = getattr(settings, "TICKET_AUTO_CLOSE_STATUS", None)
+# AppConfiguration.application_name holding the thresholds, None takes the first configuration
+TICKET_AUTO_CLOSE_APPLICATION = getattr(settings, "TICKET_AUTO_CLOSE_APPLICATION", None)
+
+# sent with ticket_ids after every closed batch
+tickets_auto_closed = Signal()
+
+
+def get_auto_close_config():
+    """
+    Return (ticket_auto_close_days, auto_notification_hours) of the configuration, None when not set
+    """
+    queryset = AppConfiguration.objects.order_by("id")
+    if TICKET_AUTO_CLOSE_APPLICATION:
+        queryset = queryset.filter(application_name=TICKET_AUTO_CLOSE_APPLICATION)
+    return queryset.values_list("ticket_auto_close_days", "auto_notification_hours").first() or (None, None)
+
+
+def resolved_open_tickets():
+    return Ticket.objects.filter(resolution_at__isnull=False, closed_at__isnull=True,
+                                 cancellation_at__isnull=True).exclude(is_delete=True)
+
+
+def keyset_batches(queryset, after=None, batch_size=TICKET_AUTO_CLOSE_BATCH_SIZE):
+    """
+    Yield lists of (resolution_at, id) of queryset in that order, starting behind the position after.
+    Every batch is a range read on ticket_resolved_idx, no offset and no open cursor between batches.
+    """
+    queryset = queryset.order_by("resolution_at", "id")
+    while True:
+        page = queryset
+        if after is not None:
+            resolved, pk = after
+            page = page.filter(Q(resolution_at__gt=resolved) | Q(resolution_at=resolved, id__gt=pk))
+        rows = list(page.values_list("resolution_at", "id")[:batch_size])
+        if rows:
+            yield rows
+        if len(rows) < batch_size:
+            return
+        after = rows[-1]
+
+
+def close_resolved_tickets(days, now=None, batch_size=TICKET_AUTO_CLOSE_BATCH_SIZE):
+    """
+    Close the tickets resolved more than days ago, returns how many were closed.
+    Every sweep reads from the oldest open resolved ticket, a ticket reopened or given an earlier resolution_at
+    is still found. The checkpoint moves with every batch only so a sweep that died resumes behind its last
+    committed batch, it is cleared once the sweep finishes.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(days=days)
+    sweep, _ = TicketAutoCloseSweep.objects.get_or_create(name=SWEEP_NAME)
+    after = None
+    if sweep.resolved_until:
+        after = (sweep.resolved_until - timedelta(seconds=TICKET_AUTO_CLOSE_OVERLAP), 0)
+    values = {"closed_at": now, "updated_at": now}
+    if TICKET_AUTO_CLOSE_STATUS is not None:
+        values["ticket_status"] = TICKET_AUTO_CLOSE_STATUS
+    queryset = resolved_open_tickets().filter(resolution_at__lte=cutoff)
+    closed = 0
+    for rows in keyset_batches(queryset, after, batch_size):
+        ids = [pk for _, pk in rows]
+        with transaction.atomic():
+            # the filter is repeated so a ticket reopened since the read is left alone
+            count = queryset.filter(id__in=ids).update(**values)
+            TicketAutoCloseSweep.objects.filter(pk=sweep.pk).update(resolved_until=rows[-1][0],
+                                                                    closed=F("closed") + count)
+        bump_table_version(Ticket)
+        tickets_auto_closed.send(sender=Ticket, ticket_ids=ids)
+        closed += count
+    TicketAutoCloseSweep.objects.filter(pk=sweep.pk).update(resolved_until=None)
+    return closed
+
+
+def reminder_notifications(tickets, days):
+    messages = []
+    for ticket in tickets:
+        if ticket.created_by is None or not ticket.created_by.email:
+            continue
+        body = f"Ticket {ticket.ticket_no} ({ticket.ticket_header}) was resolved on " \
+               f"{timezone.localtime(ticket.resolution_at):%Y-%m-%d %H:%M %Z}."
+        if days:
+            body += f" It will be closed automatically on " \
+                    f"{timezone.localtime(ticket.resolution_at + timedelta(days=days)):%Y-%m-%d %H:%M %Z} " \
+                    f"unless it is reopened."
+        messages.append((ticket.created_by.email, f"Ticket {ticket.ticket_no} is resolved", body))
+    return messages
+
+
+def remind_resolved_tickets(hours, days=None, now=None, batch_size=TICKET_AUTO_CLOSE_BATCH_SIZE):
+    """
+    Remind creators of resolved tickets every hours hours until the ticket is closed, returns how many were sent.
+    With days set only tickets still inside the auto-close window are read, the rest is about to be closed.
+    """
+    now = now or timezone.now()
+    due = now - timedelta(hours=hours)
+    queryset = resolved_open_tickets().filter(Q(auto_close_reminded_at__isnull=True) |
+                                              Q(auto_close_reminded_at__lte=due), resolution_at__lte=due)
+    if days:
+        queryset = queryset.filter(resolution_at__gt=now - timedelta(days=days))
+    reminded = 0
+    for rows in keyset_batches(queryset, batch_size=batch_size):
+        ids = [pk for _, pk in rows]
+        with transaction.atomic():
+            tickets = list(queryset.filter(id__in=ids).select_for_update(of=("self",)).select_related(
+                "created_by").only("id", "ticket_no", "ticket_header", "resolution_at", "created_by__email"))
+            Ticket.objects.filter(id__in=[ticket.id for ticket in tickets]).update(auto_close_reminded_at=now)
+            queue_emails(reminder_notifications(tickets, days))
+        reminded += len(tickets)
+    return reminded
+
+
+def sweep_auto_close(now=None, batch_size=TICKET_AUTO_CLOSE_BATCH_SIZE):
+    """
+    Close and remind according to the AppConfiguration thresholds, returns {"closed", "reminded"}
+    """
+    now = now or timezone.now()
+    days, hours = get_auto_close_config()
+    counts = {"closed": 0, "reminded": 0}
+    if days:
+        counts["closed"] = close_resolved_tickets(days, now, batch_size)
+    if hours:
+        counts["reminded"] = remind_resolved_tickets(hours, days, now, batch_size)
+        TicketAutoCloseSweep.objects.get_or_create(name=SWEEP_NAME)
+        TicketAutoCloseSweep.objects.filter(name=SWEEP_NAME).update(reminded=F("reminded") + counts["reminded"])
+    return counts
+
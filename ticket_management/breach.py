@@ -0,0 +1,103 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.dispatch import Signal
+from django.utils import timezone
+
+from case_management.pagination import bump_table_version
+from user_management.outbox import queue_emails
+from .models import Ticket, SLABreachSweep
+
+BREACHED = "BREACHED"
+SWEEP_NAME = "ticket_sla"
+# tickets marked and notified per statement
+SLA_BREACH_BATCH_SIZE = getattr(settings, "SLA_BREACH_BATCH_SIZE", 1000)
+# seconds of the previous window checked again, catches deadlines committed while the last sweep ran
+SLA_BREACH_SWEEP_OVERLAP = getattr(settings, "SLA_BREACH_SWEEP_OVERLAP", 300)
+
+# sent with kind ("response" or "resolution") and ticket_ids after every marked batch
+sla_breached = Signal()
+
+BREACH_FIELDS = {
+    "response": ("response_within", "response_at", "response_breach", "response_breach_time"),
+    "resolution": ("resolution_within", "resolution_at", "resolution_breach", "resolution_breach_time"),
+}
+
+
+def overdue_tickets(kind, since, until):
+    """
+    Unmarked tickets whose deadline of kind fell in (since, until], or was moved after since, and wasn't met.
+    The bounded ranges on the due and sla_changed_at columns are served by their indexes, so the cost follows
+    the window, not the table.
+    """
+    due, done, flag, _ = BREACH_FIELDS[kind]
+    query = Q(**{f"{due}__lte": until, f"{flag}__isnull": True, "cancellation_at__isnull": True}) & \
+        (Q(**{f"{done}__isnull": True}) | Q(**{f"{done}__gt": F(due)}))
+    if since is not None:
+        query &= Q(**{f"{due}__gt": since}) | Q(sla_changed_at__gt=since)
+    if kind == "resolution":
+        query &= Q(closed_at__isnull=True) | Q(closed_at__gt=F(due))
+    return Ticket.objects.filter(query).exclude(is_delete=True).order_by(due, "id")
+
+
+def breach_notifications(kind, tickets):
+    messages = []
+    due = BREACH_FIELDS[kind][0]
+    for ticket in tickets:
+        recipient = ticket.assigned_to or ticket.created_by
+        if recipient is None or not recipient.email:
+            continue
+        messages.append((recipient.email, f"SLA breached for ticket {ticket.ticket_no}",
+                         f"The {kind} deadline of ticket {ticket.ticket_no} ({ticket.ticket_header}) "
+                         f"passed at {timezone.localtime(getattr(ticket, due)):%Y-%m-%d %H:%M %Z}."))
+    return messages
+
+
+def mark_breaches(kind, since, until, batch_size=SLA_BREACH_BATCH_SIZE, notify=True):
+    """
+    Flag the overdue tickets batch by batch with bulk_update, returns how many were marked.
+    Every batch is its own transaction holding the watermark row, concurrent sweeps take turns batch by batch
+    and never read the same tickets. sla_breached is sent once the batch is committed.
+    """
+    due, _, flag, breach_time = BREACH_FIELDS[kind]
+    queryset = overdue_tickets(kind, since, until).select_related("assigned_to", "created_by").only(
+        "id", "ticket_no", "ticket_header", due, "assigned_to__email", "created_by__email")
+    marked = 0
+    while True:
+        with transaction.atomic():
+            sweep = SLABreachSweep.objects.select_for_update().get(name=SWEEP_NAME)
+            # marked rows drop out of the filter, so every pass reads the next batch
+            tickets = list(queryset[:batch_size])
+            for ticket in tickets:
+                setattr(ticket, flag, BREACHED)
+                setattr(ticket, breach_time, getattr(ticket, due))
+            if tickets:
+                Ticket.objects.bulk_update(tickets, [flag, breach_time])
+                if notify:
+                    queue_emails(breach_notifications(kind, tickets))
+                SLABreachSweep.objects.filter(pk=sweep.pk).update(breaches=F("breaches") + len(tickets),
+                                                                  updated_at=timezone.now())
+        if tickets:
+            bump_table_version(Ticket)
+            sla_breached.send(sender=Ticket, kind=kind, ticket_ids=[ticket.id for ticket in tickets])
+            marked += len(tickets)
+        if len(tickets) < batch_size:
+            return marked
+
+
+def sweep_breaches(now=None, batch_size=SLA_BREACH_BATCH_SIZE, notify=True):
+    """
+    Mark every deadline missed since the last sweep and move the watermark to now.
+    The first sweep checks all past deadlines. The watermark only moves once every batch is committed,
+    a sweep that dies is redone by the next one. Returns the number of marked tickets per kind.
+    """
+    now = now or timezone.now()
+    sweep, _ = SLABreachSweep.objects.get_or_create(name=SWEEP_NAME)
+    since = sweep.swept_until - timedelta(seconds=SLA_BREACH_SWEEP_OVERLAP) if sweep.swept_until else None
+    counts = {kind: mark_breaches(kind, since, now, batch_size, notify) for kind in BREACH_FIELDS}
+    # never moved back by a concurrent sweep that started earlier
+    SLABreachSweep.objects.filter(Q(swept_until__isnull=True) | Q(swept_until__lt=now), pk=sweep.pk).update(
+        swept_until=now, updated_at=timezone.now())
+    return counts
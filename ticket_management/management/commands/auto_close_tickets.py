@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ticket_management.auto_close import TICKET_AUTO_CLOSE_BATCH_SIZE, sweep_auto_close
+
+
+class Command(BaseCommand):
+    help = "Close resolved tickets older than ticket_auto_close_days and remind their creators every " \
+           "auto_notification_hours. Schedule it from cron, or keep one process running it with --interval."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=TICKET_AUTO_CLOSE_BATCH_SIZE,
+                            help="Tickets closed or reminded per update")
+        parser.add_argument("--interval", type=int, default=0,
+                            help="Keep sweeping every INTERVAL seconds instead of running once")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            counts = sweep_auto_close(batch_size=options["batch_size"])
+            self.stdout.write(f"Closed {counts['closed']} and reminded {counts['reminded']} resolved tickets "
+                              f"in {time.monotonic() - started:.2f}s")
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
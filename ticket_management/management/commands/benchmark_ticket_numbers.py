@@ -0,0 +1,73 @@
+import re
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from acl.models import NumberSequence
+from acl.sequences import SEQUENCE_BLOCK_SIZE, next_number, reset_number_blocks
+
+
+class Command(BaseCommand):
+    help = "Allocate numbers from --threads concurrent threads in block and gap-free mode, report throughput and " \
+           "check that no number was handed out twice. Run it against the production database engine, SQLite " \
+           "serializes all writers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--numbers", type=int, default=200, help="Numbers allocated per thread")
+        parser.add_argument("--block-size", type=int, default=SEQUENCE_BLOCK_SIZE)
+        parser.add_argument("--sequence", default="benchmark", help="Series used, it is reset before every mode")
+
+    def run_mode(self, name, gap_free, threads, numbers, block_size):
+        NumberSequence.objects.filter(name=name).delete()
+        reset_number_blocks()
+        allocated = []
+        errors = []
+        lock = threading.Lock()
+        start = threading.Barrier(threads)
+
+        def worker():
+            mine = []
+            try:
+                start.wait()
+                for _ in range(numbers):
+                    if gap_free:
+                        # the transaction stands in for the ticket insert that holds the counter row lock
+                        with transaction.atomic():
+                            mine.append(next_number(name, gap_free=True))
+                    else:
+                        mine.append(next_number(name, block_size=block_size))
+            except Exception as ee:
+                errors.append(ee)
+            finally:
+                connection.close()
+            with lock:
+                allocated.extend(mine)
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        if errors:
+            raise CommandError(f"{len(errors)} threads failed, first error: {errors[0]}")
+
+        values = sorted(int(re.search(r"\d+$", number).group()) for number in allocated)
+        duplicates = len(values) - len(set(values))
+        gaps = values[-1] - values[0] + 1 - len(set(values)) if values else 0
+        self.stdout.write(f"{'gap-free' if gap_free else 'block':>8}: {len(values)} numbers in {elapsed:.2f}s, "
+                          f"{len(values) / elapsed:.0f}/s, {duplicates} duplicates, {gaps} gaps")
+        if duplicates or (gap_free and gaps):
+            raise CommandError("Allocation is not correct under contention")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{connection.vendor}: {options['threads']} threads x {options['numbers']} numbers")
+        for gap_free in (False, True):
+            self.run_mode(options["sequence"], gap_free, options["threads"], options["numbers"],
+                          options["block_size"])
+        NumberSequence.objects.filter(name=options["sequence"]).delete()
+        reset_number_blocks()
@@ -0,0 +1,79 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from case_management.pagination import bump_table_version
+from ticket_management.models import Ticket, TicketType, Department
+
+
+class Command(BaseCommand):
+    help = "Seed the ticket table up to --rows and report the query plan and latency of the ticket filter queries. " \
+           "Run it against a scratch database, seeding inserts benchmark rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000, help="Tickets to have in the table")
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--runs", type=int, default=5, help="Timed runs per query")
+
+    def seed(self, rows, batch_size):
+        existing = Ticket.objects.count()
+        if existing >= rows:
+            return
+        ticket_type = TicketType.objects.create(name="Benchmark", is_active=True)
+        departments = [Department.objects.create(department_name=f"Benchmark {index}",
+                                                 department_code=f"BENCH{index}") for index in range(20)]
+        now = timezone.now()
+        for start in range(existing, rows, batch_size):
+            Ticket.objects.bulk_create([Ticket(
+                ticket_no=f"TKT{index:07d}", ticket_status=index % 8, ticket_header="Benchmark",
+                ticket_details="Benchmark", on_behalf=0, ticket_category=index % 5, ticket_type=ticket_type,
+                department_id=departments[index % len(departments)], project_id=index % 50,
+                ticket_priority=index % 4, updated_at=now - timedelta(minutes=index),
+            ) for index in range(start, min(start + batch_size, rows))])
+            self.stdout.write(f"seeded {min(start + batch_size, rows)}/{rows}")
+        bump_table_version(Ticket)
+        if connection.vendor == "sqlite":
+            # let the planner see the real selectivity of every index
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+    def queries(self):
+        tickets = Ticket.objects.all()
+        department = Department.objects.filter(department_name__startswith="Benchmark").values_list("id", flat=True)
+        department_id = department.first()
+        return [
+            ("status, newest first", "ticket_status_created_idx",
+             tickets.filter(ticket_status=3).order_by("-created_at")),
+            ("priority, newest first", "ticket_priority_created_idx",
+             tickets.filter(ticket_priority=1).order_by("-created_at")),
+            ("department and status", "ticket_dept_status_idx",
+             tickets.filter(department_id=department_id, ticket_status=2).order_by("-created_at")),
+            ("project, newest first", "ticket_project_created_idx",
+             tickets.filter(project_id=7).order_by("-created_at")),
+            ("recently updated", "ticket_updated_idx", tickets.order_by("-updated_at")),
+            # LIKE 'prefix%' only reaches the index under a case-insensitive collation, as MySQL's default
+            ("ticket_no prefix", "ticket_no_idx" if connection.vendor == "mysql" else None,
+             tickets.filter(ticket_no__istartswith="TKT00012")),
+        ]
+
+    def handle(self, *args, **options):
+        self.seed(options["rows"], options["batch_size"])
+        self.stdout.write(f"{connection.vendor}: {Ticket.objects.count()} tickets")
+        for name, index_name, queryset in self.queries():
+            page = queryset[:50]
+            plan = page.explain()
+            timings = []
+            for _ in range(options["runs"]):
+                started = time.perf_counter()
+                list(page.all())
+                timings.append((time.perf_counter() - started) * 1000)
+            if index_name is None:
+                verdict = "no index expected on " + connection.vendor
+            else:
+                verdict = f"uses {index_name}" if index_name in plan else "DOES NOT USE " + index_name
+            self.stdout.write(f"{name}: {verdict}, median {statistics.median(timings):.2f} ms")
+            self.stdout.write("    " + plan.replace("\n", "\n    "))
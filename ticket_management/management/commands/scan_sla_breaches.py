@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ticket_management.breach import SLA_BREACH_BATCH_SIZE, sweep_breaches
+
+
+class Command(BaseCommand):
+    help = "Mark tickets whose response or resolution deadline passed since the last sweep and notify assignees. " \
+           "Schedule it from cron, or keep one process running it with --interval."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=SLA_BREACH_BATCH_SIZE,
+                            help="Tickets marked per bulk update")
+        parser.add_argument("--no-notify", action="store_true", help="Mark breaches without queueing emails")
+        parser.add_argument("--interval", type=int, default=0,
+                            help="Keep sweeping every INTERVAL seconds instead of running once")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            counts = sweep_breaches(batch_size=options["batch_size"], notify=not options["no_notify"])
+            self.stdout.write(f"Marked {counts['response']} response and {counts['resolution']} resolution "
+                              f"breaches in {time.monotonic() - started:.2f}s")
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.8 on 2026-10-18 18:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticket_management', '0021_ticket_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sla',
+            name='department',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sla_department', to='ticket_management.department'),
+        ),
+        migrations.AlterField(
+            model_name='sla',
+            name='priority',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sla_priority', to='ticket_management.priority'),
+        ),
+        migrations.AlterField(
+            model_name='sla',
+            name='ticket_type',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sla_ticket_type', to='ticket_management.tickettype'),
+        ),
+    ]
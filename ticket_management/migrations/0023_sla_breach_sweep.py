@@ -0,0 +1,34 @@
+# Generated by Django 4.1.8 on 2026-10-18 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticket_management', '0022_sla_wildcards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SLABreachSweep',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('swept_until', models.DateTimeField(null=True)),
+                ('breaches', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'sla_breach_sweep',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['response_within'], name='ticket_response_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['resolution_within'], name='ticket_resolution_due_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.1.8 on 2026-10-18 18:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticket_management', '0023_sla_breach_sweep'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketAutoCloseSweep',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('resolved_until', models.DateTimeField(null=True)),
+                ('closed', models.PositiveIntegerField(default=0)),
+                ('reminded', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'ticket_auto_close_sweep',
+            },
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='auto_close_reminded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['resolution_at', 'id'], name='ticket_resolved_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.1.8 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticket_management', '0024_ticket_auto_close'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='sla_changed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['sla_changed_at'], name='ticket_sla_changed_idx'),
+        ),
+    ]
@@ -158,12 +158,15 @@ class UserDepartment(models.Model):
 
 
 class SLA(models.Model):
+    """
+    Response and resolution targets, a null department, ticket type or priority matches any value
+    """
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, unique=True)
-    department = models.ForeignKey(Department, on_delete=models.CASCADE,
+    department = models.ForeignKey(Department, null=True, on_delete=models.CASCADE,
                                    related_name='sla_department')
-    ticket_type = models.ForeignKey(TicketType, on_delete=models.CASCADE,
+    ticket_type = models.ForeignKey(TicketType, null=True, on_delete=models.CASCADE,
                                     related_name='sla_ticket_type')
-    priority = models.ForeignKey(Priority, on_delete=models.CASCADE, related_name='sla_priority')
+    priority = models.ForeignKey(Priority, null=True, on_delete=models.CASCADE, related_name='sla_priority')
     response_time = models.DurationField()
     resolution_time = models.DurationField()
     is_delete = models.BooleanField(default=False)
@@ -219,7 +222,10 @@ class Ticket(models.Model):
     resolution_status = models.PositiveIntegerField(null=True)
     resolution_breach = models.CharField(max_length=100, null=True, blank=True)
     resolution_breach_time = models.DateTimeField(null=True, blank=True)
+    # last time response_within or resolution_within was written, lets the breach sweep re-scan moved deadlines
+    sla_changed_at = models.DateTimeField(null=True, blank=True)
     closed_at = models.DateTimeField(null=True, blank=True)
+    auto_close_reminded_at = models.DateTimeField(null=True, blank=True)
     comments = models.CharField(max_length=500, null=True, blank=True)
     tags = models.CharField(max_length=200, null=True, blank=True)
     is_delete = models.BooleanField(null=True)
@@ -235,6 +241,58 @@ class Ticket(models.Model):
 
     class Meta:
         db_table = 'ticket'
+        # chosen from the TicketFilterAPI filter/order maps, equality columns first and the sort column last
+        indexes = [
+            models.Index(fields=['ticket_status', 'created_at'], name='ticket_status_created_idx'),
+            models.Index(fields=['ticket_priority', 'created_at'], name='ticket_priority_created_idx'),
+            models.Index(fields=['department_id', 'ticket_status', 'created_at'], name='ticket_dept_status_idx'),
+            models.Index(fields=['project_id', 'created_at'], name='ticket_project_created_idx'),
+            models.Index(fields=['ticket_type', 'created_at'], name='ticket_type_created_idx'),
+            models.Index(fields=['created_by', 'created_at'], name='ticket_creator_created_idx'),
+            models.Index(fields=['created_at'], name='ticket_created_idx'),
+            models.Index(fields=['updated_at'], name='ticket_updated_idx'),
+            # serves ticket_no lookups and, under a case-insensitive collation, the ticket_no prefix search
+            models.Index(fields=['ticket_no'], name='ticket_no_idx'),
+            # range scans of the SLA breach sweep, see ticket_management.breach
+            models.Index(fields=['response_within'], name='ticket_response_due_idx'),
+            models.Index(fields=['resolution_within'], name='ticket_resolution_due_idx'),
+            models.Index(fields=['sla_changed_at'], name='ticket_sla_changed_idx'),
+            # keyset walk of the auto-close sweeper, see ticket_management.auto_close
+            models.Index(fields=['resolution_at', 'id'], name='ticket_resolved_idx'),
+        ]
+
+
+class SLABreachSweep(models.Model):
+    """
+    Watermark of the SLA breach sweep, deadlines up to swept_until are already checked.
+    Every batch of a sweep locks the row, concurrent sweeps queue on it one batch at a time.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    swept_until = models.DateTimeField(null=True)
+    breaches = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = models.Manager()
+
+    class Meta:
+        db_table = 'sla_breach_sweep'
+
+
+class TicketAutoCloseSweep(models.Model):
+    """
+    Checkpoint of the auto-close sweeper. resolved_until is set while a sweep runs, tickets resolved up to it
+    were already closed by that sweep; a finished sweep clears it so the next one starts from the beginning.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    resolved_until = models.DateTimeField(null=True)
+    closed = models.PositiveIntegerField(default=0)
+    reminded = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = models.Manager()
+
+    class Meta:
+        db_table = 'ticket_auto_close_sweep'
 
 
 class TicketFollower(models.Model):
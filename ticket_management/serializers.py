@@ -1,8 +1,15 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 from .models import Department, Status, Category, ProjectManagement, TicketType, TicketRevision, TicketFollower, \
     Ticket, TicketBehalf, UserDepartment, Priority, SLA
 from django.contrib.auth import get_user_model
 
+from acl.sequences import next_number
+from user_management.user_names import UserNameSerializerMixin, UserNameListSerializer
+from .sla import sla_deadlines
+
 User = get_user_model()
 
 
@@ -67,7 +74,7 @@ class StatusFilterSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class StatusReadSerializer(serializers.ModelSerializer):
+class StatusReadSerializer(UserNameSerializerMixin, serializers.ModelSerializer):
     """
     This serializer is used for response data of Status
     """
@@ -79,23 +86,10 @@ class StatusReadSerializer(serializers.ModelSerializer):
         fields = (
             "id", "name", "status_code", "color_code", "highlight", "updated_at", "updated_by",
             "created_at", "created_by")
+        list_serializer_class = UserNameListSerializer
 
-    def get_updated_by(self, obj):
-        data = User.objects.filter(id=obj.updated_by).first()
-        if data:
-            return f"{data.first_name} {data.last_name}".strip()
-        else:
-            return None
-
-    def get_created_by(self, obj):
-        data = User.objects.filter(id=obj.created_by).first()
-        if data:
-            return f"{data.first_name} {data.last_name}".strip()
-        else:
-            return None
 
-
-class CategoryReadSerializer(serializers.ModelSerializer):
+class CategoryReadSerializer(UserNameSerializerMixin, serializers.ModelSerializer):
     """
     This serializer is used for response data of Category
     """
@@ -106,20 +100,7 @@ class CategoryReadSerializer(serializers.ModelSerializer):
         model = Category
         fields = ("id", "name", "updated_at", "updated_by", "created_at",
                   "created_by")
-
-    def get_updated_by(self, obj):
-        data = User.objects.filter(id=obj.updated_by).first()
-        if data:
-            return f"{data.first_name} {data.last_name}".strip()
-        else:
-            return None
-
-    def get_created_by(self, obj):
-        data = User.objects.filter(id=obj.created_by).first()
-        if data:
-            return f"{data.first_name} {data.last_name}".strip()
-        else:
-            return None
+        list_serializer_class = UserNameListSerializer
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -338,11 +319,49 @@ class TicketRevisionFilterSerializer(serializers.ModelSerializer):
             'export')
 
 
+SLA_KEY_FIELDS = ('department_id', 'ticket_type', 'ticket_priority')
+SLA_DEADLINE_FIELDS = ('response_within', 'resolution_within')
+# number tickets under a counter row lock without holes instead of from per-process blocks
+TICKET_NUMBER_GAP_FREE = getattr(settings, 'TICKET_NUMBER_GAP_FREE', False)
+
+
+def validate_unique_ticket_no(instance, value):
+    # the sequence skips stored numbers, a client supplied one must not take a number in use either
+    if value and Ticket.objects.filter(ticket_no=value).exclude(pk=getattr(instance, 'pk', None)).exists():
+        raise serializers.ValidationError("Ticket number already exists.")
+    return value
+
+
+def ticket_sla_deadlines(department, ticket_type, priority, start=None):
+    return sla_deadlines(getattr(department, 'pk', department), getattr(ticket_type, 'pk', ticket_type), priority,
+                         start)
+
+
 class TicketSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ticket
         fields = '__all__'
-        read_only_fields = ('created_by', 'updated_by', 'created_at', 'updated_at', 'deleted_at')
+        read_only_fields = ('created_by', 'updated_by', 'created_at', 'updated_at', 'deleted_at', 'sla_changed_at')
+        extra_kwargs = {'ticket_no': {'required': False}}
+
+    def validate_ticket_no(self, value):
+        return validate_unique_ticket_no(self.instance, value)
+
+    def create(self, validated_data):
+        # deadlines from the in-memory SLA matrix unless the client sent them
+        if not any(validated_data.get(field) for field in SLA_DEADLINE_FIELDS):
+            validated_data.update(ticket_sla_deadlines(*(validated_data.get(field) for field in SLA_KEY_FIELDS)))
+        else:
+            # a client sent deadline can already lie behind the breach sweep watermark
+            validated_data['sla_changed_at'] = timezone.now()
+        if not validated_data.get('ticket_no'):
+            if TICKET_NUMBER_GAP_FREE:
+                # the counter row stays locked until the ticket is inserted, a failed insert returns the number
+                with transaction.atomic():
+                    validated_data['ticket_no'] = next_number('ticket', gap_free=True)
+                    return super().create(validated_data)
+            validated_data['ticket_no'] = next_number('ticket')
+        return super().create(validated_data)
 
 
 class TicketUpdateSerializer(serializers.ModelSerializer):
@@ -360,9 +379,27 @@ class TicketUpdateSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('created_by', 'created_at', 'updated_by', 'updated_at', 'deleted_at')
 
+    def validate_ticket_no(self, value):
+        return validate_unique_ticket_no(self.instance, value)
+
+    def update(self, instance, validated_data):
+        # department, ticket type or priority changed: move the deadlines unless the client sent them
+        sla_changed = any(field in validated_data and validated_data[field] != getattr(instance, field)
+                          for field in SLA_KEY_FIELDS)
+        if sla_changed and not any(field in validated_data for field in SLA_DEADLINE_FIELDS):
+            validated_data.update(ticket_sla_deadlines(
+                *(validated_data.get(field, getattr(instance, field)) for field in SLA_KEY_FIELDS),
+                start=instance.created_at))
+        if any(field in validated_data and validated_data[field] != getattr(instance, field)
+               for field in SLA_DEADLINE_FIELDS):
+            # a deadline moved behind the breach sweep watermark is only found through sla_changed_at
+            validated_data['sla_changed_at'] = timezone.now()
+        return super().update(instance, validated_data)
+
 
 class TicketFilterSerializer(serializers.ModelSerializer):
     ticket_no = serializers.CharField(max_length=10, required=False, allow_blank=True, allow_null=True)
+    ticket_no_match = serializers.ChoiceField(choices=("contains", "prefix"), default="contains", required=False)
     ticket_status = serializers.IntegerField(required=False, allow_null=True)
     ticket_category = serializers.IntegerField(required=False, allow_null=True)
     ticket_type = serializers.IntegerField(required=False, allow_null=True)
@@ -377,15 +414,16 @@ class TicketFilterSerializer(serializers.ModelSerializer):
     order_type = serializers.CharField(required=False, allow_blank=True, allow_null=True)
     page = serializers.IntegerField(required=False, allow_null=True)
     per_page = serializers.IntegerField(required=False, allow_null=True)
+    cursor = serializers.CharField(required=False, allow_blank=True, allow_null=True)
     export = serializers.BooleanField(required=False, allow_null=True, default=False)
 
     class Meta:
         model = Ticket
         fields = (
-            'ticket_no', 'ticket_status', 'ticket_category', 'ticket_type', 'department_id', 'project_id',
-            'ticket_priority',
+            'ticket_no', 'ticket_no_match', 'ticket_status', 'ticket_category', 'ticket_type', 'department_id',
+            'project_id', 'ticket_priority',
             'created_at', 'created_by', 'updated_at', 'updated_by', 'order_by', 'order_type', 'page', 'per_page',
-            'export')
+            'cursor', 'export')
 
 
 class PrioritySerializer(serializers.ModelSerializer):
@@ -415,6 +453,11 @@ class TicketTypeReadSerializer(serializers.ModelSerializer):
 
 
 class SLASerializer(serializers.ModelSerializer):
+    # required but nullable, null matches any department, ticket type or priority
+    department = serializers.PrimaryKeyRelatedField(queryset=Department.objects.all(), allow_null=True)
+    ticket_type = serializers.PrimaryKeyRelatedField(queryset=TicketType.objects.all(), allow_null=True)
+    priority = serializers.PrimaryKeyRelatedField(queryset=Priority.objects.all(), allow_null=True)
+
     class Meta:
         model = SLA
         fields = "__all__"
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import SLA
+from .sla import invalidate_sla_matrix
+
+
+@receiver(post_save, sender=SLA)
+@receiver(post_delete, sender=SLA)
+def sla_changed(sender, **kwargs):
+    invalidate_sla_matrix()
@@ -0,0 +1,117 @@
+import threading
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import SLA
+
+SLA_VERSION_KEY = "sla_matrix_version"
+
+_matrix = None
+_matrix_version = None
+_matrix_lock = threading.Lock()
+
+
+def get_sla_version():
+    version = cache.get(SLA_VERSION_KEY)
+    if version is None:
+        cache.add(SLA_VERSION_KEY, 1, None)
+        version = cache.get(SLA_VERSION_KEY, 1)
+    return version
+
+
+def invalidate_sla_matrix():
+    """
+    Drop the loaded matrix in every process, called from the SLA signals
+    """
+    global _matrix, _matrix_version
+    try:
+        cache.incr(SLA_VERSION_KEY)
+    except ValueError:
+        cache.add(SLA_VERSION_KEY, 2, None)
+    with _matrix_lock:
+        _matrix = None
+        _matrix_version = None
+
+
+class SLAMatrix:
+    """
+    SLA rules keyed on (department_id, ticket_type_id, priority_id), None is the wildcard.
+    A lookup tries the exact triple first and falls back to rules with more wildcards, department matches
+    outrank ticket type matches which outrank priority matches.
+    """
+    # which parts of the key are kept, most specific first
+    FALLBACKS = (
+        (True, True, True),
+        (True, True, False),
+        (True, False, True),
+        (True, False, False),
+        (False, True, True),
+        (False, True, False),
+        (False, False, True),
+        (False, False, False),
+    )
+
+    def __init__(self, rules):
+        self.rules = {}
+        for department_id, ticket_type_id, priority_id, response_time, resolution_time in rules:
+            self.rules[(department_id, ticket_type_id, priority_id)] = (response_time, resolution_time)
+
+    @classmethod
+    def load(cls):
+        return cls(SLA.objects.filter(is_delete=False).order_by("created_at").values_list(
+            "department_id", "ticket_type_id", "priority_id", "response_time", "resolution_time"))
+
+    def __len__(self):
+        return len(self.rules)
+
+    def resolve(self, department_id, ticket_type_id, priority_id):
+        """
+        Return (response_time, resolution_time) of the best matching rule or None
+        """
+        key = (department_id, ticket_type_id, priority_id)
+        for keep in self.FALLBACKS:
+            rule = self.rules.get(tuple(value if kept else None for value, kept in zip(key, keep)))
+            if rule is not None:
+                return rule
+        return None
+
+
+def get_sla_matrix():
+    """
+    The matrix of this process, loaded with one query and kept until an SLA is saved or deleted
+    """
+    global _matrix, _matrix_version
+    version = get_sla_version()
+    with _matrix_lock:
+        if _matrix is not None and _matrix_version == version:
+            return _matrix
+    matrix = SLAMatrix.load()
+    with _matrix_lock:
+        _matrix = matrix
+        _matrix_version = version
+    return matrix
+
+
+def sla_deadlines(department_id, ticket_type_id, priority_id, start=None):
+    """
+    Return {"response_within", "resolution_within"} counted from start (now by default), empty when no rule matches
+    """
+    rule = get_sla_matrix().resolve(department_id, ticket_type_id, priority_id)
+    if rule is None:
+        return {}
+    start = start or timezone.now()
+    response_time, resolution_time = rule
+    return {"response_within": start + response_time, "resolution_within": start + resolution_time}
+
+
+def apply_sla(ticket, start=None):
+    """
+    Fill response_within and resolution_within of ticket, counted from its creation time by default.
+    Returns False when no rule matches.
+    """
+    deadlines = sla_deadlines(ticket.department_id_id, ticket.ticket_type_id, ticket.ticket_priority,
+                              start or ticket.created_at)
+    for field, value in deadlines.items():
+        setattr(ticket, field, value)
+    return bool(deadlines)
@@ -0,0 +1,154 @@
+import zoneinfo
+from datetime import time, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .sla import get_sla_matrix
+
+# working window of a business day, wall-clock time of the calendar's time zone
+SLA_WORKDAY_START = getattr(settings, "SLA_WORKDAY_START", "09:00")
+SLA_WORKDAY_END = getattr(settings, "SLA_WORKDAY_END", "18:00")
+# numpy weekmask, Monday first
+SLA_WEEKMASK = getattr(settings, "SLA_WEEKMASK", "1111100")
+# dates ("YYYY-MM-DD") on which the clock doesn't run
+SLA_HOLIDAYS = getattr(settings, "SLA_HOLIDAYS", [])
+
+EPOCH = np.datetime64("1970-01-01", "D")
+
+SLA_CLOCK_FIELDS = {
+    "response": ("response_at", 0),
+    "resolution": ("resolution_at", 1),
+}
+
+
+def _seconds_of_day(value):
+    if isinstance(value, str):
+        value = time.fromisoformat(value)
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def _utc_datetime64(values):
+    """
+    datetime64[s] array in UTC of aware datetimes, None becomes NaT
+    """
+    return np.array([value.astimezone(dt_timezone.utc).replace(tzinfo=None) if value else None
+                     for value in values], dtype="datetime64[s]")
+
+
+class BusinessCalendar:
+    """
+    Business time of one time zone: a daily working window on the weekmask days, minus holidays.
+    The arithmetic works on whole datetime64 arrays, there is no per-ticket loop.
+    """
+
+    def __init__(self, workday_start=SLA_WORKDAY_START, workday_end=SLA_WORKDAY_END, weekmask=SLA_WEEKMASK,
+                 holidays=SLA_HOLIDAYS, tz=None):
+        self.day_start = _seconds_of_day(workday_start)
+        self.day_end = _seconds_of_day(workday_end) or 24 * 3600
+        if self.day_end <= self.day_start:
+            raise ValueError("workday_end must be later than workday_start")
+        self.day_length = self.day_end - self.day_start
+        self.busdaycal = np.busdaycalendar(weekmask=weekmask, holidays=list(holidays))
+        self.tz = zoneinfo.ZoneInfo(tz) if isinstance(tz, str) else tz or timezone.get_default_timezone()
+
+    def utc_offset(self, moment):
+        """
+        Offset in seconds of the calendar's zone at the naive UTC datetime moment
+        """
+        return int(moment.replace(tzinfo=dt_timezone.utc).astimezone(self.tz).utcoffset().total_seconds())
+
+    def localize(self, moments):
+        """
+        Wall-clock time in the calendar's zone of a UTC datetime64[s] array.
+        The UTC offset is looked up once per distinct hour, which covers every DST change.
+        """
+        moments = np.asarray(moments, dtype="datetime64[s]")
+        valid = ~np.isnat(moments)
+        hours, positions = np.unique(moments[valid].astype("datetime64[h]"), return_inverse=True)
+        offsets = np.array([self.utc_offset(hour.item()) for hour in hours], dtype=np.int64)
+        local = moments.copy()
+        local[valid] += offsets[positions.ravel()].astype("timedelta64[s]")
+        return local
+
+    def to_datetime64(self, values):
+        """
+        Wall-clock datetime64[s] array in the calendar's zone of aware datetimes, None becomes NaT
+        """
+        return self.localize(_utc_datetime64(values))
+
+    def business_seconds_since_epoch(self, moments):
+        """
+        Business seconds between 1970-01-01 and every wall-clock moment, differences are elapsed business time
+        """
+        days = moments.astype("datetime64[D]")
+        second_of_day = (moments - days).astype(np.int64)
+        whole_days = np.busday_count(EPOCH, days, busdaycal=self.busdaycal).astype(np.int64)
+        today = np.where(np.is_busday(days, busdaycal=self.busdaycal),
+                         np.clip(second_of_day - self.day_start, 0, self.day_length), 0)
+        return whole_days * self.day_length + today
+
+    def elapsed(self, starts, ends, hold_from=None, hold_to=None):
+        """
+        Business seconds from starts to ends of wall-clock arrays, the part of [hold_from, hold_to) inside
+        doesn't count. A NaT hold_from means no hold and a NaT hold_to a hold that is still running.
+        """
+        starts = np.asarray(starts, dtype="datetime64[s]")
+        ends = np.maximum(np.asarray(ends, dtype="datetime64[s]"), starts)
+        clock = self.business_seconds_since_epoch
+        elapsed = clock(ends) - clock(starts)
+        if hold_from is None:
+            return elapsed
+        hold_from = np.asarray(hold_from, dtype="datetime64[s]")
+        hold_to = np.asarray(hold_to, dtype="datetime64[s]")
+        on_hold = ~np.isnat(hold_from)
+        # clamp the hold into [starts, ends], no hold collapses to the empty range [starts, starts)
+        hold_start = np.minimum(np.maximum(np.where(on_hold, hold_from, starts), starts), ends)
+        hold_end = np.where(on_hold, np.where(np.isnat(hold_to), ends, hold_to), starts)
+        hold_end = np.maximum(np.minimum(hold_end, ends), hold_start)
+        return elapsed - (clock(hold_end) - clock(hold_start))
+
+
+_calendars = {}
+
+
+def get_business_calendar(tz=None):
+    """
+    Calendar of the configured business hours in tz (e.g. CustomUser.timezone), the default time zone when empty
+    """
+    key = tz or settings.TIME_ZONE
+    if key not in _calendars:
+        _calendars[key] = BusinessCalendar(tz=key)
+    return _calendars[key]
+
+
+def ticket_sla_remaining(queryset, kind="resolution", now=None, calendar=None):
+    """
+    Remaining business seconds of the response or resolution SLA of every ticket of queryset.
+    The clock starts at created_at, stops at response_at/resolution_at or now and pauses while on hold.
+    Returns (ticket ids, remaining seconds) arrays, remaining is negative once breached and NaN without an SLA.
+    """
+    calendar = calendar or get_business_calendar()
+    done_field, target_index = SLA_CLOCK_FIELDS[kind]
+    rows = list(queryset.order_by().values_list("id", "department_id_id", "ticket_type_id", "ticket_priority",
+                                                "created_at", "hold_from", "hold_to", done_field))
+    if not rows:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+    ids, departments, ticket_types, priorities, created, hold_from, hold_to, done = zip(*rows)
+
+    # one matrix lookup per distinct (department, ticket type, priority)
+    matrix = get_sla_matrix()
+    keys = list(zip(departments, ticket_types, priorities))
+    targets = {}
+    for key in set(keys):
+        rule = matrix.resolve(*key)
+        targets[key] = rule[target_index].total_seconds() if rule else np.nan
+    target_seconds = np.array([targets[key] for key in keys], dtype=np.float64)
+
+    now = calendar.localize(_utc_datetime64([now or timezone.now()]))[0]
+    ends = calendar.to_datetime64(done)
+    ends[np.isnat(ends)] = now
+    elapsed = calendar.elapsed(calendar.to_datetime64(created), ends,
+                               calendar.to_datetime64(hold_from), calendar.to_datetime64(hold_to))
+    return np.array(ids, dtype=np.int64), target_seconds - elapsed
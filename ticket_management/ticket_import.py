@@ -0,0 +1,342 @@
+import csv
+import io
+import re
+import xml.etree.ElementTree as ET
+import zipfile
+import zlib
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from acl.sequences import allocate_numbers
+from case_management.pagination import bump_table_version
+from .models import Department, Priority, Status, Ticket, TicketType
+from .sla import get_sla_matrix
+
+# tickets inserted per bulk_create statement
+TICKET_IMPORT_BATCH_SIZE = getattr(settings, "TICKET_IMPORT_BATCH_SIZE", 2000)
+# rows listed in the error report, later failures are only counted
+TICKET_IMPORT_MAX_ERRORS = getattr(settings, "TICKET_IMPORT_MAX_ERRORS", 1000)
+
+# header of the upload -> ticket field, headers are matched case-insensitively
+IMPORT_COLUMNS = {
+    "ticket_no": "ticket_no",
+    "ticket_status": "ticket_status",
+    "status": "ticket_status",
+    "ticket_header": "ticket_header",
+    "ticket_details": "ticket_details",
+    "on_behalf": "on_behalf",
+    "ticket_category": "ticket_category",
+    "ticket_type": "ticket_type",
+    "department": "department_id",
+    "department_id": "department_id",
+    "project_id": "project_id",
+    "ticket_priority": "ticket_priority",
+    "priority": "ticket_priority",
+    "tags": "tags",
+    "comments": "comments",
+}
+REQUIRED_FIELDS = ("ticket_status", "ticket_header", "ticket_details", "on_behalf", "ticket_category",
+                   "ticket_type", "department_id", "project_id", "ticket_priority")
+# resolved against the preloaded lookup tables, the value may be the id or the name
+LOOKUP_FIELDS = ("ticket_status", "ticket_type", "department_id", "ticket_priority")
+INTEGER_FIELDS = ("on_behalf", "ticket_category", "project_id")
+MAX_LENGTHS = {"ticket_no": 10, "ticket_header": 200, "ticket_details": 500, "tags": 200, "comments": 500}
+# model attribute written for every resolved field
+TICKET_ATTRIBUTES = {"ticket_type": "ticket_type_id", "department_id": "department_id_id"}
+
+# columns written by an import, values of the plain ones are taken from the parsed row as they are
+PLAIN_INSERT_FIELDS = ("ticket_no", "ticket_status", "ticket_header", "ticket_details", "on_behalf",
+                       "ticket_category", "project_id", "ticket_priority", "tags", "comments")
+INSERT_FIELDS = PLAIN_INSERT_FIELDS + ("department_id", "ticket_type", "response_within", "resolution_within",
+                                       "is_delete", "created_by", "created_at")
+
+XLSX_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+# raised while reading a damaged or wrongly encoded upload, UnicodeDecodeError is a ValueError
+UNREADABLE_FILE_ERRORS = (ValueError, IndexError, csv.Error, ET.ParseError, zipfile.BadZipFile, zlib.error, EOFError)
+
+DUPLICATE_TICKET_NO = "Ticket number already exists."
+
+
+class UnsupportedImportFile(Exception):
+    pass
+
+
+class TicketNumbersExhausted(Exception):
+    pass
+
+
+def _lookup(rows):
+    table = {}
+    for pk, *names in rows:
+        for name in names:
+            if name:
+                table[str(name).strip().lower()] = pk
+    # ids win over a name that happens to look like an id
+    table.update((str(row[0]).lower(), row[0]) for row in rows)
+    return table
+
+
+def build_lookups():
+    """
+    id and name -> id of every Department, TicketType, Priority and Status, one query per table
+    """
+    return {
+        "department_id": _lookup(list(Department.objects.values_list("id", "department_name"))),
+        "ticket_type": _lookup(list(TicketType.objects.values_list("id", "name"))),
+        "ticket_priority": _lookup(list(Priority.objects.values_list("id", "name", "level"))),
+        "ticket_status": _lookup(list(Status.objects.values_list("id", "name"))),
+    }
+
+
+def _to_int(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not number.is_integer() or number < 0:
+        return None
+    return int(number)
+
+
+def parse_row(values, lookups):
+    """
+    Return (ticket field values, {field: error}) of one upload row given as {field: text}
+    """
+    fields, errors = {}, {}
+    for field, value in values.items():
+        value = value.strip() if isinstance(value, str) else value
+        if value in (None, ""):
+            continue
+        if field in LOOKUP_FIELDS:
+            pk = lookups[field].get(str(value).lower())
+            if pk is None:
+                errors[field] = f"Unknown value '{value}'."
+            fields[TICKET_ATTRIBUTES.get(field, field)] = pk
+        elif field in INTEGER_FIELDS:
+            number = _to_int(value)
+            if number is None:
+                errors[field] = "A positive whole number is required."
+            fields[field] = number
+        else:
+            value = str(value)
+            if len(value) > MAX_LENGTHS.get(field, len(value)):
+                errors[field] = f"Ensure this field has no more than {MAX_LENGTHS[field]} characters."
+            fields[field] = value
+    for field in REQUIRED_FIELDS:
+        if field not in errors and fields.get(TICKET_ATTRIBUTES.get(field, field)) is None:
+            errors[field] = "This field is required."
+    return fields, errors
+
+
+def _insert_sql(fields):
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(Ticket._meta.get_field(field).column) for field in fields)
+    return f"INSERT INTO {quote(Ticket._meta.db_table)} ({columns}) VALUES ({', '.join(['%s'] * len(fields))})"
+
+
+def _db_value(field, value):
+    return Ticket._meta.get_field(field).get_db_prep_save(value, connection)
+
+
+def insert_tickets(rows, user_id=None):
+    """
+    Insert parsed rows with one executemany over the columns an import fills, the rest keep their NULL default.
+    Values needing conversion (dates, uuids) are prepared once per distinct value instead of once per row and
+    field as bulk_create would, which dominates the cost of wide rows. Deadlines come from the SLA matrix and
+    missing ticket numbers from one sequence reservation.
+    """
+    now = timezone.now()
+    matrix = get_sla_matrix()
+    created_at, is_delete = _db_value("created_at", now), _db_value("is_delete", False)
+    deadlines, ticket_types = {}, {}
+    params = []
+    with transaction.atomic():
+        missing = [row for row in rows if not row.get("ticket_no")]
+        supplied = {row["ticket_no"] for row in rows if row.get("ticket_no")}
+        numbers = []
+        while len(numbers) < len(missing):
+            # the sequence skips stored numbers, the ones supplied by this batch aren't stored yet
+            numbers.extend(number for number in allocate_numbers("ticket", len(missing) - len(numbers))
+                           if number not in supplied)
+        if numbers and len(numbers[-1]) > MAX_LENGTHS["ticket_no"]:
+            # raised inside the transaction, the reservation is rolled back
+            raise TicketNumbersExhausted(f"The ticket number series is exhausted, {numbers[-1]} is longer than "
+                                         f"{MAX_LENGTHS['ticket_no']} characters.")
+        for row, number in zip(missing, numbers):
+            row["ticket_no"] = number
+        for row in rows:
+            key = (row["department_id_id"], row["ticket_type_id"], row["ticket_priority"])
+            if key not in deadlines:
+                rule = matrix.resolve(*key)
+                deadlines[key] = (_db_value("response_within", now + rule[0]),
+                                  _db_value("resolution_within", now + rule[1])) if rule else (None, None)
+            if key[1] not in ticket_types:
+                ticket_types[key[1]] = _db_value("ticket_type", key[1])
+            params.append(tuple(row.get(field) for field in PLAIN_INSERT_FIELDS) +
+                          (key[0], ticket_types[key[1]], *deadlines[key], is_delete, user_id, created_at))
+        with connection.cursor() as cursor:
+            cursor.executemany(_insert_sql(INSERT_FIELDS), params)
+    # the raw insert sends no post_save, cached ticket counts are dropped here instead
+    bump_table_version(Ticket)
+    return len(params)
+
+
+def _report_error(report, row_number, errors, max_errors):
+    report["failed"] += 1
+    if len(report["errors"]) < max_errors:
+        report["errors"].append({"row": row_number, "errors": errors})
+
+
+def drop_taken_numbers(batch, report, max_errors=TICKET_IMPORT_MAX_ERRORS):
+    """
+    Report the (row number, fields) pairs of batch whose ticket_no is already stored, return the fields of the rest.
+    """
+    supplied = [fields["ticket_no"] for _, fields in batch if fields.get("ticket_no")]
+    taken = set(Ticket.objects.filter(ticket_no__in=supplied).values_list("ticket_no", flat=True)) if supplied else ()
+    rows = []
+    for row_number, fields in batch:
+        if fields.get("ticket_no") in taken:
+            _report_error(report, row_number, {"ticket_no": DUPLICATE_TICKET_NO}, max_errors)
+        else:
+            rows.append(fields)
+    return rows
+
+
+def import_tickets(rows, user_id=None, dry_run=False, batch_size=TICKET_IMPORT_BATCH_SIZE,
+                   max_errors=TICKET_IMPORT_MAX_ERRORS):
+    """
+    Validate (row number, {field: text}) pairs and insert the valid ones batch by batch.
+    Invalid rows, and rows whose ticket_no is stored or used by an earlier row of the file, are skipped and
+    reported, every batch commits on its own. A file that can't be read any further or a ticket number series
+    running out stops the import with a "fatal" entry, the batches before it are kept.
+    """
+    lookups = build_lookups()
+    report = {"total_rows": 0, "imported": 0, "failed": 0, "errors": []}
+    batch = []
+    seen = set()
+    rows = iter(rows)
+    last_row = None
+
+    def flush():
+        valid = drop_taken_numbers(batch, report, max_errors)
+        report["imported"] += len(valid) if dry_run or not valid else insert_tickets(valid, user_id)
+
+    try:
+        while True:
+            try:
+                row_number, values = next(rows)
+            except StopIteration:
+                break
+            except UNREADABLE_FILE_ERRORS as ee:
+                report["fatal"] = {"after_row": last_row, "error": f"The file could not be read: {ee}"}
+                break
+            last_row = row_number
+            report["total_rows"] += 1
+            fields, errors = parse_row(values, lookups)
+            if "ticket_no" not in errors and fields.get("ticket_no") in seen:
+                errors["ticket_no"] = DUPLICATE_TICKET_NO
+            if errors:
+                _report_error(report, row_number, errors, max_errors)
+                continue
+            if fields.get("ticket_no"):
+                seen.add(fields["ticket_no"])
+            batch.append((row_number, fields))
+            if len(batch) >= batch_size:
+                flush()
+                batch = []
+        if batch:
+            flush()
+    except TicketNumbersExhausted as ee:
+        report["fatal"] = {"after_row": last_row, "error": str(ee)}
+    # stored numbers are only reported when their batch is flushed
+    report["errors"].sort(key=lambda error: error["row"])
+    return report
+
+
+def _with_header(rows):
+    """
+    Turn (row number, [cells]) into (row number, {field: cell}) using the first row as header
+    """
+    columns = None
+    for row_number, cells in rows:
+        if columns is None:
+            columns = [IMPORT_COLUMNS.get(str(cell or "").strip().lower()) for cell in cells]
+            if not any(columns):
+                raise UnsupportedImportFile("The first row must hold the column names.")
+            continue
+        if not any(cell not in (None, "") for cell in cells):
+            continue
+        yield row_number, {field: cell for field, cell in zip(columns, cells) if field}
+
+
+def iter_csv_rows(file):
+    reader = csv.reader(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+    return _with_header((reader.line_num, cells) for cells in reader)
+
+
+def _column_index(reference):
+    index = 0
+    for letter in re.match(r"[A-Z]+", reference).group():
+        index = index * 26 + ord(letter) - 64
+    return index - 1
+
+
+def _shared_strings(archive):
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return []
+    strings = []
+    with archive.open("xl/sharedStrings.xml") as stream:
+        for _, element in ET.iterparse(stream):
+            if element.tag == XLSX_NS + "si":
+                strings.append("".join(text.text or "" for text in element.iter(XLSX_NS + "t")))
+                element.clear()
+    return strings
+
+
+def _xlsx_cells(archive, sheet, strings):
+    with archive.open(sheet) as stream:
+        for _, element in ET.iterparse(stream):
+            if element.tag != XLSX_NS + "row":
+                continue
+            row_number = int(element.get("r") or 0)
+            cells = {}
+            for cell in element.iter(XLSX_NS + "c"):
+                kind = cell.get("t")
+                if kind == "inlineStr":
+                    value = "".join(text.text or "" for text in cell.iter(XLSX_NS + "t"))
+                else:
+                    node = cell.find(XLSX_NS + "v")
+                    value = node.text if node is not None else None
+                    if kind == "s" and value is not None:
+                        value = strings[int(value)]
+                reference = cell.get("r")
+                cells[_column_index(reference) if reference else len(cells)] = value
+            # drop the parsed row, only the current one is kept in memory
+            element.clear()
+            yield row_number, [cells.get(index) for index in range(max(cells, default=-1) + 1)]
+
+
+def iter_xlsx_rows(file):
+    """
+    Rows of the first worksheet, parsed incrementally from the zip instead of loading the workbook
+    """
+    archive = zipfile.ZipFile(file)
+    sheets = [name for name in archive.namelist() if re.match(r"xl/worksheets/sheet\d+\.xml$", name)]
+    if not sheets:
+        raise UnsupportedImportFile("The workbook has no worksheet.")
+    sheets.sort(key=lambda name: int(re.search(r"\d+", name.rsplit("/", 1)[1]).group()))
+    return _with_header(_xlsx_cells(archive, sheets[0], _shared_strings(archive)))
+
+
+def iter_upload_rows(upload):
+    name = upload.name.lower()
+    if name.endswith(".csv"):
+        return iter_csv_rows(upload.file)
+    if name.endswith(".xlsx"):
+        try:
+            return iter_xlsx_rows(upload.file)
+        except UNREADABLE_FILE_ERRORS:
+            raise UnsupportedImportFile("The file is not a valid xlsx workbook.")
+    raise UnsupportedImportFile("Upload a .csv or .xlsx file.")
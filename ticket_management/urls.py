@@ -40,6 +40,7 @@ urlpatterns = [
     # Ticket URLs  (tested api level 2 - written Unit test case)
     path('v1', views.TicketCreateAPI.as_view(), name='ticket_create'),
     path('v1/list/filter', views.TicketFilterAPI.as_view(), name='ticket_filter'),
+    path('v1/import', views.TicketImportAPI.as_view(), name='ticket_import'),
     path('v1/<int:pk>', views.TicketUpdateAPI.as_view(), name='ticket_detail'),
 
     # TicketBehalf URLs (tested api level 2)
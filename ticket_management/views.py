@@ -9,10 +9,12 @@ from .models import Department, Status, Category, ProjectManagement, TicketType,
 from .permissions import permission_user_department_create, \
     permission_user_department_view, permission_user_department_edit, permission_user_department_delete, \
     permission_priority_edit, permission_priority_delete, permission_priority_create, permission_priority_view, \
-    permission_sla_edit, permission_sla_view, permission_sla_create, permission_ticket_type_create
+    permission_sla_edit, permission_sla_view, permission_sla_create, permission_ticket_type_create, \
+    permission_ticket_create
 from rest_framework import generics
 from .models import Department, Status, Category, ProjectManagement, TicketType, TicketFollower, TicketRevision, \
     Ticket, Priority
+from .ticket_import import UnsupportedImportFile, import_tickets, iter_upload_rows
 from .serializers import DepartmentSerializer, StatusSerializer, StatusReadSerializer, \
     StatusFilterSerializer, CategorySerializer, \
     CategoryFilterSerializer, ProjectFilterSerializers, ProjectManagementReadSerializer, ProjectManagementSerializer, \
@@ -24,12 +26,13 @@ from .serializers import DepartmentSerializer, StatusSerializer, StatusReadSeria
     UserDepartmentSerializer, PrioritySerializer, DepartmentReadSerializer, \
     TicketTypeReadSerializer, TicketTypeFilterSerializer, SLASerializer, SLAUpdateSerializer, SLAFilterSerializer
 from acl.privilege import CozentusPermission
-from django.core.paginator import Paginator
+from case_management.pagination import KeysetPaginator, CountCachingPaginator, approximate_requested
 from django.utils import timezone
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import generics, status
 from rest_framework.generics import CreateAPIView, RetrieveUpdateDestroyAPIView
 from rest_framework.generics import CreateAPIView, RetrieveUpdateDestroyAPIView, ListCreateAPIView
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from . import serializers
@@ -128,14 +131,15 @@ class StatusFilterApi(APIView):
             #     results = StatusReadSerializer(queryset, many=True)
             #     return export_query_to_excel(data=results.data, module_name="STATUS_DATA")
             # Create Paginator object with page_size objects per page
-            paginator = Paginator(queryset, page_size)
+            paginator = CountCachingPaginator(queryset, page_size,
+                                              approximate=approximate_requested(request.data))
             number_pages = paginator.num_pages
             if page > number_pages:
                 return Response({"message": "Page not found"}, status=status.HTTP_400_BAD_REQUEST)
             # Get the page object for the requested page number
             page_obj = paginator.get_page(page)
             serializer = StatusFilterSerializer(page_obj, many=True)
-            return Response({"count": len(queryset), "results": serializer.data})
+            return Response({"count": paginator.count, "results": serializer.data})
         # except serializers.ValidationError as ve:
         #     raise serializers.ValidationError(ve.detail)
         except Exception as ee:
@@ -179,7 +183,8 @@ class CategoryFilterApi(APIView):
             #     return export_query_to_excel(data=category_results.data, module_name="CATEGORY_DATA")
 
             # Create Paginator object with page_size objects per page
-            category_paginator = Paginator(categories, page_size)
+            category_paginator = CountCachingPaginator(categories, page_size,
+                                                       approximate=approximate_requested(request.data))
             category_number_pages = category_paginator.num_pages
 
             if page > category_number_pages:
@@ -189,7 +194,7 @@ class CategoryFilterApi(APIView):
             category_page_obj = category_paginator.get_page(page)
             category_serializer = CategoryFilterSerializer(category_page_obj, many=True)
 
-            return Response({'count': categories.count(), 'results': category_serializer.data},
+            return Response({'count': category_paginator.count, 'results': category_serializer.data},
                             status=status.HTTP_200_OK)
         except serializers.ValidationError as ve:
             raise serializers.ValidationError(ve.detail)
@@ -325,7 +330,8 @@ class ProjectFilterApi(APIView):
             # if data.get("export"):
             #     result = self.serializer_class(queryset, many=True)
             #     return export_query_to_excel(result.data, module_name="CODELIST_LIBRARY")
-            paginator = Paginator(queryset, page_size)
+            paginator = CountCachingPaginator(queryset, page_size,
+                                              approximate=approximate_requested(request.data))
             number_pages = paginator.num_pages
             if page > number_pages:
                 return Response({"message": "Page not found"}, status=status.HTTP_400_BAD_REQUEST)
@@ -333,7 +339,7 @@ class ProjectFilterApi(APIView):
             page_obj = paginator.get_page(page)
             serializer = self.serializer_class(page_obj, many=True)
             data = serializer.data
-            return Response({"count": queryset.count(), "results": data})
+            return Response({"count": paginator.count, "results": data})
 
         except ValueError as e:
             return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -411,7 +417,8 @@ class DepartmentFilterApi(APIView):
             #     return export_query_to_excel(data=results.data, module_name="DEPARTMENT_MANAGEMENT")
 
             # Create Paginator object with page_size objects per page
-            paginator = Paginator(departments, page_size)
+            paginator = CountCachingPaginator(departments, page_size,
+                                              approximate=approximate_requested(request.data))
             number_pages = paginator.num_pages
 
             if page > number_pages and page > 1:
@@ -421,7 +428,7 @@ class DepartmentFilterApi(APIView):
             page_obj = paginator.get_page(page)
             results = DepartmentReadSerializer(page_obj, many=True)
 
-            return Response({'count': departments.count(), 'results': results.data}, status=status.HTTP_200_OK)
+            return Response({'count': paginator.count, 'results': results.data}, status=status.HTTP_200_OK)
 
         except FieldError as fe:
             print("Error 1")
@@ -594,14 +601,15 @@ class TicketFollowerFilterAPI(APIView):
                 if order_type == "desc":
                     query_filter = f"-{query_filter}"
                 queryset = queryset.order_by(query_filter)
-            paginator = Paginator(queryset, per_page)
+            paginator = CountCachingPaginator(queryset, per_page,
+                                              approximate=approximate_requested(request.data))
             number_pages = paginator.num_pages
             if page > number_pages:
                 return Response({"message": "Page not found"}, status=status.HTTP_400_BAD_REQUEST)
             page_obj = paginator.get_page(page)
             serializer = TicketFollowerSerializer(page_obj, many=True)
             data = serializer.data
-            return Response({"count": queryset.count(), "results": data})
+            return Response({"count": paginator.count, "results": data})
 
         except ValueError as e:
             return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -665,14 +673,15 @@ class TicketRevisionFilterAPI(APIView):
                 if order_type == "desc":
                     query_filter = f"-{query_filter}"
                 queryset = queryset.order_by(query_filter)
-            paginator = Paginator(queryset, per_page)
+            paginator = CountCachingPaginator(queryset, per_page,
+                                              approximate=approximate_requested(request.data))
             number_pages = paginator.num_pages
             if page > number_pages:
                 return Response({"message": "Page not found"}, status=status.HTTP_400_BAD_REQUEST)
             page_obj = paginator.get_page(page)
             serializer = TicketRevisionSerializer(page_obj, many=True)
             data = serializer.data
-            return Response({"count": queryset.count(), "results": data})
+            return Response({"count": paginator.count, "results": data})
 
         except ValueError as e:
             return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -692,6 +701,32 @@ class TicketCreateAPI(CreateAPIView):
     serializer_class = TicketSerializer
 
 
+class TicketImportAPI(APIView):
+    """
+    Create tickets in bulk from an uploaded csv or xlsx file
+    """
+    parser_classes = (MultiPartParser,)
+    permission_classes = (CozentusPermission,)
+    case_management_object_permissions = {
+        'POST': (permission_ticket_create,)
+    }
+
+    def post(self, request):
+        """
+        Validate every row of the "file" upload and insert the valid ones, dry_run only validates.
+        Returns the row counts, the errors of the rejected rows and a "fatal" entry when the import stopped early.
+        """
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response({"message": "file is required"}, status=status.HTTP_400_BAD_REQUEST)
+        dry_run = str(request.data.get("dry_run", "")).lower() in ("1", "true")
+        try:
+            report = import_tickets(iter_upload_rows(upload), request.user.id, dry_run=dry_run)
+        except UnsupportedImportFile as uf:
+            return Response({"message": str(uf)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_200_OK)
+
+
 class TicketFilterAPI(APIView):
     serializer_class = TicketFilterSerializer
     permission_classes = [CozentusPermission]
@@ -723,6 +758,10 @@ class TicketFilterAPI(APIView):
             query_dict = {filter_dict.get(key, None): value for key, value in data.items() if
                           value or isinstance(value, (int, bool))}
             query_dict = {key: value for key, value in query_dict.items() if key}
+            if data.get("ticket_no") and data.get("ticket_no_match") == "prefix":
+                # LIKE '...%' instead of '%...%', served by ticket_no_idx under a case-insensitive collation
+                query_dict.pop("ticket_no__icontains")
+                query_dict["ticket_no__istartswith"] = data["ticket_no"]
             queryset = Ticket.objects.filter(**query_dict)
             order_dict = {
                 "ticket_no": "ticket_no", "ticket_status": "ticket_status",
@@ -731,19 +770,34 @@ class TicketFilterAPI(APIView):
                 "ticket_priority": "ticket_priority", "created_at": "created_at",
                 "created_by": "created_by", "updated_at": "updated_at", "updated_by": "updated_by"
             }
+            if "cursor" in request.data:
+                # keyset mode, seeks on (order column, id) so deep pages cost the same as the first and no COUNT runs
+                cursor_dict = {
+                    "ticket_no": "ticket_no", "ticket_status": "ticket_status",
+                    "ticket_category": "ticket_category", "ticket_type": "ticket_type_id",
+                    "department_id": "department_id_id", "project_id": "project_id",
+                    "ticket_priority": "ticket_priority", "created_at": "created_at",
+                    "created_by": "created_by_id", "updated_at": "updated_at", "updated_by": "updated_by_id"
+                }
+                paginator = KeysetPaginator(queryset, cursor_dict.get(order_by, "id"),
+                                            descending=order_type == "desc", page_size=per_page)
+                page_rows, next_cursor = paginator.get_page(request.data.get("cursor"))
+                serializer = TicketSerializer(page_rows, many=True)
+                return Response({"next_cursor": next_cursor, "results": serializer.data})
             query_filter = order_dict.get(order_by, None)
             if query_filter:
                 if order_type == "desc":
                     query_filter = f"-{query_filter}"
                 queryset = queryset.order_by(query_filter)
-            paginator = Paginator(queryset, per_page)
+            paginator = CountCachingPaginator(queryset, per_page,
+                                              approximate=approximate_requested(request.data))
             number_pages = paginator.num_pages
             if page > number_pages:
                 return Response({"message": "Page not found"}, status=status.HTTP_400_BAD_REQUEST)
             page_obj = paginator.get_page(page)
             serializer = TicketSerializer(page_obj, many=True)
             data = serializer.data
-            return Response({"count": queryset.count(), "results": data})
+            return Response({"count": paginator.count, "results": data})
 
         except ValueError as e:
             return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -803,14 +857,15 @@ class TicketBehalfFilterAPI(APIView):
                 if order_type == "desc":
                     query_filter = f"-{query_filter}"
                 queryset = queryset.order_by(query_filter)
-            paginator = Paginator(queryset, per_page)
+            paginator = CountCachingPaginator(queryset, per_page,
+                                              approximate=approximate_requested(request.data))
             number_pages = paginator.num_pages
             if page > number_pages:
                 return Response({"message": "Page not found"}, status=status.HTTP_400_BAD_REQUEST)
             page_obj = paginator.get_page(page)
             serializer = TicketBehalfSerializer(page_obj, many=True)
             data = serializer.data
-            return Response({"count": queryset.count(), "results": data})
+            return Response({"count": paginator.count, "results": data})
 
         except ValueError as e:
             return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -895,7 +950,8 @@ class TicketTypeFilterApi(APIView):
                 ticket_types = ticket_types.order_by(query_order_by)
 
             # Create Paginator object with page_size objects per page
-            paginator = Paginator(ticket_types, page_size)
+            paginator = CountCachingPaginator(ticket_types, page_size,
+                                              approximate=approximate_requested(request.data))
             number_pages = paginator.num_pages
 
             if page > number_pages and page > 1:
@@ -905,7 +961,7 @@ class TicketTypeFilterApi(APIView):
             page_obj = paginator.get_page(page)
             results = TicketTypeReadSerializer(page_obj, many=True)
 
-            return Response({'count': ticket_types.count(), 'results': results.data}, status=status.HTTP_200_OK)
+            return Response({'count': paginator.count, 'results': results.data}, status=status.HTTP_200_OK)
 
         except FieldError as fe:
             return Response({"message": str(fe)}, status=status.HTTP_400_BAD_REQUEST)
@@ -987,7 +1043,8 @@ class SLAFilterApi(APIView):
             if query_order_by:
                 slas = slas.order_by(query_order_by)
 
-            paginator = Paginator(slas, page_size)
+            paginator = CountCachingPaginator(slas, page_size,
+                                               approximate=approximate_requested(request.data))
             number_pages = paginator.num_pages
 
             if page > number_pages and page > 1:
@@ -996,7 +1053,7 @@ class SLAFilterApi(APIView):
             page_obj = paginator.get_page(page)
             results = SLASerializer(page_obj, many=True)
 
-            return Response({'count': slas.count(), 'results': results.data}, status=status.HTTP_200_OK)
+            return Response({'count': paginator.count, 'results': results.data}, status=status.HTTP_200_OK)
 
         except serializers.ValidationError as ve:
             raise serializers.ValidationError(ve.detail)
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class UserManagementConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'user_management'
+
+    def ready(self):
+        import user_management.signals  # Register signals
+        # the user directory syncs processes through the cache
+        from acl.privilege import check_shared_cache
+        check_shared_cache()
+        from .login import LAST_LOGIN_FLUSH_INTERVAL, start_last_login_scheduler
+        if LAST_LOGIN_FLUSH_INTERVAL:
+            start_last_login_scheduler()
@@ -0,0 +1,176 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .user_names import user_display_name
+
+User = get_user_model()
+
+DIRECTORY_VERSION_KEY = "user_directory_version"
+# seconds a published change is kept for other processes to replay, older gaps rebuild the index
+USER_DIRECTORY_CHANGE_TTL = getattr(settings, "USER_DIRECTORY_CHANGE_TTL", 60 * 60 * 24)
+# changes replayed one by one, a process further behind reloads the whole directory
+USER_DIRECTORY_MAX_REPLAY = getattr(settings, "USER_DIRECTORY_MAX_REPLAY", 1000)
+# fields shown in the directory, saves limited to other fields (e.g. last_login) are not published
+DIRECTORY_FIELDS = frozenset(("first_name", "last_name"))
+
+
+def _change_key(version):
+    return f"user_directory_change_{version}"
+
+
+def get_directory_version():
+    version = cache.get(DIRECTORY_VERSION_KEY)
+    if version is None:
+        # seeded from the clock so a lost key doesn't bring back a version that was used before, in seconds so
+        # it stays below 2 ** 53 and survives JSON clients that read numbers as doubles
+        cache.add(DIRECTORY_VERSION_KEY, int(time.time()), None)
+        version = cache.get(DIRECTORY_VERSION_KEY)
+    return version
+
+
+def publish_user_change(user_id):
+    """
+    Record that user_id changed under a new directory version, every process re-reads it on its next read
+    """
+    try:
+        version = cache.incr(DIRECTORY_VERSION_KEY)
+    except ValueError:
+        get_directory_version()
+        version = cache.incr(DIRECTORY_VERSION_KEY)
+    cache.set(_change_key(version), user_id, USER_DIRECTORY_CHANGE_TTL)
+    return version
+
+
+class UserDirectory:
+    """
+    Display name of every user, held as parallel arrays sorted by id.
+    versions[i] is the directory version that last changed ids[i], deleted maps removed ids to theirs,
+    together they answer "what changed since version x" without keeping a log per process.
+    Processes only learn of each other's changes through the django cache, it has to be shared between them,
+    see acl.privilege.check_shared_cache.
+    """
+
+    def __init__(self):
+        self.ids = array("q")
+        self.names = []
+        self.versions = array("q")
+        self.deleted = {}
+        # version the arrays were loaded at and version of the last change applied
+        self.base = None
+        self.version = None
+        self.lock = threading.Lock()
+
+    def _load(self, version):
+        rows = list(User.objects.values_list("id", "first_name", "last_name").order_by("id"))
+        self.ids = array("q", (row[0] for row in rows))
+        self.names = [user_display_name(first_name, last_name) for _, first_name, last_name in rows]
+        self.versions = array("q", [version]) * len(self.ids)
+        self.deleted = {}
+        self.base = self.version = version
+
+    def _apply(self, changes, version):
+        """
+        Re-read the users of changes ({user id: version}), a user no longer found becomes a tombstone
+        """
+        rows = {user_id: user_display_name(first_name, last_name) for user_id, first_name, last_name in
+                User.objects.filter(id__in=list(changes)).values_list("id", "first_name", "last_name").order_by()}
+        for user_id, changed_at in changes.items():
+            index = bisect_left(self.ids, user_id)
+            found = index < len(self.ids) and self.ids[index] == user_id
+            if user_id in rows:
+                if found:
+                    self.names[index] = rows[user_id]
+                    self.versions[index] = changed_at
+                else:
+                    self.ids.insert(index, user_id)
+                    self.names.insert(index, rows[user_id])
+                    self.versions.insert(index, changed_at)
+                self.deleted.pop(user_id, None)
+            else:
+                if found:
+                    del self.ids[index], self.names[index], self.versions[index]
+                self.deleted[user_id] = changed_at
+        self.version = version
+
+    def sync(self):
+        """
+        Bring the arrays up to the shared directory version, costs one cache read when nothing changed
+        """
+        current = get_directory_version()
+        with self.lock:
+            if self.version == current:
+                return
+            if self.version is None or not 0 < current - self.version <= USER_DIRECTORY_MAX_REPLAY:
+                self._load(current)
+                return
+            versions = range(self.version + 1, current + 1)
+            published = cache.get_many([_change_key(version) for version in versions])
+            if len(published) < len(versions):
+                # a change expired or isn't written yet, the log can't be trusted
+                self._load(current)
+                return
+            changes = {}
+            for version in versions:
+                changes[published[_change_key(version)]] = version
+            self._apply(changes, current)
+
+    def names_for(self, user_ids=None):
+        """
+        {user id: display name} of user_ids, every user when None
+        """
+        self.sync()
+        with self.lock:
+            if user_ids is None:
+                return dict(zip(self.ids, self.names))
+            names = {}
+            for user_id in user_ids:
+                if not isinstance(user_id, int):
+                    continue
+                index = bisect_left(self.ids, user_id)
+                if index < len(self.ids) and self.ids[index] == user_id:
+                    names[user_id] = self.names[index]
+            return names
+
+    def changes_since(self, since=None):
+        """
+        Return (version, full, {user id: display name}, deleted ids).
+        With since at or after the version the arrays were loaded at only later changes are returned,
+        otherwise full is True and the whole directory is.
+        """
+        self.sync()
+        with self.lock:
+            if since is None or since < self.base or since > self.version:
+                return self.version, True, dict(zip(self.ids, self.names)), []
+            changed = {self.ids[index]: self.names[index] for index, version in enumerate(self.versions)
+                       if version > since}
+            deleted = [user_id for user_id, version in self.deleted.items() if version > since]
+            return self.version, False, changed, deleted
+
+    def reset(self):
+        """
+        Forget the arrays, the next read loads them again
+        """
+        with self.lock:
+            self.version = self.base = None
+
+
+user_directory = UserDirectory()
+
+
+def user_changed(user_id, update_fields=None):
+    """
+    Publish a saved or deleted user, again after commit when inside a transaction so no process keeps
+    a name it read before the write became visible
+    """
+    if update_fields is not None and not DIRECTORY_FIELDS.intersection(update_fields):
+        return
+    publish_user_change(user_id)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: publish_user_change(user_id))
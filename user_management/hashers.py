@@ -0,0 +1,10 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    pbkdf2_sha256 with PASSWORD_PBKDF2_ITERATIONS rounds. The algorithm name is unchanged, so existing hashes
+    verify as before and the ones of another cost are rehashed by check_password on the next login.
+    """
+    iterations = getattr(settings, "PASSWORD_PBKDF2_ITERATIONS", PBKDF2PasswordHasher.iterations)
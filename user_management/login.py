@@ -0,0 +1,142 @@
+import atexit
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from case_management.scheduler import start_periodic_thread
+from .models import CustomUser
+from .profile import invalidate_profiles
+
+logger = logging.getLogger(name="CMS")
+
+# the failure counters live in the django cache, with a per-process cache every worker counts on its own and the
+# limits are multiplied by the worker count, see acl.privilege.check_shared_cache
+# failed logins per email inside LOGIN_RATE_LIMIT_WINDOW before further attempts are refused unchecked
+LOGIN_RATE_LIMIT_EMAIL = getattr(settings, "LOGIN_RATE_LIMIT_EMAIL", 5)
+# failed logins per client address inside LOGIN_RATE_LIMIT_WINDOW, set it above what a shared proxy address sees
+LOGIN_RATE_LIMIT_IP = getattr(settings, "LOGIN_RATE_LIMIT_IP", 50)
+# seconds the failure counters live, counted from the first failure
+LOGIN_RATE_LIMIT_WINDOW = getattr(settings, "LOGIN_RATE_LIMIT_WINDOW", 300)
+# META key holding the client address set by a trusted proxy, e.g. "HTTP_X_FORWARDED_FOR"; None uses REMOTE_ADDR
+LOGIN_CLIENT_IP_HEADER = getattr(settings, "LOGIN_CLIENT_IP_HEADER", None)
+# queued last_login values written with one statement once this many are waiting
+LAST_LOGIN_FLUSH_SIZE = getattr(settings, "LAST_LOGIN_FLUSH_SIZE", 200)
+# seconds a queued last_login may wait for the batch to fill, checked on every login
+LAST_LOGIN_FLUSH_AGE = getattr(settings, "LAST_LOGIN_FLUSH_AGE", 30)
+# seconds between flushes of the in-process scheduler, 0 flushes only from logins and at exit
+LAST_LOGIN_FLUSH_INTERVAL = getattr(settings, "LAST_LOGIN_FLUSH_INTERVAL", 0)
+
+
+def client_ip(request):
+    if LOGIN_CLIENT_IP_HEADER and request.META.get(LOGIN_CLIENT_IP_HEADER):
+        return request.META[LOGIN_CLIENT_IP_HEADER].split(",")[0].strip()
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def _failure_keys(email, ip):
+    email = hashlib.sha256(str(email or "").strip().lower().encode("utf-8")).hexdigest()[:32]
+    return f"login_failures_email_{email}", f"login_failures_ip_{ip}"
+
+
+def login_blocked(email, ip):
+    """
+    True when email or ip used up its failed attempts, checked with one cache read before any hashing
+    """
+    email_key, ip_key = _failure_keys(email, ip)
+    counts = cache.get_many([email_key, ip_key])
+    return counts.get(email_key, 0) >= LOGIN_RATE_LIMIT_EMAIL or counts.get(ip_key, 0) >= LOGIN_RATE_LIMIT_IP
+
+
+def record_login_failure(email, ip):
+    for key in _failure_keys(email, ip):
+        # add only sets the window on the first failure, later ones don't extend it
+        cache.add(key, 0, LOGIN_RATE_LIMIT_WINDOW)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, LOGIN_RATE_LIMIT_WINDOW)
+
+
+def clear_login_failures(email):
+    cache.delete(_failure_keys(email, "")[0])
+
+
+_pending = {}
+_pending_since = None
+_pending_lock = threading.Lock()
+
+
+def flush_last_logins():
+    """
+    Write the queued last_login values with one UPDATE, returns how many users were updated
+    """
+    global _pending, _pending_since
+    with _pending_lock:
+        pending, _pending, _pending_since = _pending, {}, None
+    if not pending:
+        return 0
+    try:
+        CustomUser.objects.filter(id__in=list(pending)).update(last_login=Case(
+            *[When(id=user_id, then=Value(logged_in)) for user_id, logged_in in pending.items()],
+            output_field=DateTimeField()))
+    except Exception:
+        with _pending_lock:
+            # requeue unless the user logged in again meanwhile
+            for user_id, logged_in in pending.items():
+                _pending.setdefault(user_id, logged_in)
+            _pending_since = _pending_since or time.monotonic()
+        raise
+    # last_login isn't filtered on, the cached user counts stay valid
+    invalidate_profiles(pending)
+    return len(pending)
+
+
+def record_login(user_id, logged_in=None):
+    """
+    Queue the last_login of user_id instead of writing it on every login.
+    The queue is flushed when LAST_LOGIN_FLUSH_SIZE users are waiting or the oldest waited LAST_LOGIN_FLUSH_AGE
+    seconds; values still queued when the process is killed are lost.
+    """
+    global _pending_since
+    with _pending_lock:
+        _pending[user_id] = logged_in or timezone.now()
+        if _pending_since is None:
+            _pending_since = time.monotonic()
+        due = len(_pending) >= LAST_LOGIN_FLUSH_SIZE or time.monotonic() - _pending_since >= LAST_LOGIN_FLUSH_AGE
+    if due:
+        try:
+            flush_last_logins()
+        except Exception:
+            # the values were requeued, a failed write must not fail the login that triggered it
+            logger.exception("Flushing last_login failed")
+
+
+def _flush_at_exit():
+    try:
+        flush_last_logins()
+    except Exception:
+        logger.exception("Flushing last_login at exit failed")
+
+
+atexit.register(_flush_at_exit)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_last_login_scheduler(interval=LAST_LOGIN_FLUSH_INTERVAL):
+    """
+    Flush queued last_login values every interval seconds, every process flushes its own queue.
+    Returns the event that stops it.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = start_periodic_thread("last-login-flush", flush_last_logins, interval)
+        return _scheduler
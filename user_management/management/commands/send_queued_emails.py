@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from user_management.outbox import drain_outbox, outbox_metrics
+
+
+class Command(BaseCommand):
+    help = "Deliver due emails of the outbox, run it from cron to resume mail after a restart and to send retries"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None, help="Emails sent per SMTP connection")
+
+    def handle(self, *args, **options):
+        kwargs = {"batch_size": options["batch_size"]} if options["batch_size"] else {}
+        delivered = drain_outbox(**kwargs)
+        metrics = outbox_metrics()
+        self.stdout.write(f"Delivered {delivered} emails, {metrics['queue_depth']} queued, "
+                          f"{metrics['failed']} failed, {metrics['throughput_per_second']} emails/s")
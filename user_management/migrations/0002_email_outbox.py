@@ -0,0 +1,38 @@
+# Generated by Django 4.1.8 on 2026-10-18 17:36
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_management', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('to_email', models.EmailField(max_length=254)),
+                ('subject', models.CharField(max_length=255)),
+                ('html_content', models.TextField()),
+                ('status', models.CharField(choices=[('PENDING', 'PENDING'), ('SENDING', 'SENDING'), ('SENT', 'SENT'), ('FAILED', 'FAILED')], default='PENDING', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_at', models.DateTimeField(null=True)),
+                ('sent_at', models.DateTimeField(null=True)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'EMAIL_OUTBOX',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='emailoutbox',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='email_outbox_due_idx'),
+        ),
+    ]
@@ -3,6 +3,7 @@ import uuid
 from django.db import models
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
@@ -109,3 +110,34 @@ class TokenModule(models.Model):
     class Meta:
         ordering = ['-created_on']
         db_table = 'TOKEN_MANAGEMENT'
+
+
+EMAIL_STATUS = (
+    ("PENDING", "PENDING"),
+    ("SENDING", "SENDING"),
+    ("SENT", "SENT"),
+    ("FAILED", "FAILED"),
+)
+
+
+class EmailOutbox(models.Model):
+    """
+    Outgoing email, rows are delivered by the outbox workers and survive a restart
+    """
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    html_content = models.TextField()
+    status = models.CharField(max_length=20, choices=EMAIL_STATUS, default="PENDING")
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True)
+    sent_at = models.DateTimeField(null=True)
+    last_error = models.TextField(null=True, blank=True)
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    objects = models.Manager()
+
+    class Meta:
+        ordering = ['id']
+        db_table = 'EMAIL_OUTBOX'
+        indexes = [models.Index(fields=['status', 'next_attempt_at'], name='email_outbox_due_idx')]
@@ -0,0 +1,193 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from case_management.utility import build_html_email, render_email, render_emails
+from .models import EmailOutbox
+
+logger = logging.getLogger(name="CMS")
+
+# worker threads delivering the outbox, 0 delivers inline in the calling thread
+EMAIL_OUTBOX_WORKERS = getattr(settings, "EMAIL_OUTBOX_WORKERS", 2)
+# messages claimed and sent over one SMTP connection
+EMAIL_OUTBOX_BATCH_SIZE = getattr(settings, "EMAIL_OUTBOX_BATCH_SIZE", 50)
+EMAIL_OUTBOX_MAX_ATTEMPTS = getattr(settings, "EMAIL_OUTBOX_MAX_ATTEMPTS", 5)
+# seconds before the first retry, doubled on every further attempt
+EMAIL_OUTBOX_RETRY_DELAY = getattr(settings, "EMAIL_OUTBOX_RETRY_DELAY", 30)
+# a SENDING row older than this belongs to a worker that died, it is picked up again
+EMAIL_OUTBOX_LOCK_TIMEOUT = getattr(settings, "EMAIL_OUTBOX_LOCK_TIMEOUT", 600)
+
+_executor = None
+_lock = threading.Lock()
+_active_drains = 0
+_metrics = {"sent": 0, "failed": 0, "retried": 0, "batches": 0, "send_seconds": 0.0}
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=EMAIL_OUTBOX_WORKERS, thread_name_prefix="email-outbox")
+        return _executor
+
+
+def queue_email(to_email, subject, message):
+    """
+    Render the email and store it in the outbox, delivery starts once the current transaction commits.
+    The rendered body is cleared when the message is SENT.
+    """
+    email = EmailOutbox.objects.create(to_email=to_email, subject=subject,
+                                       html_content=render_email(subject, message))
+    transaction.on_commit(wake_outbox_worker)
+    return email
+
+
+def queue_emails(messages):
+    """
+    Store (to_email, subject, message) tuples with one bulk insert, e.g. notifications of a sweep
+    """
+    messages = list(messages)
+    if not messages:
+        return []
+    html = render_emails((subject, message) for _, subject, message in messages)
+    emails = EmailOutbox.objects.bulk_create(
+        [EmailOutbox(to_email=to_email, subject=subject, html_content=content)
+         for (to_email, subject, _), content in zip(messages, html)], batch_size=EMAIL_OUTBOX_BATCH_SIZE)
+    transaction.on_commit(wake_outbox_worker)
+    return emails
+
+
+def wake_outbox_worker():
+    """
+    Start a drain unless every worker is already draining, a running drain picks up new rows by itself
+    """
+    global _active_drains
+    if not EMAIL_OUTBOX_WORKERS:
+        drain_outbox()
+        return
+    with _lock:
+        if _active_drains >= EMAIL_OUTBOX_WORKERS:
+            return
+        _active_drains += 1
+    get_executor().submit(_drain_in_worker)
+
+
+def _drain_in_worker():
+    global _active_drains
+    close_old_connections()
+    try:
+        drain_outbox()
+    except Exception:
+        logger.exception("Email outbox drain failed")
+    finally:
+        with _lock:
+            _active_drains -= 1
+        connection.close()
+
+
+def claim_batch(batch_size=EMAIL_OUTBOX_BATCH_SIZE):
+    """
+    Mark up to batch_size due messages as SENDING and return them.
+    The conditional update makes sure two workers never claim the same row.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=EMAIL_OUTBOX_LOCK_TIMEOUT)
+    due = EmailOutbox.objects.filter(status="PENDING", next_attempt_at__lte=now) | \
+        EmailOutbox.objects.filter(status="SENDING", locked_at__lt=stale)
+    ids = list(due.order_by("id").values_list("id", flat=True)[:batch_size])
+    if not ids:
+        return []
+    token = timezone.now()
+    EmailOutbox.objects.filter(id__in=ids).filter(
+        status="PENDING", next_attempt_at__lte=now
+    ).update(status="SENDING", locked_at=token)
+    EmailOutbox.objects.filter(id__in=ids, status="SENDING", locked_at__lt=stale).update(locked_at=token)
+    return list(EmailOutbox.objects.filter(id__in=ids, status="SENDING", locked_at=token))
+
+
+def reschedule(email, error):
+    """
+    Record a failed attempt, the email is retried with exponential backoff until EMAIL_OUTBOX_MAX_ATTEMPTS.
+    Returns the new status.
+    """
+    email.attempts += 1
+    email.last_error = str(error)
+    email.locked_at = None
+    if email.attempts >= EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = "FAILED"
+    else:
+        email.status = "PENDING"
+        email.next_attempt_at = timezone.now() + timedelta(seconds=EMAIL_OUTBOX_RETRY_DELAY * 2 ** (email.attempts - 1))
+    email.save(update_fields=["attempts", "last_error", "locked_at", "status", "next_attempt_at"])
+    return email.status
+
+
+def send_batch(emails):
+    """
+    Deliver the claimed emails over one SMTP connection, failures are rescheduled with exponential backoff.
+    When the connection can't be opened every email of the batch is rescheduled.
+    """
+    started = time.monotonic()
+    statuses = []
+    mail_connection = get_connection()
+    try:
+        mail_connection.open()
+    except Exception as ee:
+        logger.warning("Email outbox could not connect, %s emails rescheduled: %s", len(emails), ee)
+        statuses = [reschedule(email, ee) for email in emails]
+    else:
+        try:
+            for email in emails:
+                try:
+                    build_html_email(email.to_email, email.subject, email.html_content,
+                                     connection=mail_connection).send()
+                except Exception as ee:
+                    statuses.append(reschedule(email, ee))
+                else:
+                    statuses.append("SENT")
+                    # the body may carry an OTP or a password, it is not kept once delivered
+                    EmailOutbox.objects.filter(id=email.id).update(status="SENT", sent_at=timezone.now(),
+                                                                   locked_at=None, attempts=email.attempts + 1,
+                                                                   html_content="")
+        finally:
+            mail_connection.close()
+    sent = statuses.count("SENT")
+    with _lock:
+        _metrics["sent"] += sent
+        _metrics["failed"] += statuses.count("FAILED")
+        _metrics["retried"] += statuses.count("PENDING")
+        _metrics["batches"] += 1
+        _metrics["send_seconds"] += time.monotonic() - started
+    return sent
+
+
+def drain_outbox(batch_size=EMAIL_OUTBOX_BATCH_SIZE):
+    """
+    Send due emails batch by batch until none is left, returns the number of delivered emails
+    """
+    delivered = 0
+    while True:
+        emails = claim_batch(batch_size)
+        if not emails:
+            return delivered
+        delivered += send_batch(emails)
+
+
+def outbox_metrics():
+    """
+    Queue depth from the table plus the delivery counters of this process
+    """
+    with _lock:
+        metrics = dict(_metrics)
+        metrics["active_workers"] = _active_drains
+    metrics["queue_depth"] = EmailOutbox.objects.filter(status__in=("PENDING", "SENDING")).count()
+    metrics["throughput_per_second"] = round(metrics["sent"] / metrics["send_seconds"], 2) \
+        if metrics["send_seconds"] else 0.0
+    return metrics
@@ -0,0 +1,43 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+from acl.privilege import get_privilege_version
+
+# seconds a profile snapshot is kept, user saves and role or permission changes replace it before that
+PROFILE_CACHE_TIMEOUT = getattr(settings, "PROFILE_CACHE_TIMEOUT", 60 * 60 * 24)
+
+
+def _profile_key(user_id, version=None):
+    # the privilege version moves with every Role, UserRole and RolePermission change
+    return f"user_profile_{version or get_privilege_version()}_{user_id}"
+
+
+def profile_etag(data):
+    payload = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def get_profile_snapshot(user_id, build):
+    """
+    Return (etag, data) of the profile of user_id, build() serializes it when no current snapshot is cached
+    """
+    key = _profile_key(user_id)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        data = json.loads(json.dumps(build(), cls=DjangoJSONEncoder))
+        snapshot = (profile_etag(data), data)
+        cache.set(key, snapshot, PROFILE_CACHE_TIMEOUT)
+    return snapshot
+
+
+def invalidate_profile(user_id):
+    cache.delete(_profile_key(user_id))
+
+
+def invalidate_profiles(user_ids):
+    version = get_privilege_version()
+    cache.delete_many([_profile_key(user_id, version) for user_id in user_ids])
@@ -1,21 +1,25 @@
 from django.utils import timezone
 from rest_framework import serializers
 import random
-from threading import Thread
 from django.contrib.auth.password_validation import validate_password
-from django.contrib.auth.hashers import check_password
 from django.core.cache import cache
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.hashers import make_password
-from case_management.utility import new_user_registration_msg, get_random_string, email_send, \
+from case_management.utility import new_user_registration_msg, get_random_string, \
     account_activate_new_password_msg
+from acl.privilege import get_user_privileges
+from case_management.custom_authentication import UserClaimsRefreshToken
 from acl.serializers import RoleShortInfoSerializer
 # from case_management.graph_api import send_email_graph_api
 from .models import CustomUser, TokenModule
-from acl.models import UserRole, Role, RolePermission
+from .login import record_login
+from .outbox import queue_email
+from acl.models import UserRole
 from datetime import datetime, timedelta
 from django.contrib.auth import authenticate, get_user_model
 from django.core.validators import RegexValidator
+from django.db.models import Prefetch
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
 
 class UserSerializers(serializers.ModelSerializer):
@@ -36,12 +40,13 @@ class UserSerializers(serializers.ModelSerializer):
 
     status = serializers.IntegerField(required=False, allow_null=True)
     export = serializers.BooleanField(required=False, allow_null=True, default=False)
+    async_export = serializers.BooleanField(required=False, allow_null=True, default=False)
 
     class Meta:
         model = CustomUser
         fields = ('email', 'first_name', 'last_name', 'organization_name',
                   'phone_number', 'order_by', 'order_type', 'page', 'page_size', 'status', "role",
-                  "export")
+                  "export", "async_export")
 
 
 class UserReadSerializer(serializers.ModelSerializer):
@@ -56,44 +61,40 @@ class UserReadSerializer(serializers.ModelSerializer):
                   'is_delete', 'phone_number', 'modified_on', "last_login", "organisation_name", "timezone",
                   "country", "created_by", "modified_by", "role_data")
 
+    @staticmethod
+    def prefetch_roles(queryset):
+        """
+        Load the roles of every user of queryset with one query instead of two per user
+        """
+        return queryset.prefetch_related(Prefetch("role_user", queryset=UserRole.objects.select_related("role")))
+
     def get_role_data(self, obj):
         """
         This method is used for getting role data as per the user
         """
-        role = UserRole.objects.filter(user=obj).values_list('role', flat=True)
-        if not role:
+        user_roles = getattr(obj, "_prefetched_objects_cache", {}).get("role_user")
+        if user_roles is None:
+            user_roles = obj.role_user.select_related("role")
+        roles = {user_role.role_id: user_role.role for user_role in user_roles}
+        if not roles:
             return []
-        return RoleShortInfoSerializer(Role.objects.filter(id__in=role), read_only=True, context=self.context,
-                                       many=True).data
+        # same order as the Role default ordering
+        roles = sorted(roles.values(), key=lambda role: role.created_on, reverse=True)
+        return RoleShortInfoSerializer(roles, read_only=True, context=self.context, many=True).data
 
 
-class UserProfileReadSerializer(serializers.ModelSerializer):
+class UserProfileReadSerializer(UserReadSerializer):
     """
     This serializer is used on the time of responding data for user
     """
-    role_data = serializers.SerializerMethodField(source='get_role_data', read_only=True)
     privileges = serializers.SerializerMethodField(source='get_privileges', read_only=True)
 
-    class Meta:
-        model = CustomUser
-        fields = ("id", "email", 'first_name', 'last_name', 'created_on', 'last_login', 'is_active',
-                  'is_delete', 'phone_number', 'modified_on', "last_login", "organisation_name", "timezone",
-                  "country", "created_by", "modified_by", "role_data", "privileges")
-
-    def get_role_data(self, obj):
-        """
-        This method is used for getting role data as per the user
-        """
-        role = UserRole.objects.filter(user=obj).values_list('role', flat=True)
-        if not role:
-            return []
-        return RoleShortInfoSerializer(Role.objects.filter(id__in=role), read_only=True, context=self.context,
-                                       many=True).data
+    class Meta(UserReadSerializer.Meta):
+        fields = UserReadSerializer.Meta.fields + ("privileges",)
 
     def get_privileges(self, obj):
-        roles = UserRole.objects.filter(user=obj).values_list("role", flat=True)
-        privilege = RolePermission.objects.filter(role__in=roles).values_list("privilege__privilege_name", flat=True)
-        return privilege
+        # the compiled set CozentusPermission checks against
+        return sorted(get_user_privileges(obj.id))
 
 
 class UserShortInfoSerializer(serializers.ModelSerializer):
@@ -155,7 +156,7 @@ class UserSerializer(serializers.ModelSerializer):
             print(random_password)
             messages = new_user_registration_msg(user=instance)
 
-            Thread(target=email_send, args=(instance.email, "New Registration", messages), ).start()
+            queue_email(instance.email, "New Registration", messages)
             # messages = new_user_registration_msg(user=instance)
             print("Email sent successfully..")
             # Thread(target=send_email_graph_api,
@@ -215,7 +216,7 @@ class UserForgotPasswordSerializer(serializers.ModelSerializer):
         cache.set(instance.email, random_key, 60 * 15)
         try:
             messages = f"Your OTP for reset password : {random_key}"
-            Thread(target=email_send, args=(instance.email, "Forget Password Request", messages), ).start()
+            queue_email(instance.email, "Forget Password Request", messages)
 
             print("Sent email for reset password..")
 
@@ -249,7 +250,7 @@ class UserStatusSerializer(serializers.ModelSerializer):
             instance.save()
             # sending mail with active status and new_password is added
             messages = account_activate_new_password_msg(user=instance, new_password=random_password)
-            Thread(target=email_send, args=(instance.email, "New Registration", messages), ).start()
+            queue_email(instance.email, "New Registration", messages)
 
         return instance
 
@@ -330,7 +331,8 @@ class UserLoginSerializer(serializers.Serializer):
                 user = CustomUser.objects.get(email=email)
                 if not user.is_active:
                     raise serializers.ValidationError("Inactive user")
-                if check_password(password, user.password):
+                # rewrites the hash when PASSWORD_PBKDF2_ITERATIONS or the preferred hasher changed
+                if user.check_password(password):
                     return user
                 else:
                     raise serializers.ValidationError("Incorrect password.")
@@ -340,6 +342,15 @@ class UserLoginSerializer(serializers.Serializer):
             raise serializers.ValidationError("Both email and password are required.")
 
 
+class LoginTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = UserClaimsRefreshToken
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        record_login(self.user.pk)
+        return data
+
+
 #
 # class UserLoginSerializer(serializers.Serializer):
 #     email = serializers.EmailField()
@@ -0,0 +1,17 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from case_management.custom_authentication import USER_CLAIM_FIELDS, bump_user_version
+from .directory import user_changed as directory_user_changed
+from .models import CustomUser
+from .profile import invalidate_profile
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def user_changed(sender, instance, **kwargs):
+    invalidate_profile(instance.pk)
+    update_fields = kwargs.get("update_fields")
+    directory_user_changed(instance.pk, update_fields)
+    if update_fields is None or set(update_fields).intersection(USER_CLAIM_FIELDS):
+        bump_user_version(instance.pk)
@@ -0,0 +1,75 @@
+from django.contrib.auth import get_user_model
+from django.db import models
+from rest_framework import serializers
+
+User = get_user_model()
+
+
+def user_display_name(first_name, last_name):
+    return f"{first_name} {last_name or ''}".strip()
+
+
+def resolve_user_names(user_ids=None):
+    """
+    Return {user id: "first last"} for the given ids with a single values() query.
+    Passing None resolves every user.
+    """
+    queryset = User.objects.values_list('id', 'first_name', 'last_name').order_by()
+    if user_ids is not None:
+        user_ids = {user_id for user_id in user_ids if isinstance(user_id, int)}
+        if not user_ids:
+            return {}
+        queryset = queryset.filter(id__in=user_ids)
+    return {user_id: user_display_name(first_name, last_name) for user_id, first_name, last_name in queryset}
+
+
+class UserNameListSerializer(serializers.ListSerializer):
+    """
+    Collects every user id referenced on the page and resolves the display names in one query
+    before the rows are serialized.
+    """
+
+    def to_representation(self, data):
+        rows = list(data.all() if isinstance(data, models.Manager) else data)
+        user_ids = set()
+        for row in rows:
+            for field in self.child.user_name_fields:
+                user_ids.add(self.child.get_user_id(row, field))
+        self.child.user_names = resolve_user_names(user_ids)
+        return super().to_representation(rows)
+
+
+class UserNameSerializerMixin:
+    """
+    Read serializer mixin for created_by / updated_by style columns, pair it with
+    `list_serializer_class = UserNameListSerializer` in Meta.
+    """
+    user_name_fields = ('created_by', 'updated_by')
+    user_names = None
+
+    @staticmethod
+    def get_user_id(obj, field):
+        # ForeignKey columns expose the raw id on the attname, integer columns hold it directly
+        value = getattr(obj, f"{field}_id", None)
+        if value is None:
+            value = getattr(obj, field, None)
+        return value if isinstance(value, int) else getattr(value, 'pk', value)
+
+    def get_user_name(self, obj, field):
+        user_id = self.get_user_id(obj, field)
+        if user_id is None:
+            return None
+        if self.user_names is None:
+            # single object serialization, resolve every user column of the row at once
+            self.user_names = resolve_user_names(
+                {self.get_user_id(obj, name) for name in self.user_name_fields})
+        return self.user_names.get(user_id)
+
+    def get_created_by(self, obj):
+        return self.get_user_name(obj, 'created_by')
+
+    def get_updated_by(self, obj):
+        return self.get_user_name(obj, 'updated_by')
+
+    def get_modified_by(self, obj):
+        return self.get_user_name(obj, 'modified_by')
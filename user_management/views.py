@@ -1,15 +1,18 @@
 from django.core.cache import cache
-from django.core.paginator import Paginator
 from rest_framework.generics import (RetrieveAPIView, CreateAPIView, get_object_or_404, RetrieveUpdateDestroyAPIView,
                                      UpdateAPIView)
 from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.utils.http import parse_etags, quote_etag
+from django.views.decorators.gzip import gzip_page
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from case_management.utility import get_random_string
-from acl.export_excel import export_query_to_excel
+from acl.export_jobs import export_response
+from case_management.pagination import CountCachingPaginator, approximate_requested
 from case_management.utility import generate_token
 from .permissions import *
 from acl.privilege import CozentusPermission
@@ -18,10 +21,16 @@ from .serializers import (UserSerializers, UserReadSerializer, UserShortInfoSeri
                           AdminUserRegisterSerializer, UserEditSerializer, UserPasswordSerializer,
                           UserForgotPasswordSerializer, OtpVerifySerializer, UserStatusSerializer,
                           UserPasswordResetSerializer, UserProfileReadSerializer, UserLoginSerializer,
-                          TokenSerializer, ResetTokenSerializer, )
+                          TokenSerializer, ResetTokenSerializer, LoginTokenObtainPairSerializer, )
 from .models import CustomUser, TokenModule
+from .directory import user_directory
+from .login import (LOGIN_RATE_LIMIT_WINDOW, clear_login_failures, client_ip, login_blocked, record_login,
+                    record_login_failure)
+from .profile import get_profile_snapshot
 from datetime import datetime, timedelta
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from case_management.custom_authentication import UserClaimsRefreshToken
+from rest_framework_simplejwt.views import TokenObtainPairView
 from drf_spectacular.utils import extend_schema
 
 
@@ -80,11 +89,14 @@ class UserFilterApi(APIView):
                 query_filter = f"-{query_filter}"
             if query_filter:
                 queryset = queryset.order_by(query_filter)
+            # one role query per page, or per chunk of an export, instead of two per user
+            queryset = self.serializer_class.prefetch_roles(queryset)
             if data.get("export"):
-                serializer = self.serializer_class(queryset, many=True, context=self.request)
-                return export_query_to_excel(data=serializer.data, module_name="USER_MANAGEMENT")
+                return export_response(request, queryset, self.serializer_class, module_name="USER_MANAGEMENT",
+                                       serializer_kwargs={"context": self.request})
             # Create Paginator object with page_size objects per page
-            paginator = Paginator(queryset, page_size)
+            paginator = CountCachingPaginator(queryset, page_size,
+                                              approximate=approximate_requested(request.data))
             number_pages = paginator.num_pages
             if page > number_pages and page > 1:
                 return Response({"message": "Page not found"}, status=status.HTTP_400_BAD_REQUEST)
@@ -93,7 +105,7 @@ class UserFilterApi(APIView):
             serializer = self.serializer_class(page_obj, many=True, context=self.request)
             data = serializer.data
 
-            return Response({"count": queryset.count(), "results": data}, status=status.HTTP_200_OK)
+            return Response({"count": paginator.count, "results": data}, status=status.HTTP_200_OK)
         except Exception as ee:
             return Response(str(ee), status=status.HTTP_400_BAD_REQUEST)
 
@@ -133,6 +145,16 @@ class UserProfileApi(RetrieveAPIView):
     serializer_class = UserProfileReadSerializer
     queryset = CustomUser.objects.all()
 
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Serve the cached profile snapshot, a matching If-None-Match gets 304 without touching the database
+        """
+        etag, data = get_profile_snapshot(kwargs["pk"], lambda: self.get_serializer(self.get_object()).data)
+        etag = quote_etag(etag)
+        if etag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", "")):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        return Response(data, headers={"ETag": etag})
+
     # def get_object(self):
     #     queryset = self.get_queryset()
     #     obj = get_object_or_404(queryset, email=self.request.user.email)
@@ -299,13 +321,25 @@ class UserPasswordResetApi(CreateAPIView):
     queryset = CustomUser.objects.all()
 
 
+@method_decorator(gzip_page, name="dispatch")
 class UserJsonDataAPI(APIView):
+    """
+    {user id: display name} of every user. Pass the version of the last response as since to receive only
+    the users changed after it and the ids deleted since, full is true when the whole directory is sent.
+    """
     permission_classes = (CozentusPermission,)
 
     def get(self, request):
-        queryset = CustomUser.objects.values('id', 'first_name', 'last_name')
-        user_dict = {user['id']: f"{user['first_name']} {user['last_name']}".strip() for user in queryset}
-        return Response({"count": len(user_dict), "results": user_dict}, status=status.HTTP_200_OK)
+        since = request.query_params.get("since")
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                return Response({"message": "since should be an integer version"},
+                                status=status.HTTP_400_BAD_REQUEST)
+        version, full, user_dict, deleted = user_directory.changes_since(since)
+        return Response({"count": len(user_dict), "results": user_dict, "version": version, "full": full,
+                         "deleted": deleted}, status=status.HTTP_200_OK)
 
 
 class UserLoginApi(APIView):
@@ -318,13 +352,18 @@ class UserLoginApi(APIView):
     def post(self, request):
         # Assuming you have received the request data and need to validate it and generate tokens
         # print(request.data)
+        email, ip = request.data.get("email"), client_ip(request)
+        if login_blocked(email, ip):
+            return login_blocked_response()
         serializer = UserLoginSerializer(data=request.data)
         # print("Check serializer validity : ---", serializer.is_valid())
         if serializer.is_valid():
             # print("data is valid till here..")
             try:
                 user = serializer.validated_data
-                refresh = RefreshToken.for_user(user)
+                refresh = UserClaimsRefreshToken.for_user(user)
+                clear_login_failures(email)
+                record_login(user.pk)
                 # print("working till here 11")
 
                 # token = generate_token(user_email=email)
@@ -335,9 +374,34 @@ class UserLoginApi(APIView):
             except Exception as ve:
                 print(ve)
                 return JsonResponse({"message": f"Login failed"}, status=status.HTTP_400_BAD_REQUEST)
+        record_login_failure(email, ip)
         return JsonResponse({"message": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
 
+class LoginTokenObtainPairView(TokenObtainPairView):
+    """
+    TokenObtainPairView behind the login rate limiter, last_login is queued instead of written
+    """
+    serializer_class = LoginTokenObtainPairSerializer
+
+    def post(self, request, *args, **kwargs):
+        email, ip = request.data.get("email"), client_ip(request)
+        if login_blocked(email, ip):
+            return login_blocked_response()
+        try:
+            response = super().post(request, *args, **kwargs)
+        except (AuthenticationFailed, ValidationError):
+            record_login_failure(email, ip)
+            raise
+        clear_login_failures(email)
+        return response
+
+
+def login_blocked_response():
+    return JsonResponse({"message": "Too many failed login attempts, try again later"},
+                        status=status.HTTP_429_TOO_MANY_REQUESTS, headers={"Retry-After": str(LOGIN_RATE_LIMIT_WINDOW)})
+
+
 class GenerateTokenView(APIView):
     permission_classes = (CozentusPermission,)
     serializer_class = TokenSerializer